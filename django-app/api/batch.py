@@ -0,0 +1,138 @@
+"""
+Dispatching of the sub-requests of a /batch/ request.
+
+Every entry names an endpoint by its URL name (see the endpoint index) and
+its query parameters. The sub-request is a GET request built from the batch
+request, handed straight to the view of the endpoint; the data of the DRF
+response is used as is, without rendering it, and the whole batch is rendered
+once.
+
+Sub-requests run one after another on the connection of the request thread,
+or, when "concurrent" is true, with api.execution.run_concurrently(). An
+exception raised by a view is logged and reported as the 500 status of its
+entry; the other entries are unaffected.
+"""
+
+import logging
+from collections import OrderedDict
+from functools import partial
+from django.conf import settings
+from django.http import HttpRequest, QueryDict
+from django.utils.http import urlencode
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from .execution import run_concurrently
+
+try:
+    from django.urls import NoReverseMatch, resolve
+except ImportError:
+    from django.core.urlresolvers import NoReverseMatch, resolve
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_REQUESTS = 50
+
+# Endpoints that can't be part of a batch
+EXCLUDED_ENDPOINTS = ('batch', 'metrics')
+
+# Headers of the batch request that don't apply to its sub-requests
+EXCLUDED_HEADERS = (
+    'CONTENT_LENGTH',
+    'CONTENT_TYPE',
+    'HTTP_ACCEPT',
+    'HTTP_IF_MODIFIED_SINCE',
+    'HTTP_IF_NONE_MATCH',
+)
+
+
+class BatchError(ValueError):
+    """
+    Raised for a batch entry that can't be dispatched.
+    """
+    pass
+
+
+def max_requests():
+    return getattr(settings, 'BATCH_MAX_REQUESTS', DEFAULT_MAX_REQUESTS)
+
+
+def parse_entries(entries):
+    """
+    Return the list of (<id>, <endpoint>, <params>) tuples of the entries of a
+    batch, a list of {"id", "endpoint", "params"} dictionaries. The id
+    defaults to the position of the entry in the list.
+    """
+    if not isinstance(entries, list) or not entries:
+        raise BatchError('"requests" must be a non-empty list')
+    if len(entries) > max_requests():
+        raise BatchError('A batch may hold at most {} requests'.format(max_requests()))
+    parsed = []
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict) or not isinstance(entry.get('endpoint'), str):
+            raise BatchError('Request {} must have an "endpoint" name'.format(index))
+        params = entry.get('params') or {}
+        if not isinstance(params, dict):
+            raise BatchError('The "params" of request {} must be an object'.format(index))
+        parsed.append((str(entry.get('id', index)), entry['endpoint'], params))
+    ids = [entry_id for entry_id, endpoint, params in parsed]
+    if len(set(ids)) != len(ids):
+        raise BatchError('Request ids must be unique')
+    return parsed
+
+
+def sub_request(request, endpoint, params):
+    """
+    Return the (<view>, <HttpRequest>) pair of a GET request of endpoint with
+    the query params, carrying the headers of the batch request.
+    """
+    if endpoint in EXCLUDED_ENDPOINTS:
+        raise BatchError('Endpoint "{}" can\'t be batched'.format(endpoint))
+    try:
+        path = reverse(endpoint)
+    except NoReverseMatch:
+        raise BatchError('Unknown endpoint "{}"'.format(endpoint))
+    query = urlencode(params, doseq=True)
+    sub = HttpRequest()
+    sub.method = 'GET'
+    sub.path = sub.path_info = path
+    sub.META = dict(
+        (key, value) for key, value in request.META.items() if key not in EXCLUDED_HEADERS
+    )
+    sub.META.update({
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'HTTP_ACCEPT': 'application/json',
+    })
+    sub.GET = QueryDict(query)
+    match = resolve(path)
+    sub.resolver_match = match
+    return (match.func, sub)
+
+
+def dispatch(view, sub):
+    """
+    Return the {"status", "data"} result of the sub-request.
+    """
+    try:
+        response = view(sub)
+    except Exception as e:
+        logger.exception('Batch request of %s failed', sub.get_full_path())
+        return {'status': 500, 'data': {
+            'error': 'Internal error: {}'.format(type(e).__name__), 'data': []}}
+    if not isinstance(response, Response) or response.streaming:
+        return {'status': 400, 'data': {'error': 'Endpoint response can\'t be batched', 'data': []}}
+    return {'status': response.status_code, 'data': response.data}
+
+
+def run_batch(request, entries, concurrent=False):
+    """
+    Dispatch the entries of a batch (see parse_entries()) and return the
+    {<id>: <result>} OrderedDict of their results.
+    """
+    subs = [(entry_id, sub_request(request, endpoint, params))
+            for entry_id, endpoint, params in parse_entries(entries)]
+    if not concurrent:
+        return OrderedDict((entry_id, dispatch(view, sub)) for entry_id, (view, sub) in subs)
+    results = run_concurrently(partial(dispatch, view, sub) for entry_id, (view, sub) in subs)
+    return OrderedDict(zip([entry_id for entry_id, sub in subs], results))
@@ -0,0 +1,339 @@
+"""
+Synthetic data generation and endpoint benchmarking for manage.py bench.
+
+The generated data has the shape of the real dumps: every Oregon county plus
+Oregon (statewide), a list of commodities and a range of years. The scale
+factor multiplies the number of commodities, and so the number of rows of
+every fact table.
+"""
+
+import json
+import random
+import time
+import tracemalloc
+from collections import OrderedDict
+from decimal import Decimal
+from itertools import islice
+import numpy as np
+from django.apps import apps
+
+from django.db import connection, models, transaction
+from django.test import Client
+from rest_framework.reverse import reverse
+from .cache import result_cache
+from .derived import rebuild_exports_rollup, rebuild_production_revenue
+from .models import (
+    CropDiversity,
+    ExportsHistoricalCleaned,
+    Metadata,
+    NassAnimalsSales,
+    NassCommodityArea,
+    NassCommodityFarms,
+    OainHarvestAcres,
+    RawOainData,
+    RegionLookup,
+    SubsidyDollars,
+    SubsidyRecipients,
+)
+from .reference import OREGON_FIPS, reload_reference_data
+from .versions import bump_versions
+
+COUNTIES = (
+    'Baker', 'Benton', 'Clackamas', 'Clatsop', 'Columbia', 'Coos', 'Crook',
+    'Curry', 'Deschutes', 'Douglas', 'Gilliam', 'Grant', 'Harney',
+    'Hood River', 'Jackson', 'Jefferson', 'Josephine', 'Klamath', 'Lake',
+    'Lane', 'Lincoln', 'Linn', 'Malheur', 'Marion', 'Morrow', 'Multnomah',
+    'Polk', 'Sherman', 'Tillamook', 'Umatilla', 'Union', 'Wallowa', 'Wasco',
+    'Washington', 'Wheeler', 'Yamhill',
+)
+# Number of commodities, years and export commodities at scale factor 1
+BASE_COMMODITIES = 50
+BASE_EXPORT_COMMODITIES = 100
+YEARS = tuple(range(2007, 2017))
+EXPORT_YEARS = tuple(range(1997, 2017))
+BULK_SIZE = 5000
+
+# (model, value field, random value) of the county fact tables
+COUNTY_FACTS = (
+    (NassCommodityArea, 'acres', lambda r: round(r.uniform(0, 50000), 2)),
+    (NassCommodityFarms, 'farms', lambda r: r.randint(0, 500)),
+    (OainHarvestAcres, 'harvested_acres', lambda r: r.randint(0, 50000)),
+    (NassAnimalsSales, 'animals', lambda r: round(r.uniform(0, 10000), 2)),
+    (SubsidyDollars, 'subsidy_dollars', lambda r: r.randint(0, 2000000)),
+    (SubsidyRecipients, 'subsidy_recipients', lambda r: r.randint(0, 300)),
+)
+
+
+def unconstrained_decimal(field):
+    """
+    Return whether field is a numeric column without precision: inspectdb
+    makes it a DecimalField with 65535 digits, which Django can neither
+    create (PostgreSQL's maximum precision is 1000) nor save.
+    """
+    return isinstance(field, models.DecimalField) and field.max_digits > 1000
+
+
+def create_table(editor, model):
+    """
+    Create the table of model, with plain numeric columns for its
+    unconstrained decimal fields.
+    """
+    if not any(unconstrained_decimal(field) for field in model._meta.local_fields):
+        editor.create_model(model)
+        return
+    columns = []
+    params = []
+    for field in model._meta.local_fields:
+        if unconstrained_decimal(field):
+            definition = 'numeric NULL'
+        else:
+            definition, field_params = editor.column_sql(model, field)
+            params.extend(field_params or [])
+        columns.append('{} {}'.format(editor.quote_name(field.column), definition))
+    editor.execute('CREATE TABLE {} ({})'.format(
+        editor.quote_name(model._meta.db_table), ', '.join(columns)), params or None)
+
+
+def ensure_tables():
+    """
+    Create the tables of unmanaged api models that don't exist in the
+    database, e.g. in an empty benchmark database.
+    """
+    existing = set(connection.introspection.table_names())
+    with connection.schema_editor() as editor:
+        for model in apps.get_app_config('api').get_models():
+            if model._meta.db_table not in existing:
+                create_table(editor, model)
+
+
+def batches(rows):
+    """
+    Yield the lists of up to BULK_SIZE items of the iterable rows.
+    """
+    rows = iter(rows)
+    batch = list(islice(rows, BULK_SIZE))
+    while batch:
+        yield batch
+        batch = list(islice(rows, BULK_SIZE))
+
+
+def bulk_insert(model, rows):
+    """
+    Replace the contents of the table of model with the instances of the
+    iterable rows, inserted BULK_SIZE at a time. Return the number of rows.
+    """
+    model.objects.all().delete()
+    count = 0
+    for batch in batches(rows):
+        model.objects.bulk_create(batch)
+        count += len(batch)
+    return count
+
+
+def sql_insert(model, fields, rows):
+    """
+    Replace the contents of the table of model with the iterable rows,
+    tuples of the values of fields, inserted BULK_SIZE at a time without the
+    ORM (see unconstrained_decimal()). Return the number of rows.
+    """
+    model.objects.all().delete()
+    quote_name = connection.ops.quote_name
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        quote_name(model._meta.db_table),
+        ', '.join(quote_name(model._meta.get_field(field).column) for field in fields),
+        ', '.join(['%s'] * len(fields)))
+    count = 0
+    with connection.cursor() as cursor:
+        for batch in batches(rows):
+            cursor.executemany(sql, batch)
+            count += len(batch)
+    return count
+
+
+def generate(scale, seed=0):
+    """
+    Replace the data of every api table with synthetic data at the scale
+    factor. Return an {table: rows} dictionary.
+    """
+    rand = random.Random(seed)
+    counties = OrderedDict((name, 41001 + 2 * index) for index, name in enumerate(COUNTIES))
+    all_fips = [OREGON_FIPS] + list(counties.values())
+    commodities = ['Commodity {:04d}'.format(i) for i in range(int(BASE_COMMODITIES * scale))]
+    export_commodities = ['Export {:04d}'.format(i)
+                          for i in range(int(BASE_EXPORT_COMMODITIES * scale))]
+    rows = OrderedDict()
+    ensure_tables()
+    with transaction.atomic():
+        rows['metadata'] = bulk_insert(Metadata, [
+            Metadata(name=model._meta.db_table, table_name=model._meta.db_table, unit=unit)
+            for model, unit in ((SubsidyDollars, 'dollars'), (SubsidyRecipients, 'recipients'),
+                                (NassCommodityArea, 'acres'), (CropDiversity, 'score'))
+        ])
+        rows['region_lookup'] = bulk_insert(RegionLookup, [
+            RegionLookup(state='OR', region=name, fips=fips)
+            for name, fips in [('Oregon', OREGON_FIPS)] + list(counties.items())
+        ])
+        rows['crop_diversity'] = bulk_insert(CropDiversity, [
+            CropDiversity(county_name=name.upper(), diversity_score=str(round(rand.uniform(1, 5), 2)))
+            for name in counties
+        ])
+        for model, field, value in COUNTY_FACTS:
+            rows[model._meta.db_table] = bulk_insert(model, (
+                model(commodity=commodity, year=year, fips=fips, **{field: value(rand)})
+                for year in YEARS for fips in all_fips for commodity in commodities
+            ))
+        rows['exports_historical_cleaned'] = sql_insert(ExportsHistoricalCleaned, (
+            'commodity', 'time_year', 'time_month', 'value_num', 'hs_code',
+            'hs_cat_lvl_1', 'hs_cat_lvl_2'), (
+            (commodity, year, month, Decimal('{:.2f}'.format(rand.uniform(0, 1e6))),
+             str(index), 'Category {}'.format(index % 10), 'Subcategory {}'.format(index % 40))
+            for index, commodity in enumerate(export_commodities)
+            for year in EXPORT_YEARS for month in range(1, 13)
+        ))
+        rows['raw_oain_data'] = bulk_insert(RawOainData, (
+            RawOainData(
+                commodity='CROPS - ' + commodity.upper(), county=county, year=year,
+                production_unit=rand.randint(1, 1000), price_unit_of_measure='$/TON',
+                value_produced='${:,}'.format(rand.randint(0, 100000)),
+                value_sales='${:,}'.format(rand.randint(0, 100000)))
+            for year in YEARS for county in counties for commodity in commodities
+        ))
+    rows['oain_production_revenue'] = rebuild_production_revenue()
+    rows['exports_rollup'] = rebuild_exports_rollup()
+    bump_versions([model._meta.db_table for model in apps.get_app_config('api').get_models()])
+    reload_reference_data()
+    return rows
+
+
+# Body of the benchmarked /batch/ request: the requests of the county page
+BATCH = {'requests': [
+    {'id': 'stats', 'endpoint': 'county_stats', 'params': {'county': COUNTIES[21]}},
+    {'id': 'subsidies', 'endpoint': 'subsidy_dollars_table', 'params': {'county': COUNTIES[21]}},
+    {'id': 'timeline', 'endpoint': 'subsidy_dollars_timeline', 'params': {'county': COUNTIES[21]}},
+    {'id': 'area', 'endpoint': 'nass_commodity_area_table', 'params': {'county': COUNTIES[21]}},
+    {'id': 'diversity', 'endpoint': 'crop_diversity_data'},
+    {'id': 'top_counties', 'endpoint': 'subsidy_dollars_top_counties'},
+    {'id': 'top_commodities', 'endpoint': 'subsidy_dollars_top_commodities'},
+]}
+
+
+def bench_requests():
+    """
+    Return the list of (<endpoint name>, <URL>, <JSON body>) requests of the
+    benchmark, covering every endpoint with representative query parameters.
+    Requests without a body are GET requests, the others POST requests.
+    """
+    county = COUNTIES[21]
+    commodity = 'Commodity 0001'
+    requests = [
+        ('endpoint_index', ''),
+        ('metadata', ''),
+        ('county_stats', ''),
+        ('nass_commodity_area_list', ''),
+        ('nass_commodity_area_list', '?year=2016&county={}'.format(county)),
+        ('nass_commodity_area_list', '?page_size=100&count=estimate'),
+        ('nass_commodity_area_list', '?stream=json'),
+        ('nass_commodity_area_table', ''),
+        ('nass_commodity_area_table', '?county={}'.format(county)),
+        ('nass_commodity_farms_list', '?year=2016'),
+        ('oain_harvest_acres_list', '?year=2016'),
+        ('nass_animals_sales', '?year=2016'),
+        ('subsidy_dollars_data', '?county={}'.format(county)),
+        ('subsidy_dollars_table', ''),
+        ('subsidy_dollars_table', '?county={}'.format(county)),
+        ('subsidy_dollars_timeline', ''),
+        ('subsidy_dollars_timeline', '?county={}'.format(county)),
+        ('subsidy_dollars_top_counties', ''),
+        ('subsidy_dollars_top_commodities', ''),
+        ('subsidy_recipients_data', '?year=2016'),
+        ('crop_diversity_data', ''),
+        ('oregon_exports_timeline', ''),
+        ('oregon_exports_timeline', '?commodity=Export 0001'),
+        ('oregon_export_commodities', ''),
+        ('oregon_exports_top_commodities', ''),
+        ('exports_seasonality', ''),
+        ('exports_breakdown', '?level=hs_cat_lvl_2&parent=Category 1'),
+        ('exports_by_country', '?group=country&group=year'),
+        ('imports_by_country', ''),
+        ('imports_historical', '?group=year'),
+        ('trade_totals', '?period=monthly'),
+        ('commodity_search', '?q=whe'),
+        ('timeline', '?dataset=subsidy_dollars&county=Linn&county=Lane&county=Marion'),
+        ('top', '?dataset=nass_commodity_area&dimension=county&n=10'),
+        ('production_and_revenue', '?county={}&commodity={}'.format(county, commodity)),
+        ('production_and_revenue', ''),
+        ('result_cache_stats', ''),
+        ('metrics', ''),
+    ]
+    return [(name, reverse(name) + query, None) for name, query in requests] + [
+        ('batch', reverse('batch'), BATCH),
+        ('batch', reverse('batch'), dict(BATCH, concurrent=True)),
+    ]
+
+
+def request(client, url, body=None):
+    if body is None:
+        return client.get(url, HTTP_ACCEPT='application/json')
+    return client.post(url, json.dumps(body), content_type='application/json',
+                       HTTP_ACCEPT='application/json')
+
+
+def measure(client, url, body, iterations, keep_cache=False):
+    """
+    Request url (with body, if any) iterations times and return a dictionary of its latency
+    percentiles in milliseconds, query count, response size and the peak
+    memory allocated while serving it.
+    """
+    latencies = []
+    queries = None
+    status = None
+    size = 0
+    for iteration in range(iterations):
+        if not keep_cache:
+            result_cache.clear()
+        start = time.time()
+        response = request(client, url, body)
+        content = b''.join(response.streaming_content) if response.streaming \
+            else response.content
+        latencies.append(1000 * (time.time() - start))
+        # Counted by MetricsMiddleware with the cropcompass.db_pool backend
+        # (None with others); the rows of streaming responses are fetched
+        # after it has counted
+        queries = getattr(response.wsgi_request, '_metrics', {}).get('queries')
+        status = response.status_code
+        size = len(content)
+    # Measure memory in a separate request, as tracing slows requests down
+    if not keep_cache:
+        result_cache.clear()
+    tracemalloc.start()
+    response = request(client, url, body)
+    if response.streaming:
+        for chunk in response.streaming_content:
+            pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return OrderedDict((
+        ('url', url),
+        ('concurrent', bool(body and body.get('concurrent'))),
+        ('status', status),
+        ('p50_ms', round(float(p50), 3)),
+        ('p95_ms', round(float(p95), 3)),
+        ('p99_ms', round(float(p99), 3)),
+        ('queries', queries),
+        ('response_bytes', size),
+        ('peak_memory_bytes', peak),
+    ))
+
+
+def run(iterations, keep_cache=False):
+    """
+    Benchmark every bench_requests() request and return the list of their
+    measurements.
+    """
+    client = Client()
+    return [
+        OrderedDict([('endpoint', name)] +
+                    list(measure(client, url, body, iterations, keep_cache).items()))
+        for name, url, body in bench_requests()
+    ]
@@ -0,0 +1,151 @@
+"""
+Binary renderers for the list views, selected with the "format" query
+parameter:
+
+arrow    an Arrow IPC stream (application/vnd.apache.arrow.stream)
+parquet  a Parquet file (application/vnd.apache.parquet)
+msgpack  the columnar envelope as MessagePack (application/msgpack)
+
+They render the columnar envelope of api.columnar, so the rows go from
+values_list() tuples to typed columns without a dictionary per row. Arrow and
+Parquet columns get the types of the model fields (year int16, fips int32,
+decimal values decimal128); the other envelope values ("error", "rows",
+"next") are JSON encoded in the schema metadata. MessagePack has no decimal
+type, so decimal values are strings, as in the columnar JSON.
+
+The formats of a missing package are not offered, and requesting them gets
+406 Not Acceptable naming the package (see UNAVAILABLE_FORMATS). msgpack
+(msgpack-python) is in the requirements; pyarrow isn't, as it has no release
+for the Python 3.4 of the provisioned box: until it is provisioned on a newer
+Python, arrow and parquet are not served.
+"""
+
+import json
+from decimal import Decimal
+from django.db import models
+from rest_framework.renderers import BaseRenderer
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Largest decimal precision of the Arrow decimal128 type; wider decimals are
+# converted to float64
+MAX_DECIMAL_DIGITS = 38
+
+
+def arrow_type(field):
+    """
+    Return the Arrow type of the values of a model field, or None to let
+    Arrow infer it.
+    """
+    if isinstance(field, models.SmallIntegerField):
+        return pyarrow.int16()
+    if isinstance(field, models.BigIntegerField):
+        return pyarrow.int64()
+    if isinstance(field, (models.IntegerField, models.AutoField)):
+        return pyarrow.int32()
+    if isinstance(field, models.FloatField):
+        return pyarrow.float64()
+    if isinstance(field, models.DecimalField):
+        if field.max_digits > MAX_DECIMAL_DIGITS:
+            return pyarrow.float64()
+        return pyarrow.decimal128(field.max_digits, field.decimal_places)
+    if isinstance(field, models.CharField):
+        return pyarrow.string()
+    return None
+
+
+def arrow_column(values, arrow_type):
+    if arrow_type == pyarrow.float64():
+        values = [float(value) if value is not None else None for value in values]
+    return pyarrow.array(values, type=arrow_type)
+
+
+def arrow_table(data, model=None):
+    """
+    Return the Arrow table of a columnar envelope. Columns that are fields of
+    model get the Arrow types of the fields.
+    """
+    field_types = {}
+    if model is not None:
+        field_types = dict((field.name, arrow_type(field)) for field in model._meta.fields)
+    names = data.get('columns', [])
+    arrays = [arrow_column(data['data'][name], field_types.get(name)) for name in names]
+    metadata = dict(
+        (key, json.dumps(value)) for key, value in data.items()
+        if key not in ('columns', 'data')
+    )
+    schema = pyarrow.schema(
+        [pyarrow.field(name, array.type) for name, array in zip(names, arrays)],
+        metadata=metadata)
+    return pyarrow.Table.from_arrays(arrays, schema=schema)
+
+
+class ArrowRenderer(BaseRenderer):
+    media_type = 'application/vnd.apache.arrow.stream'
+    format = 'arrow'
+    charset = None
+    render_style = 'binary'
+    columnar = True
+    package = 'pyarrow'
+    available = pyarrow is not None
+
+    def write(self, table, sink):
+        with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        view = (renderer_context or {}).get('view')
+        table = arrow_table(data, getattr(view, 'model', None))
+        sink = pyarrow.BufferOutputStream()
+        self.write(table, sink)
+        return sink.getvalue().to_pybytes()
+
+
+class ParquetRenderer(ArrowRenderer):
+    media_type = 'application/vnd.apache.parquet'
+    format = 'parquet'
+
+    def write(self, table, sink):
+        pyarrow.parquet.write_table(table, sink)
+
+
+def msgpack_default(obj):
+    if isinstance(obj, Decimal):
+        return str(obj)
+    raise TypeError('Can not serialize {!r}'.format(obj))
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+    columnar = True
+    package = 'msgpack-python'
+    available = msgpack is not None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return msgpack.packb(data, default=msgpack_default, use_bin_type=True)
+
+
+BINARY_RENDERERS = tuple(
+    renderer for renderer in (ArrowRenderer, ParquetRenderer, MessagePackRenderer)
+    if renderer.available
+)
+
+# {<format>: <missing package>} of the renderers that aren't available
+UNAVAILABLE_FORMATS = dict(
+    (renderer.format, renderer.package)
+    for renderer in (ArrowRenderer, ParquetRenderer, MessagePackRenderer)
+    if not renderer.available
+)
@@ -0,0 +1,128 @@
+"""
+In-process result cache for the aggregate views.
+
+Response data is cached in serialized (pickled) form, keyed on the view,
+its normalized query parameters and the versions of the tables it reads,
+so reloading a table makes its cached results unreachable rather than stale.
+The cache is bounded by the total size of the serialized data
+(RESULT_CACHE_MAX_BYTES setting), evicting the least recently used results
+first.
+
+Every uWSGI process holds its own cache, so the memory used is up to
+RESULT_CACHE_MAX_BYTES times the number of processes.
+
+Views opt in by decorating their get() method with cached_result.
+"""
+
+import pickle
+import threading
+from collections import OrderedDict
+from functools import wraps
+from django.conf import settings
+from rest_framework.response import Response
+from .versions import version_etag
+
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+
+class ResultCache(object):
+    """
+    Thread-safe LRU cache of pickled values, bounded by their total size.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return the value cached for key, or None.
+        """
+        with self.lock:
+            payload = self.entries.get(key)
+            if payload is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        return pickle.loads(payload)
+
+    def set(self, key, value):
+        """
+        Cache value for key, evicting least recently used values as needed.
+        Values larger than the whole cache are not cached.
+        """
+        payload = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(payload) > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old)
+            while self.entries and self.bytes + len(payload) > self.max_bytes:
+                evicted_key, evicted = self.entries.popitem(last=False)
+                self.bytes -= len(evicted)
+                self.evictions += 1
+            self.entries[key] = payload
+            self.bytes += len(payload)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """
+        Return a dictionary of cache statistics.
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return OrderedDict((
+                ('entries', len(self.entries)),
+                ('bytes', self.bytes),
+                ('max_bytes', self.max_bytes),
+                ('hits', self.hits),
+                ('misses', self.misses),
+                ('hit_ratio', float(self.hits) / lookups if lookups else None),
+                ('evictions', self.evictions),
+            ))
+
+
+result_cache = ResultCache(getattr(settings, 'RESULT_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+
+
+def cached_result(get):
+    """
+    Decorator for the get() method of a VersionedAPIView, caching the data of
+    its successful responses in result_cache.
+    """
+    @wraps(get)
+    def wrapper(self, request, *args, **kwargs):
+        versions = getattr(self, 'dataset_versions', None)
+        if versions is None:
+            return get(self, request, *args, **kwargs)
+        key = version_etag(type(self).__name__, versions, request.query_params)
+        data = result_cache.get(key)
+        if data is not None:
+            return Response(data)
+        response = get(self, request, *args, **kwargs)
+        if isinstance(response, Response) and response.status_code == 200:
+            result_cache.set(key, response.data)
+        return response
+    # Tells api.warm which views are worth warming
+    wrapper.cached_result = True
+    return wrapper
+
+
+def caches_results(view):
+    """
+    Return whether view, a function of the URL configuration, is a view
+    whose get() method is decorated with cached_result.
+    """
+    view_class = getattr(view, 'view_class', None)
+    get = getattr(view_class, 'get', None)
+    return getattr(get, 'cached_result', False)
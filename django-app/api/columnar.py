@@ -0,0 +1,82 @@
+"""
+Columnar JSON output, selected with the "format=columnar" query parameter.
+
+Instead of a list of row objects, which repeat every key on every row, "data"
+is an object of one list of values per column, and "columns" lists the column
+names in order:
+
+    {"error": null, "rows": 2, "columns": ["commodity", "year"],
+     "data": {"commodity": ["Hops", "Wheat"], "year": [2012, 2012]}}
+
+The list views build the columns straight from values_list() tuples, without
+going through the row serializers. The columns keep the database values; the
+renderers convert them (see also api.binary).
+"""
+
+from collections import OrderedDict
+from decimal import Decimal
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class ColumnarJSONEncoder(JSONEncoder):
+    """
+    JSON encoder rendering decimals as strings, as the row serializers do.
+    """
+    def default(self, obj):
+        if isinstance(obj, Decimal):
+            return str(obj)
+        return super(ColumnarJSONEncoder, self).default(obj)
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    """
+    JSON renderer selected by "format=columnar". The views reshape the data
+    when they see a renderer with a true "columnar" attribute accepted (see
+    wants_columnar()).
+    """
+    format = 'columnar'
+    encoder_class = ColumnarJSONEncoder
+    columnar = True
+
+
+def wants_columnar(request):
+    """
+    Return whether the response to request is rendered by a columnar
+    renderer.
+    """
+    renderer = getattr(request, 'accepted_renderer', None)
+    return getattr(renderer, 'columnar', False)
+
+
+def columns_from_tuples(fields, rows):
+    """
+    Return an OrderedDict of the list of values of every field, from a list
+    of value tuples of fields.
+    """
+    values = zip(*rows) if rows else [()] * len(fields)
+    return OrderedDict((field, list(column)) for field, column in zip(fields, values))
+
+
+def columnar_envelope(data, fields, rows):
+    """
+    Return the columnar version of a list view response envelope, with the
+    value tuples of fields in rows as data.
+    """
+    result = OrderedDict((key, value) for key, value in data.items() if key != 'data')
+    result['columns'] = list(fields)
+    result['data'] = columns_from_tuples(fields, rows)
+    return result
+
+
+def columnar_data(data):
+    """
+    Return the columnar version of a response envelope whose "data" is a list
+    of row dictionaries, or data unchanged if it has no such list.
+    """
+    rows = data.get('data') if isinstance(data, dict) else None
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        return data
+    fields = list(rows[0].keys()) if rows else []
+    return columnar_envelope(data, fields, [tuple(row.get(field) for field in fields)
+                                            for row in rows])
@@ -0,0 +1,288 @@
+"""
+In-process column store of the county datasets, serving the table views
+without querying the database.
+
+Every county dataset (see api.datasets) is held as NumPy arrays: year, fips,
+commodity code and value. A table is loaded on first use, or by preload() at
+worker start, and reloaded when its dataset version changes (see
+api.versions), so a request is always answered from the version its ETag
+names.
+
+Aggregates are vectorized group-bys (numpy.bincount over the codes of the
+group field) that return the same rows as the query helpers of api.views:
+sums are None for groups without values, integer fields sum to integers and
+decimal fields to Decimals with the field's decimal places. Commodity codes
+follow the database's ordering of the names, so groups come out in the
+order of its collation. A null year, fips or commodity is a group of its
+own, sorted last as PostgreSQL sorts nulls.
+
+The store is used when the COLUMN_STORE setting is true (off by default).
+"""
+
+import threading
+from collections import OrderedDict
+from decimal import Decimal
+import numpy as np
+from django.conf import settings
+from django.db import models
+from .datasets import DATASETS
+from .versions import dataset_versions
+
+# The datasets held in the store
+COLUMN_TABLES = tuple(
+    name for name, dataset in DATASETS.items()
+    if dataset.year_field == 'year' and 'fips' in dataset.dimensions
+)
+
+GROUP_FIELDS = ('year', 'fips', 'commodity')
+
+# numpy.in1d, named isin from NumPy 1.13 on (in1d is gone from NumPy 2.4)
+isin = getattr(np, 'isin', None) or np.in1d
+
+# Stands for a null year or fips, sorting after every other value
+NULL_KEY = np.iinfo(np.int32).max
+
+
+class UnsupportedFilter(ValueError):
+    """
+    Raised for a filter the column store can't apply.
+    """
+    pass
+
+
+def key_column(values):
+    """
+    Return the int32 array of a year or fips column, with NULL_KEY for nulls.
+    """
+    return np.array([NULL_KEY if value is None else value for value in values],
+                    dtype=np.int32)
+
+
+class ColumnTable(object):
+    """
+    The columns of one dataset, at one version.
+
+    commodities is the list of the commodity names in the order the groups
+    are to be sorted in, by default code point order with None last.
+    """
+    def __init__(self, dataset, version, year, fips, commodity, values, commodities=None):
+        self.name = dataset.name
+        self.version = version
+        self.value_field = dataset.value_field
+        field = dataset.model._meta.get_field(dataset.value_field)
+        # Sums of decimal fields are rounded to their decimal places, sums of
+        # integer fields are integers
+        self.decimal_places = getattr(field, 'decimal_places', None)
+        self.integer = not isinstance(field, (models.DecimalField, models.FloatField))
+        if commodities is None:
+            names = set(commodity)
+            commodities = sorted(names - {None}) + ([None] if None in names else [])
+        self.commodity_index = dict((name, code) for code, name in enumerate(commodities))
+        commodities = np.array(commodities, dtype=object)
+        self.columns = {
+            'year': key_column(year),
+            'fips': key_column(fips),
+            'commodity': np.array([self.commodity_index[name] for name in commodity],
+                                  dtype=np.int32),
+        }
+        self.valid = np.array([value is not None for value in values], dtype=bool)
+        self.values = np.array([float(value) if value is not None else 0.0 for value in values])
+        # (<labels>, <codes>) of every group field
+        self.groups = {'commodity': (commodities, self.columns['commodity'])}
+        for field_name in ('year', 'fips'):
+            labels, codes = np.unique(self.columns[field_name], return_inverse=True)
+            labels = np.array([None if label == NULL_KEY else label for label in labels.tolist()],
+                              dtype=object)
+            self.groups[field_name] = (labels, codes)
+
+    @classmethod
+    def load(cls, dataset, version):
+        """
+        Return the ColumnTable of dataset, read from the database.
+        """
+        rows = dataset.model.objects.values_list('year', 'fips', 'commodity', dataset.value_field)
+        columns = list(zip(*rows.iterator())) or [(), (), (), ()]
+        # In the order of the database collation
+        commodities = list(dataset.model.objects.order_by('commodity')
+                           .values_list('commodity', flat=True).distinct())
+        return cls(dataset, version, *columns, commodities=commodities)
+
+    def __len__(self):
+        return len(self.values)
+
+    def most_recent_year(self):
+        years = [year for year in self.groups['year'][0].tolist() if year is not None]
+        return years[-1] if years else None
+
+    def lookup(self, lookup, value):
+        """
+        Return the mask of the rows matching a Django style lookup, "field",
+        "field__in", "field__gte" or "field__lte".
+        """
+        field, _, operator = lookup.partition('__')
+        if field not in self.columns:
+            raise UnsupportedFilter(lookup)
+        column = self.columns[field]
+        if operator in ('gte', 'lte') and field != 'commodity':
+            # A ValueError for a value that isn't a number, like the database
+            bound = int(value)
+            # Like SQL, a comparison with null is never true
+            mask = column >= bound if operator == 'gte' else column <= bound
+            return mask & (column != NULL_KEY)
+        if operator == 'in':
+            values = list(value)
+        elif operator in ('', 'exact'):
+            values = [value]
+        else:
+            raise UnsupportedFilter(lookup)
+        if field == 'commodity':
+            codes = [self.commodity_index[v] for v in values if v in self.commodity_index]
+        elif operator != 'in' and value is None:
+            # Like the ORM, an exact lookup of None selects the nulls
+            return column == NULL_KEY
+        else:
+            # Like SQL, IN never matches a null
+            codes = [int(v) for v in values if v is not None]
+        return isin(column, np.asarray(codes, dtype=np.int32))
+
+    def select(self, valid_only=False, exclude=None, **filters):
+        """
+        Return the mask of the rows matching the filters and none of the
+        exclude filters, both Django style lookups (see lookup()). With
+        valid_only, rows with a null value are left out.
+        """
+        mask = self.valid.copy() if valid_only else np.ones(len(self), dtype=bool)
+        for lookup, value in filters.items():
+            mask &= self.lookup(lookup, value)
+        for lookup, value in (exclude or {}).items():
+            mask &= ~self.lookup(lookup, value)
+        return mask
+
+    def sum_value(self, total, valid):
+        if not valid:
+            return None
+        if self.integer:
+            return int(round(total))
+        if self.decimal_places is not None:
+            return Decimal('{:.{}f}'.format(total, self.decimal_places))
+        return float(total)
+
+    def sums(self, mask, codes, size):
+        """
+        Return the (<group codes>, <sums>) of the groups of codes among the
+        rows of mask, with None sums for groups without values.
+        """
+        selected = codes[mask]
+        present = np.flatnonzero(np.bincount(selected, minlength=size))
+        totals = np.bincount(selected, weights=self.values[mask], minlength=size)
+        counts = np.bincount(selected, weights=self.valid[mask], minlength=size)
+        return (present, [self.sum_value(totals[code], counts[code] > 0) for code in present])
+
+    def aggregate_by(self, mask, group_field, order_by=None, limit=None):
+        """
+        Return the [{group_field: <group>, value_field: <sum>}, ...] rows of
+        the rows of mask, like api.views.aggregate_by().
+        """
+        labels, codes = self.groups[group_field]
+        present, sums = self.sums(mask, codes, len(labels))
+        rows = list(zip(labels[present].tolist(), sums))
+        if limit is not None:
+            rows = [row for row in rows if row[1] is not None]
+        if order_by in (self.value_field, '-' + self.value_field):
+            # Sorts are stable, so ties stay in group order
+            rows.sort(key=lambda row: row[1], reverse=order_by.startswith('-'))
+        if limit is not None:
+            rows = rows[:limit]
+        return [{group_field: group, self.value_field: total} for group, total in rows]
+
+    def aggregate_table(self, mask, group_field):
+        """
+        Return the (<rows>, <total>) tuple of api.views.aggregate_table().
+        """
+        rows = self.aggregate_by(mask, group_field)
+        sums = [row[self.value_field] for row in rows if row[self.value_field] is not None]
+        total = sum(sums) if sums else None
+        return (rows, total)
+
+    def timeline(self, mask, value_key=None):
+        """
+        Return the [{'year': <year>, value_key: <sum>}, ...] timeline of
+        api.views.timeline().
+        """
+        value_key = value_key or self.value_field
+        return [
+            {'year': row['year'], value_key: row[self.value_field]}
+            for row in self.aggregate_by(mask, 'year')
+        ]
+
+    def timeline_series(self, mask, series_field, value_key=None):
+        """
+        Return the OrderedDict of {<series>: <timeline>} of
+        api.views.timeline_series().
+        """
+        value_key = value_key or self.value_field
+        series_labels, series_codes = self.groups[series_field]
+        years, year_codes = self.groups['year']
+        codes = series_codes * len(years) + year_codes
+        present, sums = self.sums(mask, codes, len(series_labels) * len(years))
+        series_labels = series_labels.tolist()
+        years = years.tolist()
+        series = OrderedDict()
+        for code, total in zip(present.tolist(), sums):
+            name = series_labels[code // len(years)]
+            year = years[code % len(years)]
+            series.setdefault(name, []).append({'year': year, value_key: total})
+        return series
+
+
+class ColumnStore(object):
+    """
+    Thread-safe store of the ColumnTables of this process.
+    """
+    def __init__(self):
+        self.tables = {}
+        self.lock = threading.Lock()
+
+    def get(self, name, version):
+        """
+        Return the ColumnTable of name at version, loading it if the store
+        holds another version.
+        """
+        table = self.tables.get(name)
+        if table is not None and table.version == version:
+            return table
+        with self.lock:
+            table = self.tables.get(name)
+            if table is None or table.version != version:
+                table = ColumnTable.load(DATASETS[name], version)
+                self.tables[name] = table
+        return table
+
+    def preload(self):
+        """
+        Load every table of the store at its current version.
+        """
+        for name, version in dataset_versions(COLUMN_TABLES).items():
+            self.get(name, version)
+
+    def clear(self):
+        with self.lock:
+            self.tables.clear()
+
+
+column_store = ColumnStore()
+
+
+def enabled():
+    return getattr(settings, 'COLUMN_STORE', False)
+
+
+def column_table(name, versions):
+    """
+    Return the ColumnTable of table name at its version in versions (see
+    api.versions.dataset_versions()), or None if the column store is off or
+    doesn't hold the table.
+    """
+    if not enabled() or name not in COLUMN_TABLES or name not in versions:
+        return None
+    return column_store.get(name, versions[name])
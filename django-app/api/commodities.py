@@ -0,0 +1,228 @@
+"""
+In-process search index of the commodity names of every fact table, for the
+commodity autocompletion of /commodities/search/.
+
+The index is built from the distinct (commodity, year) pairs of the tables of
+SEARCH_TABLES, one query per table. Names that only differ in case or white
+space are one commodity (see api.derived.normalize_name()), listed with the
+tables and years it appears in. Like the column store (see api.columnstore),
+the index is built on first use, or by preload() at worker start, and rebuilt
+when the version of one of its tables changes.
+
+A search ranks the commodities whose name:
+
+1. is the query ("exact"),
+2. starts with the query ("prefix"),
+3. has a word starting with the query ("word"), e.g. "wheat" for "winter
+   wheat",
+4. shares enough trigrams with the query ("similar"), for misspellings. This
+   is only tried when the first three don't fill the results.
+
+The first three are bisections of sorted lists, the last counts the trigrams
+of the candidates sharing one with the query: a search doesn't scan the
+commodities.
+"""
+
+import re
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from .datasets import DATASETS
+from .derived import normalize_name
+from .models import OainProductionRevenue, TradeByCountry, TradeTotals
+from .versions import dataset_versions
+
+# {<table>: (<model>, <year field>)} of the tables whose commodities are
+# indexed, in the order they are listed in results
+SEARCH_SOURCES = OrderedDict(
+    [(name, (dataset.model, dataset.year_field)) for name, dataset in DATASETS.items()] +
+    [(model._meta.db_table, (model, 'year'))
+     for model in (OainProductionRevenue, TradeByCountry, TradeTotals)]
+)
+
+SEARCH_TABLES = tuple(SEARCH_SOURCES)
+
+# Match kinds, best first
+MATCHES = ('exact', 'prefix', 'word', 'similar')
+
+# Minimum trigram similarity of a "similar" match
+SIMILARITY = 0.3
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def trigrams(key):
+    """
+    Return the set of the trigrams of a key, its words padded like
+    PostgreSQL's pg_trgm does.
+    """
+    grams = set()
+    for word in WORD_RE.findall(key):
+        padded = '  ' + word + ' '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class CommodityIndex(object):
+    """
+    The search index of the commodities of the tables, at one version of
+    them.
+    """
+    def __init__(self, versions, rows):
+        """
+        Build the index of the (<table>, <commodity>, <year>) rows.
+        """
+        self.versions = versions
+        entries = {}
+        for table, commodity, year in rows:
+            name, key = normalize_name(commodity)
+            if key is None:
+                continue
+            entry = entries.setdefault(key, (name, {}))
+            years = entry[1].setdefault(table, set())
+            if year is not None:
+                years.add(year)
+        self.keys = sorted(entries)
+        self.names = [entries[key][0] for key in self.keys]
+        self.tables = [
+            OrderedDict((table, sorted(entries[key][1][table]))
+                        for table in SEARCH_SOURCES if table in entries[key][1])
+            for key in self.keys
+        ]
+        # The keys from their second word on, sorted, and their commodities
+        suffixes = sorted(
+            (key[match.start():], code)
+            for code, key in enumerate(self.keys)
+            for match in list(WORD_RE.finditer(key))[1:]
+        )
+        self.suffixes = [suffix for suffix, code in suffixes]
+        self.suffix_codes = [code for suffix, code in suffixes]
+        self.trigram_counts = []
+        self.trigrams = {}
+        for code, key in enumerate(self.keys):
+            grams = trigrams(key)
+            self.trigram_counts.append(len(grams))
+            for gram in grams:
+                self.trigrams.setdefault(gram, []).append(code)
+
+    @classmethod
+    def load(cls, versions):
+        """
+        Return the CommodityIndex of SEARCH_TABLES, read from the database.
+        """
+        rows = []
+        for table, (model, year_field) in SEARCH_SOURCES.items():
+            pairs = model.objects.filter(commodity__isnull=False).order_by() \
+                .values_list('commodity', year_field).distinct()
+            rows.extend((table, commodity, year) for commodity, year in pairs.iterator())
+        return cls(versions, rows)
+
+    def __len__(self):
+        return len(self.keys)
+
+    @staticmethod
+    def prefixed(keys, prefix):
+        """
+        Return the range of the indexes of the items of the sorted list keys
+        starting with prefix.
+        """
+        start = end = bisect_left(keys, prefix)
+        while end < len(keys) and keys[end].startswith(prefix):
+            end += 1
+        return range(start, end)
+
+    def similar(self, key):
+        """
+        Return the {<commodity>: <similarity>} of the commodities sharing
+        trigrams with key, at least SIMILARITY similar.
+        """
+        grams = trigrams(key)
+        shared = {}
+        for gram in grams:
+            for code in self.trigrams.get(gram, ()):
+                shared[code] = shared.get(code, 0) + 1
+        similarities = {}
+        for code, count in shared.items():
+            similarity = float(count) / (len(grams) + self.trigram_counts[code] - count)
+            if similarity >= SIMILARITY:
+                similarities[code] = similarity
+        return similarities
+
+    def search(self, query, limit=10, tables=None):
+        """
+        Return the [{"commodity", "match", "similarity", "datasets"}, ...]
+        list of the limit best matches of query, among the commodities of
+        tables (default: all). "datasets" lists the {"dataset", "years"} of
+        the tables the commodity appears in.
+        """
+        key = normalize_name(query)[1]
+        if key is None:
+            return []
+        # {<commodity>: (<match>, <similarity>)}
+        found = {}
+        for code in self.prefixed(self.keys, key):
+            found[code] = (0 if self.keys[code] == key else 1, 1.0)
+        for i in self.prefixed(self.suffixes, key):
+            found.setdefault(self.suffix_codes[i], (2, 1.0))
+        if tables is not None:
+            found = dict((code, match) for code, match in found.items()
+                         if any(table in self.tables[code] for table in tables))
+        if len(found) < limit:
+            for code, similarity in self.similar(key).items():
+                if code not in found and (tables is None or
+                                          any(table in self.tables[code] for table in tables)):
+                    found[code] = (3, similarity)
+        ranked = sorted(found.items(), key=lambda item: (
+            item[1][0], -item[1][1], -len(self.tables[item[0]]), len(self.keys[item[0]]),
+            self.keys[item[0]]))
+        return [
+            OrderedDict((
+                ('commodity', self.names[code]),
+                ('match', MATCHES[match]),
+                ('similarity', round(similarity, 3)),
+                ('datasets', [
+                    OrderedDict((('dataset', table), ('years', years)))
+                    for table, years in self.tables[code].items()
+                ]),
+            ))
+            for code, (match, similarity) in ranked[:limit]
+        ]
+
+
+class CommodityIndexStore(object):
+    """
+    Thread-safe holder of the CommodityIndex of this process.
+    """
+    def __init__(self):
+        self.index = None
+        self.lock = threading.Lock()
+
+    def get(self, versions):
+        """
+        Return the CommodityIndex at the versions of SEARCH_TABLES (see
+        api.versions.dataset_versions()), rebuilding it if the store holds
+        other versions.
+        """
+        versions = tuple(versions[table][0] for table in SEARCH_TABLES)
+        index = self.index
+        if index is not None and index.versions == versions:
+            return index
+        with self.lock:
+            index = self.index
+            if index is None or index.versions != versions:
+                index = CommodityIndex.load(versions)
+                self.index = index
+        return index
+
+    def preload(self):
+        """
+        Build the index at the current versions of its tables.
+        """
+        self.get(dataset_versions(SEARCH_TABLES))
+
+    def clear(self):
+        with self.lock:
+            self.index = None
+
+
+commodity_index = CommodityIndexStore()
@@ -0,0 +1,66 @@
+"""
+Registry of the fact tables that the generic aggregate views (timeline,
+top-N) can be computed over.
+
+Datasets are keyed on their database table name, which is also the key of
+their entry in the metadata table.
+"""
+
+from collections import OrderedDict, namedtuple
+from .models import (
+    ExportsHistoricalCleaned,
+    NassAnimalsSales,
+    NassCommodityArea,
+    NassCommodityFarms,
+    OainHarvestAcres,
+    SubsidyDollars,
+    SubsidyRecipients,
+)
+
+# name: table name of the dataset
+# model: the dataset's model
+# year_field: name of the year field of the model
+# value_field: name of the numeric field that is summed in aggregates
+# dimensions: fields the dataset can be grouped by, besides the year
+Dataset = namedtuple('Dataset', (
+    'name',
+    'model',
+    'year_field',
+    'value_field',
+    'dimensions'
+))
+
+COUNTY_DIMENSIONS = ('commodity', 'fips')
+
+DATASETS = OrderedDict((dataset.name, dataset) for dataset in (
+    Dataset('subsidy_dollars', SubsidyDollars, 'year',
+            'subsidy_dollars', COUNTY_DIMENSIONS),
+    Dataset('subsidy_recipients', SubsidyRecipients, 'year',
+            'subsidy_recipients', COUNTY_DIMENSIONS),
+    Dataset('nass_commodity_area', NassCommodityArea, 'year',
+            'acres', COUNTY_DIMENSIONS),
+    Dataset('nass_commodity_farms', NassCommodityFarms, 'year',
+            'farms', COUNTY_DIMENSIONS),
+    Dataset('oain_harvest_acres', OainHarvestAcres, 'year',
+            'harvested_acres', COUNTY_DIMENSIONS),
+    Dataset('nass_animals_sales', NassAnimalsSales, 'year',
+            'animals', COUNTY_DIMENSIONS),
+    Dataset('exports_historical_cleaned', ExportsHistoricalCleaned, 'time_year',
+            'value_num', ('commodity', 'hs_cat_lvl_1', 'hs_cat_lvl_2')),
+))
+
+
+def get_dataset(name):
+    """
+    Return the Dataset registered under name, or None if there is none.
+    """
+    return DATASETS.get(name)
+
+
+def dataset_queryset(dataset):
+    """
+    Return the queryset of all rows of a dataset with a non-null value.
+    """
+    return dataset.model.objects.filter(
+        **{dataset.value_field + '__isnull': False}
+    )
@@ -0,0 +1,272 @@
+"""
+Derived tables, computed from the raw tables once per load instead of on
+every request.
+
+oain_production_revenue: produced value and revenue from raw_oain_data, with
+the "$1,234" strings parsed into dollar amounts and the commodity names
+reduced to their canonical form.
+
+exports_rollup: the export values of exports_historical_cleaned summed per
+year and per (year, month), (year, hs_cat_lvl_1), (year, hs_cat_lvl_2) and
+(year, commodity), so that the export views read a few hundred rollup rows
+instead of the whole table.
+
+trade_by_country and trade_totals: the import and export tables that store
+time and value as text (see TRADE_SOURCES), converted into typed rows with
+an integer year and month, a numeric value and normalized country and
+commodity names.
+"""
+
+import re
+from collections import OrderedDict
+from functools import partial
+from django.db import transaction
+from django.db.models import Count, Sum
+from .models import (
+    ExportsByCountryRaw,
+    ExportsHistoricalCleaned,
+    ExportsHistoricalCleanedAnnualTotals,
+    ExportsHistoricalCleanedMonthlyTotals,
+    ExportsRollup,
+    ImportsByCountryRaw,
+    ImportsHistoricalCleanedAnnualTotals,
+    ImportsHistoricalCleanedMonthlyTotals,
+    ImportsHistoricalRaw,
+    OainProductionRevenue,
+    RawOainData,
+    TradeByCountry,
+    TradeTotals,
+)
+from .versions import bump_versions
+
+# Number of rows inserted per INSERT statement
+BULK_SIZE = 2000
+
+OAIN_FIELDS = (
+    'commodity',
+    'county',
+    'year',
+    'value_produced',
+    'value_sales',
+)
+
+
+def canonical_commodity(name):
+    """
+    Return the canonical commodity name of a raw OAIN commodity name, e.g.
+    "Tree Fruit - APPLES" -> "Apples".
+    """
+    if name is None:
+        return None
+    parts = name.split('-')
+    name = parts[1] if len(parts) > 1 else parts[0]
+    return name.strip().capitalize()
+
+
+def parse_dollars(value):
+    """
+    Return the number in a "$1,234.5" style string, or None if there is none.
+    """
+    if value is None:
+        return None
+    try:
+        return float(value.strip().strip('$').replace(',', ''))
+    except ValueError:
+        return None
+
+
+def production_revenue(row):
+    """
+    Return the OainProductionRevenue of a raw_oain_data values() row. The
+    raw values are in thousands of dollars.
+    """
+    value_produced = parse_dollars(row['value_produced'])
+    value_sales = parse_dollars(row['value_sales'])
+    return OainProductionRevenue(
+        county=row['county'],
+        commodity=canonical_commodity(row['commodity']),
+        year=row['year'],
+        produced_value=1000 * value_produced if value_produced is not None else None,
+        revenue=1000 * value_sales if value_sales is not None else None,
+    )
+
+
+def rebuild_production_revenue():
+    """
+    Replace the contents of oain_production_revenue with rows parsed from
+    raw_oain_data, in one transaction. Return the number of rows.
+    """
+    raw = RawOainData.objects \
+        .exclude(production_unit=0, price_unit_of_measure__isnull=True) \
+        .order_by('id') \
+        .values(*OAIN_FIELDS)
+    rows = [production_revenue(row) for row in raw.iterator()]
+    with transaction.atomic():
+        OainProductionRevenue.objects.all().delete()
+        OainProductionRevenue.objects.bulk_create(rows, batch_size=BULK_SIZE)
+        bump_versions([OainProductionRevenue._meta.db_table])
+    return len(rows)
+
+
+# (<month field>, <parent field>, <category field>) of the exports_rollup
+# levels, grouped by year and these fields
+ROLLUP_LEVELS = OrderedDict((
+    ('year', (None, None, None)),
+    ('month', ('time_month', None, None)),
+    ('hs_cat_lvl_1', (None, None, 'hs_cat_lvl_1')),
+    ('hs_cat_lvl_2', (None, 'hs_cat_lvl_1', 'hs_cat_lvl_2')),
+    ('commodity', (None, 'hs_cat_lvl_2', 'commodity')),
+))
+
+
+def rollup(level, row):
+    """
+    Return the ExportsRollup of a grouped exports_historical_cleaned row,
+    with the 'total' and 'count' of its group.
+    """
+    month_field, parent_field, category_field = ROLLUP_LEVELS[level]
+    return ExportsRollup(
+        level=level,
+        time_year=row['time_year'],
+        time_month=row[month_field] if month_field else None,
+        parent=row[parent_field] if parent_field else None,
+        category=row[category_field] if category_field else None,
+        value=float(row['total']) if row['total'] is not None else None,
+        rows=row['count'],
+    )
+
+
+def rebuild_exports_rollup():
+    """
+    Replace the contents of exports_rollup with the rollups of
+    exports_historical_cleaned, one GROUP BY query per level, in one
+    transaction. Return the number of rows.
+    """
+    rows = []
+    for level, fields in ROLLUP_LEVELS.items():
+        group_fields = ['time_year'] + [field for field in fields if field]
+        grouped = ExportsHistoricalCleaned.objects \
+            .filter(time_year__isnull=False) \
+            .order_by().values(*group_fields) \
+            .annotate(total=Sum('value_num'), count=Count('time_year'))
+        rows.extend(rollup(level, row) for row in grouped)
+    with transaction.atomic():
+        ExportsRollup.objects.all().delete()
+        ExportsRollup.objects.bulk_create(rows, batch_size=BULK_SIZE)
+        bump_versions([ExportsRollup._meta.db_table])
+    return len(rows)
+
+
+# {<table>: (<raw model>, <typed model>, <flow>)} of the text import and
+# export tables
+TRADE_SOURCES = OrderedDict((model._meta.db_table, (model, typed, flow)) for model, typed, flow in (
+    (ExportsByCountryRaw, TradeByCountry, 'export'),
+    (ImportsByCountryRaw, TradeByCountry, 'import'),
+    (ExportsHistoricalCleanedAnnualTotals, TradeTotals, 'export'),
+    (ExportsHistoricalCleanedMonthlyTotals, TradeTotals, 'export'),
+    (ImportsHistoricalCleanedAnnualTotals, TradeTotals, 'import'),
+    (ImportsHistoricalCleanedMonthlyTotals, TradeTotals, 'import'),
+    (ImportsHistoricalRaw, TradeTotals, 'import'),
+))
+
+YEAR_RE = re.compile(r'(?<!\d)(1[89]\d\d|2\d\d\d)(?!\d)')
+MONTH_NAME_RE = re.compile(r'[A-Za-z]{3,}')
+MONTH_NUMBER_RE = re.compile(r'(?<!\d)(\d{1,2})(?!\d)')
+MONTHS = ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec')
+
+
+def parse_period(text):
+    """
+    Return the (<year>, <month>) of a time string, e.g. "2015" -> (2015,
+    None), and "2015-03", "2015M03", "03/2015", "Mar 2015" or "2015-03-01" ->
+    (2015, 3). Unknown parts are None.
+    """
+    if text is None:
+        return (None, None)
+    match = YEAR_RE.search(text)
+    if match is None:
+        return (None, None)
+    year = int(match.group(1))
+    rest = text[:match.start()] + ' ' + text[match.end():]
+    for name in MONTH_NAME_RE.findall(rest):
+        if name[:3].lower() in MONTHS:
+            return (year, MONTHS.index(name[:3].lower()) + 1)
+    for number in MONTH_NUMBER_RE.findall(rest):
+        if 1 <= int(number) <= 12:
+            return (year, int(number))
+    return (year, None)
+
+
+def normalize_name(name):
+    """
+    Return the (<name>, <key>) of a country or commodity name: the name with
+    its white space collapsed, and its lower case lookup key.
+    """
+    if name is None:
+        return (None, None)
+    name = ' '.join(name.split())
+    if not name:
+        return (None, None)
+    return (name, name.lower())
+
+
+def trade_row(table, flow, typed, row):
+    """
+    Return the typed model instance of a raw values() row of table.
+    """
+    year, month = parse_period(row['time'])
+    commodity, commodity_key = normalize_name(row['commodity'])
+    fields = {
+        'source': table,
+        'flow': flow,
+        'commodity': commodity,
+        'commodity_key': commodity_key,
+        'year': year,
+        'month': month,
+        'value': parse_dollars(row['value']),
+    }
+    if 'country' in row:
+        fields['country'], fields['country_key'] = normalize_name(row['country'])
+    return typed(**fields)
+
+
+def convert_trade_table(table):
+    """
+    Replace the typed rows of a TRADE_SOURCES table with its rows converted,
+    in one transaction. Return the number of rows.
+    """
+    model, typed, flow = TRADE_SOURCES[table]
+    fields = [field.name for field in model._meta.fields if field.name != 'id']
+    raw = model.objects.order_by().values(*fields)
+    count = 0
+    with transaction.atomic():
+        typed.objects.filter(source=table).delete()
+        batch = []
+        for row in raw.iterator():
+            batch.append(trade_row(table, flow, typed, row))
+            if len(batch) >= BULK_SIZE:
+                typed.objects.bulk_create(batch)
+                count += len(batch)
+                batch = []
+        typed.objects.bulk_create(batch)
+        count += len(batch)
+        bump_versions([typed._meta.db_table])
+    return count
+
+
+# Functions rebuilding the derived tables of each raw table
+DERIVED_TABLES = {
+    'raw_oain_data': [rebuild_production_revenue],
+    'exports_historical_cleaned': [rebuild_exports_rollup],
+}
+DERIVED_TABLES.update(
+    (table, [partial(convert_trade_table, table)]) for table in TRADE_SOURCES
+)
+
+
+def rebuild_derived(table):
+    """
+    Rebuild the tables derived from table, after it has been reloaded.
+    """
+    for rebuild in DERIVED_TABLES.get(table, []):
+        rebuild()
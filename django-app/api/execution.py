@@ -0,0 +1,100 @@
+"""
+Concurrent execution of independent database queries.
+
+A view that runs several independent queries hands them to
+run_concurrently() as functions, which runs them in a pool of up to
+QUERY_MAX_WORKERS (setting) threads and returns their results in order, so
+the view waits about as long as the slowest query instead of the sum.
+
+Django connections are per thread: every pool thread has its own database
+connection, which is checked before and after every function the way Django
+checks the connection of a request thread (CONN_MAX_AGE, unusable
+connections).
+
+The functions run in the calling thread, one after another, when
+concurrency is off (QUERY_MAX_WORKERS below 2), when the calling thread is
+itself a pool thread (which could otherwise wait on its own pool), and inside
+a transaction, whose uncommitted rows the other connections wouldn't see.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connection, connections
+from .metrics import add_query_totals, query_delta, query_totals
+
+DEFAULT_MAX_WORKERS = 4
+
+# The pool, created on first use in every process, as threads don't survive
+# a fork
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_local = threading.local()
+
+
+def max_workers():
+    return getattr(settings, 'QUERY_MAX_WORKERS', DEFAULT_MAX_WORKERS)
+
+
+def get_pool():
+    """
+    Return the thread pool of this process.
+    """
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ThreadPoolExecutor(max_workers=max_workers())
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def close_old_connections():
+    for conn in connections.all():
+        conn.close_if_unusable_or_obsolete()
+
+
+def run_in_pool_thread(function):
+    """
+    Return the (<result>, <queries>) tuple of function, with queries the
+    (<count>, <seconds>) of the queries it ran (see api.metrics), or None.
+    """
+    _local.in_pool = True
+    close_old_connections()
+    try:
+        start = query_totals()
+        result = function()
+        return (result, query_delta(start))
+    finally:
+        close_old_connections()
+
+
+def runs_serially():
+    return (max_workers() < 2 or getattr(_local, 'in_pool', False) or
+            connection.in_atomic_block)
+
+
+def run_concurrently(functions):
+    """
+    Call the functions, which take no arguments, concurrently and return the
+    list of their results. The first exception raised by a function is raised
+    once all of them have finished.
+    """
+    functions = list(functions)
+    if len(functions) < 2 or runs_serially():
+        return [function() for function in functions]
+    pool = get_pool()
+    futures = [pool.submit(run_in_pool_thread, function) for function in functions]
+    # Wait for every function, so none is left running if one fails
+    errors = [future.exception() for future in futures]
+    for error in errors:
+        if error is not None:
+            raise error
+    results = []
+    for future in futures:
+        result, queries = future.result()
+        # Counted with the queries of the calling thread's request
+        add_query_totals(queries)
+        results.append(result)
+    return results
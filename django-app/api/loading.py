@@ -0,0 +1,264 @@
+"""
+Bulk loading of the api tables with PostgreSQL COPY.
+
+A source file is either a CSV file with a header line naming the columns, or
+a pg_dump SQL file, of which the "COPY <table> (...) FROM stdin;" block of
+the table is loaded.
+
+A full load copies the file into a staging table shaped like the target
+table, then swaps the two tables by renaming them, in one transaction. The
+indexes of the new table get the names of the old table's. Copying into
+the staging table doesn't lock the table, so the app server keeps answering
+from the old data and doesn't need to be stopped. The renames and the drop
+do take an ACCESS EXCLUSIVE lock, held until the transaction commits right
+after them: queries of the table wait for the swap, and the swap waits for
+the queries already running, but only for as long as the renames take.
+An incremental load only appends the rows of the years after the most
+recent year already in the table. Their ids are given by the table, so an
+"id" column of the file is ignored.
+
+Every load bumps the version of the table. For the reference tables that
+makes the workers reload their reference data snapshot on their next
+request (see api.reference).
+
+Files are identified by their SHA-256 checksum, which is recorded in the
+dataset version registry: loading the same file twice is a no-op.
+"""
+
+import csv
+import hashlib
+import io
+import re
+from django.apps import apps
+from django.db import connection, transaction
+from .versions import bump_versions, loaded_checksum
+
+COPY_BLOCK_RE = re.compile(
+    r'^COPY (?:\w+\.)?"?(?P<table>\w+)"? \((?P<columns>[^)]*)\) FROM stdin;$')
+
+
+class LoadError(Exception):
+    pass
+
+
+def api_tables():
+    """
+    Return a {table_name: model} dictionary of the api models.
+    """
+    return dict(
+        (model._meta.db_table, model)
+        for model in apps.get_app_config('api').get_models()
+    )
+
+
+def file_checksum(path):
+    """
+    Return the SHA-256 hex digest of the file at path.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def csv_source(path):
+    """
+    Return the (<columns>, <file>, <COPY options>) tuple of a CSV file.
+    """
+    source = io.open(path, encoding='utf-8', newline='')
+    columns = [column.strip() for column in next(csv.reader([source.readline()]))]
+    return (columns, source, 'WITH (FORMAT csv)')
+
+
+def sql_copy_source(path, table):
+    """
+    Return the (<columns>, <file>, <COPY options>) tuple of the COPY block
+    of table in a pg_dump SQL file. The file only yields the data lines of
+    the block.
+    """
+    source = io.open(path, encoding='utf-8')
+    for line in source:
+        match = COPY_BLOCK_RE.match(line.strip())
+        if match and match.group('table') == table:
+            columns = [c.strip().strip('"') for c in match.group('columns').split(',')]
+            return (columns, CopyBlock(source), 'WITH (FORMAT text)')
+    source.close()
+    raise LoadError('No COPY block for table {} in {}'.format(table, path))
+
+
+class CopyBlock(object):
+    """
+    File-like object reading the data lines of a COPY block, up to the
+    terminating "\\." line.
+    """
+    def __init__(self, source):
+        self.source = source
+        self.done = False
+
+    def readline(self, size=-1):
+        if self.done:
+            return ''
+        line = self.source.readline()
+        if not line or line.rstrip('\r\n') == '\\.':
+            self.done = True
+            return ''
+        return line
+
+    def read(self, size=-1):
+        lines = []
+        length = 0
+        while size < 0 or length < size:
+            line = self.readline()
+            if not line:
+                break
+            lines.append(line)
+            length += len(line)
+        return ''.join(lines)
+
+    def close(self):
+        self.source.close()
+
+
+def year_column(model):
+    """
+    Return the name of the year column of model, or None.
+    """
+    names = [field.column for field in model._meta.fields]
+    for name in ('year', 'time_year'):
+        if name in names:
+            return name
+    return None
+
+
+def load_table(table, path, source_format='csv', incremental=False, force=False):
+    """
+    Load the file at path into table. Return the number of rows loaded, or
+    None if the file was loaded before and force is False.
+    """
+    model = api_tables().get(table)
+    if model is None:
+        raise LoadError('Unknown table {}'.format(table))
+    if connection.vendor != 'postgresql':
+        raise LoadError('Loading requires PostgreSQL')
+    checksum = file_checksum(path)
+    if not force and checksum == loaded_checksum(table):
+        return None
+    if source_format == 'csv':
+        columns, source, options = csv_source(path)
+    else:
+        columns, source, options = sql_copy_source(path, table)
+    known = set(field.column for field in model._meta.fields)
+    unknown = [column for column in columns if column not in known]
+    if unknown:
+        source.close()
+        raise LoadError('Unknown columns for {}: {}'.format(table, ', '.join(unknown)))
+    year = year_column(model)
+    if incremental and year is None:
+        source.close()
+        raise LoadError('Table {} has no year column to load incrementally'.format(table))
+    if incremental and year not in columns:
+        source.close()
+        raise LoadError('The file has no {} column to load incrementally'.format(year))
+
+    qn = connection.ops.quote_name
+    staging = table + '_staging'
+    column_list = ', '.join(qn(column) for column in columns)
+    # The ids of the file could collide with those of the table
+    insert_list = ', '.join(qn(column) for column in columns if column != 'id')
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            if incremental:
+                # Only the columns of the file: the copied rows get their id
+                # (and other defaults) when inserted into the table
+                cursor.execute(
+                    'CREATE TEMPORARY TABLE {} ON COMMIT DROP AS '
+                    'SELECT {} FROM {} WITH NO DATA'.format(qn(staging), column_list, qn(table)))
+            else:
+                cursor.execute('DROP TABLE IF EXISTS {}'.format(qn(staging)))
+                cursor.execute('CREATE TABLE {} (LIKE {} INCLUDING ALL)'.format(
+                    qn(staging), qn(table)))
+            cursor.copy_expert('COPY {} ({}) FROM STDIN {}'.format(
+                qn(staging), column_list, options), source)
+            if incremental:
+                cursor.execute(
+                    'INSERT INTO {table} ({columns}) SELECT {columns} FROM {staging} '
+                    'WHERE {year} > (SELECT coalesce(max({year}), 0) FROM {table})'.format(
+                        table=qn(table), columns=insert_list,
+                        staging=qn(staging), year=qn(year)))
+                rows = cursor.rowcount
+            else:
+                cursor.execute('SELECT count(*) FROM {}'.format(qn(staging)))
+                rows = cursor.fetchone()[0]
+                swap_tables(cursor, table, staging)
+            bump_versions([table], checksum=checksum)
+    finally:
+        source.close()
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE {}'.format(qn(table)))
+    return rows
+
+
+def index_key(definition):
+    """
+    Return the part of a pg_indexes indexdef that doesn't name the index or
+    its table, e.g. "UNIQUE USING btree (id)".
+    """
+    unique = 'UNIQUE ' if definition.startswith('CREATE UNIQUE ') else ''
+    return unique + 'USING ' + definition.split(' USING ', 1)[1]
+
+
+def index_renames(old_indexes, new_indexes):
+    """
+    Return the [(<new name>, <old name>), ...] renames giving the indexes of
+    a table the names of the same indexes of the table it replaces, both
+    {<name>: <indexdef>} dictionaries.
+    """
+    old_names = {}
+    for name, definition in sorted(old_indexes.items()):
+        old_names.setdefault(index_key(definition), []).append(name)
+    renames = []
+    for name, definition in sorted(new_indexes.items()):
+        names = old_names.get(index_key(definition))
+        if names:
+            old_name = names.pop(0)
+            if old_name != name:
+                renames.append((name, old_name))
+    return renames
+
+
+def table_indexes(cursor, table):
+    """
+    Return the {<name>: <indexdef>} dictionary of the indexes of table.
+    """
+    cursor.execute('SELECT indexname, indexdef FROM pg_indexes '
+                   'WHERE schemaname = current_schema() AND tablename = %s', [table])
+    return dict(cursor.fetchall())
+
+
+def swap_tables(cursor, table, staging):
+    """
+    Replace table with staging. The id sequence of table is handed over to
+    staging before the old table is dropped, and the indexes of staging are
+    renamed after those of table (e.g. the ones migrations create and drop by
+    name).
+    """
+    qn = connection.ops.quote_name
+    old = table + '_old'
+    renames = index_renames(table_indexes(cursor, table), table_indexes(cursor, staging))
+    cursor.execute(
+        "SELECT pg_get_serial_sequence(table_name, column_name) "
+        "FROM information_schema.columns "
+        "WHERE table_name = %s AND column_name = 'id'", [table])
+    row = cursor.fetchone()
+    sequence = row[0] if row else None
+    cursor.execute('ALTER TABLE {} RENAME TO {}'.format(qn(table), qn(old)))
+    cursor.execute('ALTER TABLE {} RENAME TO {}'.format(qn(staging), qn(table)))
+    if sequence is not None:
+        cursor.execute('ALTER SEQUENCE {} OWNED BY {}.id'.format(sequence, qn(table)))
+        cursor.execute("SELECT setval(%s, coalesce(max(id), 0) + 1, false) FROM {}".format(
+            qn(table)), [sequence])
+    cursor.execute('DROP TABLE {}'.format(qn(old)))
+    # The names are free once the old table is dropped
+    for name, old_name in renames:
+        cursor.execute('ALTER INDEX {} RENAME TO {}'.format(qn(name), qn(old_name)))
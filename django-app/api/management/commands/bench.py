@@ -0,0 +1,64 @@
+import json
+import resource
+from collections import OrderedDict
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from api import bench
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill the database with synthetic data at one or more scale factors, '
+        'request every endpoint and report latency percentiles, query counts '
+        'and peak memory as JSON. Run it against a scratch database, e.g. '
+        'CROPCOMPASS_DB_NAME=cropcompass_bench.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, nargs='+', default=[1], dest='scales',
+                            help='Scale factors of the synthetic data, e.g. 1 10 100 (default 1)')
+        parser.add_argument('--iterations', type=int, default=20, dest='iterations',
+                            help='Requests per endpoint (default 20)')
+        parser.add_argument('--seed', type=int, default=0, dest='seed',
+                            help='Random seed of the synthetic data')
+        parser.add_argument('--keep-cache', action='store_true', dest='keep_cache',
+                            help="Don't clear the result cache between requests")
+        parser.add_argument('--no-generate', action='store_false', dest='generate',
+                            help='Benchmark the data already in the database')
+        parser.add_argument('--replace-data', action='store_true', dest='replace_data',
+                            help='Confirm that the data of every api table may be replaced')
+        parser.add_argument('--output', dest='output',
+                            help='Write the report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        if options['generate'] and not options['replace_data']:
+            raise CommandError(
+                'Generating synthetic data replaces the data of every api table in database '
+                '"{}": pass --replace-data to confirm'.format(connection.settings_dict['NAME']))
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be at least 1')
+        runs = []
+        scales = options['scales'] if options['generate'] else [None]
+        for scale in scales:
+            run = OrderedDict([('scale', scale)])
+            if scale is not None:
+                self.stderr.write('Generating data at scale {}'.format(scale))
+                run['rows'] = bench.generate(scale, options['seed'])
+            self.stderr.write('Requesting {} URLs {} times'.format(
+                len(bench.bench_requests()), options['iterations']))
+            run['endpoints'] = bench.run(options['iterations'], options['keep_cache'])
+            runs.append(run)
+        report = OrderedDict((
+            ('database', connection.settings_dict['NAME']),
+            ('iterations', options['iterations']),
+            ('result_cache', options['keep_cache']),
+            ('runs', runs),
+            # Kilobytes on Linux
+            ('max_rss_kb', resource.getrusage(resource.RUSAGE_SELF).ru_maxrss),
+        ))
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from api.derived import rebuild_exports_rollup
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the exports_rollup table from exports_historical_cleaned. '
+        'Run it whenever exports_historical_cleaned is reloaded.'
+    )
+
+    def handle(self, *args, **options):
+        rows = rebuild_exports_rollup()
+        self.stdout.write('Built exports_rollup: {} rows'.format(rows))
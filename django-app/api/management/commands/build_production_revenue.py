@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from api.derived import rebuild_production_revenue
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the oain_production_revenue table from raw_oain_data. Run '
+        'it whenever raw_oain_data is reloaded.'
+    )
+
+    def handle(self, *args, **options):
+        rows = rebuild_production_revenue()
+        self.stdout.write('Built oain_production_revenue: {} rows'.format(rows))
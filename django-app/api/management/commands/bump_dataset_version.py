@@ -0,0 +1,36 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from api.derived import rebuild_derived
+from api.versions import bump_versions
+
+
+class Command(BaseCommand):
+    help = (
+        'Bump the version of tables after (re)loading their data, so that '
+        'cached and conditional responses computed from them expire. With '
+        '--rebuild, the tables derived from them are rebuilt as well.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('tables', nargs='*', metavar='table',
+                            help='Name of a database table, e.g. subsidy_dollars')
+        parser.add_argument('--all', action='store_true', dest='all',
+                            help='Bump the version of every table of the api app')
+        parser.add_argument('--rebuild', action='store_true', dest='rebuild',
+                            help='Rebuild the tables derived from the tables, e.g. '
+                                 'exports_rollup from exports_historical_cleaned')
+
+    def handle(self, *args, **options):
+        known = [model._meta.db_table for model in apps.get_app_config('api').get_models()]
+        tables = known if options['all'] else options['tables']
+        if not tables:
+            raise CommandError('Give the names of the tables to bump, or --all')
+        unknown = [table for table in tables if table not in known]
+        if unknown:
+            raise CommandError('Unknown tables: {}'.format(', '.join(unknown)))
+        bump_versions(tables)
+        self.stdout.write('Bumped version of {}'.format(', '.join(tables)))
+        if options['rebuild']:
+            for table in tables:
+                rebuild_derived(table)
+            self.stdout.write('Rebuilt the tables derived from {}'.format(', '.join(tables)))
@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from api.datasets import DATASETS, dataset_queryset
+from api.models import OainProductionRevenue
+from api.plans import explain, seq_scans, table_rows
+from api.reference import OREGON_FIPS
+from api.views import get_most_recent_year, grouped_query
+
+
+def hot_queries():
+    """
+    Yield (<description>, <queryset>) pairs of the queries that the
+    endpoints run on every request, with representative parameters.
+    """
+    for dataset in DATASETS.values():
+        qs = dataset_queryset(dataset)
+        year = dataset.year_field
+        value = dataset.value_field
+        latest = {year: get_most_recent_year(dataset.model, year)}
+        commodity = qs.values_list('commodity', flat=True).first()
+        yield ('{}: table by commodity'.format(dataset.name),
+               grouped_query(qs.filter(**latest), 'commodity', value))
+        yield ('{}: top commodities'.format(dataset.name),
+               grouped_query(qs.filter(**latest), 'commodity', value,
+                             order_by='-' + value, limit=5))
+        yield ('{}: commodity timeline'.format(dataset.name),
+               grouped_query(qs.filter(commodity=commodity), year, value))
+        if 'fips' in dataset.dimensions:
+            yield ('{}: county table by commodity'.format(dataset.name),
+                   grouped_query(qs.filter(fips=OREGON_FIPS, **latest), 'commodity', value))
+            yield ('{}: county timeline'.format(dataset.name),
+                   grouped_query(qs.filter(fips=OREGON_FIPS), year, value))
+            yield ('{}: top counties'.format(dataset.name),
+                   grouped_query(qs.filter(**latest).exclude(fips=OREGON_FIPS), 'fips', value,
+                                 order_by='-' + value, limit=5))
+            yield ('{}: filtered list'.format(dataset.name),
+                   qs.filter(fips=OREGON_FIPS, commodity=commodity, **latest))
+    yield ('oain_production_revenue: county',
+           OainProductionRevenue.objects.filter(county='Marion'))
+
+
+class Command(BaseCommand):
+    help = (
+        'EXPLAIN the queries the endpoints run on every request and flag '
+        'sequential scans of large tables.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-rows', type=int, default=10000, dest='min_rows',
+                            help='Tables with fewer rows may be scanned sequentially '
+                                 '(default 10000)')
+        parser.add_argument('--fail', action='store_true', dest='fail',
+                            help='Exit with an error if any sequential scan is flagged')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Query plans can only be checked on PostgreSQL')
+        queries = list(hot_queries())
+        tables = set(dataset.name for dataset in DATASETS.values())
+        tables.add(OainProductionRevenue._meta.db_table)
+        rows = table_rows(tables)
+        flagged = 0
+        for description, queryset in queries:
+            plan = explain(queryset)
+            large = [
+                table for table in seq_scans(plan)
+                if rows.get(table, 0) >= options['min_rows']
+            ]
+            if large:
+                flagged += 1
+                self.stdout.write('SEQ SCAN  {}: {} (cost {})'.format(
+                    description, ', '.join(large), plan['Total Cost']))
+            else:
+                self.stdout.write('ok        {} (cost {})'.format(
+                    description, plan['Total Cost']))
+        self.stdout.write('{} of {} queries scan large tables sequentially'.format(
+            flagged, len(queries)))
+        if flagged and options['fail']:
+            raise CommandError('Sequential scans found')
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.derived import TRADE_SOURCES, convert_trade_table
+
+
+class Command(BaseCommand):
+    help = (
+        'Convert the raw import and export tables to the typed trade_by_country '
+        'and trade_totals tables (default: all of them). Run it once after '
+        'restoring the database dumps; load_dataset converts a reloaded table.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('tables', nargs='*', metavar='table',
+                            help='Raw table: {}'.format(', '.join(TRADE_SOURCES)))
+
+    def handle(self, *args, **options):
+        tables = options['tables'] or list(TRADE_SOURCES)
+        unknown = [table for table in tables if table not in TRADE_SOURCES]
+        if unknown:
+            raise CommandError('Unknown table(s): {}'.format(', '.join(unknown)))
+        for table in tables:
+            rows = convert_trade_table(table)
+            self.stdout.write('Converted {}: {} rows'.format(table, rows))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.derived import rebuild_derived
+from api.loading import LoadError, load_table
+
+
+class Command(BaseCommand):
+    help = (
+        'Bulk load a CSV file, or the COPY block of a table in a pg_dump SQL '
+        'file, into a table of the api app with PostgreSQL COPY. The table is '
+        'swapped in atomically, so the app server can keep running. Files '
+        'that were already loaded are skipped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('table', help='Name of the table, e.g. subsidy_dollars')
+        parser.add_argument('path', help='Path of the CSV or SQL file')
+        parser.add_argument('--format', choices=('csv', 'sql'), default='csv',
+                            dest='source_format', help='Format of the file (default csv)')
+        parser.add_argument('--incremental', action='store_true', dest='incremental',
+                            help='Only append the years after the most recent year in the table')
+        parser.add_argument('--force', action='store_true', dest='force',
+                            help='Load the file even if it was loaded before')
+
+    def handle(self, *args, **options):
+        table = options['table']
+        try:
+            rows = load_table(table, options['path'],
+                              source_format=options['source_format'],
+                              incremental=options['incremental'],
+                              force=options['force'])
+        except LoadError as e:
+            raise CommandError(str(e))
+        if rows is None:
+            self.stdout.write('{} is unchanged since it was last loaded, skipped'.format(
+                options['path']))
+            return
+        rebuild_derived(table)
+        self.stdout.write('Loaded {} rows into {}'.format(rows, table))
@@ -0,0 +1,35 @@
+import os
+from django.core.management.base import BaseCommand, CommandError
+from api.process import find_processes, memory_usage
+
+MIB = 1024.0 * 1024
+
+
+class Command(BaseCommand):
+    help = (
+        'Report the private and shared memory of the uWSGI processes (or of '
+        'the processes whose command line contains --pattern), to confirm '
+        'what an additional worker costs.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pattern', default='uwsgi', dest='pattern',
+                            help='Text of the command lines of the processes (default uwsgi)')
+
+    def handle(self, *args, **options):
+        pids = [pid for pid in find_processes(options['pattern']) if pid != os.getpid()]
+        usages = [(pid, memory_usage(pid)) for pid in pids]
+        usages = [(pid, usage) for pid, usage in usages if usage is not None]
+        if not usages:
+            raise CommandError('No readable process matches "{}"'.format(options['pattern']))
+        self.stdout.write('{:>8} {:>12} {:>12} {:>12} {:>12}'.format(
+            'pid', 'private MiB', 'shared MiB', 'pss MiB', 'rss MiB'))
+        for pid, usage in usages:
+            self.stdout.write('{:>8} {:>12.1f} {:>12.1f} {:>12.1f} {:>12.1f}'.format(
+                pid, usage['private'] / MIB, usage['shared'] / MIB,
+                usage['pss'] / MIB, usage['rss'] / MIB))
+        private = [usage['private'] for pid, usage in usages]
+        self.stdout.write('Total {:.1f} MiB proportional memory; {:.1f} MiB private per process '
+                          '(mean), the cost of one more worker'.format(
+                              sum(usage['pss'] for pid, usage in usages) / MIB,
+                              sum(private) / len(private) / MIB))
@@ -0,0 +1,44 @@
+import json
+import time
+from django.core.management.base import BaseCommand, CommandError
+from api import warm
+
+
+class Command(BaseCommand):
+    help = (
+        'Request every cached endpoint for every county and the recent years, '
+        'in-process, to warm the database buffers after a deploy, and report '
+        'how long each request took. The result caches of the uWSGI workers '
+        'are not filled.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--years', type=int, default=warm.DEFAULT_YEARS, dest='years',
+                            help='Number of recent years of every dataset (default {})'.format(
+                                warm.DEFAULT_YEARS))
+        parser.add_argument('--concurrency', type=int, default=warm.DEFAULT_CONCURRENCY,
+                            dest='concurrency',
+                            help='Number of requests run at a time (default {})'.format(
+                                warm.DEFAULT_CONCURRENCY))
+        parser.add_argument('--json', action='store_true', dest='json',
+                            help='Report the timings as JSON')
+
+    def handle(self, *args, **options):
+        if options['years'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--years and --concurrency must be at least 1')
+        start = time.time()
+        results = warm.warm(options['years'], options['concurrency'])
+        elapsed = time.time() - start
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        elif options['verbosity'] > 0:
+            for result in results:
+                params = '&'.join('{}={}'.format(k, v) for k, v in sorted(result['params'].items()))
+                self.stdout.write('{:10.1f} ms  {}  {} {}'.format(
+                    result['ms'], result['status'], result['endpoint'], params))
+        failed = [result for result in results if result['status'] >= 400]
+        slowest = max(results, key=lambda result: result['ms'])
+        self.stdout.write(
+            'Warmed {} requests in {:.1f} s, {} failed; slowest {} {} in {:.1f} ms'.format(
+                len(results), elapsed, len(failed), slowest['endpoint'],
+                json.dumps(slowest['params']), slowest['ms']))
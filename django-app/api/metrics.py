@@ -0,0 +1,324 @@
+"""
+Per-view request metrics, exported in the Prometheus text format at
+/metrics/.
+
+MetricsMiddleware records, for every request, the number of SQL queries and
+the time spent in the database, in the view, in serializers and in rendering,
+and the size of the response. Queries are counted by the cursors of the
+cropcompass.db_pool backend (see cropcompass/db_pool/counting.py), including
+those run for the request by the threads of api.execution; no SQL is kept,
+and DEBUG doesn't need to be on. With other backends the database metrics
+aren't recorded.
+
+Every uWSGI process keeps its own metrics; a scrape reports the process that
+served it (see the "pid" label). That includes the connection pool statistics
+of databases using a pooling backend (cropcompass.db_pool), and the memory of
+the process and the application load time (see api.process).
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from django.db import connections
+from django.http import HttpResponse
+from .process import memory_usage, startup
+
+# Name, type and help text of the connection pool statistics, keyed on the
+# pool_stats() key
+POOL_STATS = OrderedDict((
+    ('size', ('cropcompass_db_pool_connections', 'gauge', 'Open pooled connections')),
+    ('in_use', ('cropcompass_db_pool_connections_in_use', 'gauge',
+                'Pooled connections checked out')),
+    ('checkouts', ('cropcompass_db_pool_checkouts_total', 'counter', 'Connection checkouts')),
+    ('waits', ('cropcompass_db_pool_waits_total', 'counter',
+               'Checkouts that waited for a connection')),
+    ('wait_seconds', ('cropcompass_db_pool_wait_seconds_total', 'counter',
+                      'Time spent waiting for a connection')),
+    ('timeouts', ('cropcompass_db_pool_timeouts_total', 'counter',
+                  'Checkouts that found no connection in time')),
+    ('failures', ('cropcompass_db_pool_failures_total', 'counter',
+                  'Failed connection attempts and health checks')),
+    ('opened', ('cropcompass_db_pool_opened_total', 'counter', 'Connections opened')),
+    ('closed', ('cropcompass_db_pool_closed_total', 'counter', 'Connections closed')),
+))
+
+# Name and help text of the process memory gauges, keyed on the
+# memory_usage() key
+MEMORY_GAUGES = OrderedDict((
+    ('private', ('cropcompass_process_private_memory_bytes',
+                 'Memory private to the process')),
+    ('shared', ('cropcompass_process_shared_memory_bytes',
+                'Memory shared with other processes, e.g. the uWSGI master')),
+    ('pss', ('cropcompass_process_proportional_memory_bytes',
+             'Private memory plus the share of the process in its shared memory')),
+    ('rss', ('cropcompass_process_resident_memory_bytes', 'Resident memory')),
+))
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Upper bounds of the query count histogram buckets
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# Name, help text and buckets of the histograms, keyed on the request
+# measurement they are built from
+HISTOGRAMS = OrderedDict((
+    ('duration', ('cropcompass_request_duration_seconds',
+                  'Time from the start of the view to the end of rendering', LATENCY_BUCKETS)),
+    ('db_time', ('cropcompass_db_duration_seconds',
+                 'Time spent running SQL queries per request', LATENCY_BUCKETS)),
+    ('queries', ('cropcompass_db_queries',
+                 'Number of SQL queries per request', QUERY_BUCKETS)),
+))
+
+# Name and help text of the counters, keyed on the request measurement
+COUNTERS = OrderedDict((
+    ('serializer_time', ('cropcompass_serializer_seconds_total',
+                         'Time spent in serializers')),
+    ('render_time', ('cropcompass_render_seconds_total',
+                     'Time spent rendering responses')),
+    ('response_bytes', ('cropcompass_response_bytes_total',
+                        'Size of the (non-streaming) response bodies')),
+))
+
+
+class Histogram(object):
+    """
+    Cumulative histogram of observed values, with their count and sum.
+    """
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+
+class ViewMetrics(object):
+    """
+    Metrics of all requests to a view.
+    """
+    def __init__(self):
+        self.histograms = dict(
+            (key, Histogram(buckets)) for key, (name, text, buckets) in HISTOGRAMS.items()
+        )
+        self.counters = dict((key, 0) for key in COUNTERS)
+        self.statuses = {}
+
+    def record(self, measurements, status):
+        for key, histogram in self.histograms.items():
+            if key in measurements:
+                histogram.observe(measurements[key])
+        for key in self.counters:
+            self.counters[key] += measurements[key]
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+
+
+class MetricsRegistry(object):
+    """
+    Thread-safe registry of the ViewMetrics of every view.
+    """
+    def __init__(self):
+        self.views = {}
+        self.lock = threading.Lock()
+
+    def record(self, view, measurements, status):
+        with self.lock:
+            if view not in self.views:
+                self.views[view] = ViewMetrics()
+            self.views[view].record(measurements, status)
+
+    def exposition(self):
+        """
+        Return the metrics in the Prometheus text exposition format.
+        """
+        pid = os.getpid()
+        lines = []
+        with self.lock:
+            views = sorted(self.views.items())
+            lines.append('# HELP cropcompass_requests_total Number of requests')
+            lines.append('# TYPE cropcompass_requests_total counter')
+            for view, metrics in views:
+                for status, count in sorted(metrics.statuses.items()):
+                    lines.append('cropcompass_requests_total{{pid="{}",view="{}",status="{}"}} {}'.format(
+                        pid, view, status, count))
+            for key, (name, text, buckets) in HISTOGRAMS.items():
+                lines.append('# HELP {} {}'.format(name, text))
+                lines.append('# TYPE {} histogram'.format(name))
+                for view, metrics in views:
+                    labels = 'pid="{}",view="{}"'.format(pid, view)
+                    histogram = metrics.histograms[key]
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        lines.append('{}_bucket{{{},le="{}"}} {}'.format(name, labels, bound, count))
+                    lines.append('{}_bucket{{{},le="+Inf"}} {}'.format(name, labels, histogram.count))
+                    lines.append('{}_sum{{{}}} {}'.format(name, labels, histogram.sum))
+                    lines.append('{}_count{{{}}} {}'.format(name, labels, histogram.count))
+            for key, (name, text) in COUNTERS.items():
+                lines.append('# HELP {} {}'.format(name, text))
+                lines.append('# TYPE {} counter'.format(name))
+                for view, metrics in views:
+                    lines.append('{}{{pid="{}",view="{}"}} {}'.format(
+                        name, pid, view, metrics.counters[key]))
+        lines.extend(pool_exposition(pid))
+        lines.extend(process_exposition(pid))
+        return '\n'.join(lines) + '\n'
+
+
+def pool_exposition(pid):
+    """
+    Return the exposition lines of the connection pools of this process.
+    """
+    pools = [
+        (connection.alias, connection.pool_stats()) for connection in connections.all()
+        if hasattr(connection, 'pool_stats')
+    ]
+    lines = []
+    if not pools:
+        return lines
+    for key, (name, metric_type, text) in POOL_STATS.items():
+        lines.append('# HELP {} {}'.format(name, text))
+        lines.append('# TYPE {} {}'.format(name, metric_type))
+        for alias, stats in pools:
+            lines.append('{}{{pid="{}",alias="{}"}} {}'.format(name, pid, alias, stats[key]))
+    return lines
+
+
+def process_exposition(pid):
+    """
+    Return the exposition lines of the memory of this process and of the
+    application load, if it was loaded before forking.
+    """
+    lines = []
+    usage = memory_usage()
+    if usage is not None:
+        for key, (name, text) in MEMORY_GAUGES.items():
+            lines.append('# HELP {} {}'.format(name, text))
+            lines.append('# TYPE {} gauge'.format(name))
+            lines.append('{}{{pid="{}"}} {}'.format(name, pid, usage[key]))
+    if startup:
+        lines.append('# HELP cropcompass_app_load_seconds Time taken to load the application')
+        lines.append('# TYPE cropcompass_app_load_seconds gauge')
+        lines.append('cropcompass_app_load_seconds{{pid="{}",loader_pid="{}"}} {}'.format(
+            pid, startup['pid'], startup['seconds']))
+        if startup['frozen_objects'] is not None:
+            lines.append('# HELP cropcompass_gc_frozen_objects Objects frozen by gc.freeze()')
+            lines.append('# TYPE cropcompass_gc_frozen_objects gauge')
+            lines.append('cropcompass_gc_frozen_objects{{pid="{}"}} {}'.format(
+                pid, startup['frozen_objects']))
+    return lines
+
+
+registry = MetricsRegistry()
+
+
+@contextmanager
+def timed(request, key):
+    """
+    Context manager adding the time spent in its block to the measurement key
+    ('serializer_time' or 'render_time') of the request.
+    """
+    start = time.time()
+    try:
+        yield
+    finally:
+        measurements = getattr(request, '_metrics', None)
+        if measurements is not None:
+            measurements[key] = measurements.get(key, 0) + time.time() - start
+
+
+# Queries run for the request of a thread by other threads (api.execution)
+_other_threads = threading.local()
+
+
+def query_totals():
+    """
+    Return the (<queries>, <seconds>) run so far on the connections of this
+    thread, or None if none of them counts its queries.
+    """
+    counting = [connection for connection in connections.all()
+                if hasattr(connection, 'query_count')]
+    if not counting:
+        return None
+    return (sum(connection.query_count for connection in counting),
+            sum(connection.query_seconds for connection in counting))
+
+
+def add_query_totals(totals):
+    """
+    Add the (<queries>, <seconds>) run by another thread to the request of
+    this thread.
+    """
+    if totals is not None and getattr(_other_threads, 'totals', None) is not None:
+        queries, seconds = _other_threads.totals
+        _other_threads.totals = (queries + totals[0], seconds + totals[1])
+
+
+def query_delta(start):
+    """
+    Return the (<queries>, <seconds>) run on the connections of this thread
+    since query_totals() returned start, or None.
+    """
+    end = query_totals()
+    if start is None or end is None:
+        return None
+    return (end[0] - start[0], end[1] - start[1])
+
+
+class MetricsMiddleware(object):
+    """
+    Record the metrics of every request that resolves to a named URL.
+    """
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = getattr(request, 'resolver_match', None)
+        if match is None or not match.url_name:
+            return None
+        request._metrics = {'view': match.url_name}
+        request._metrics_start = time.time()
+        request._metrics_queries = query_totals()
+        _other_threads.totals = (0, 0.0)
+        return None
+
+    def process_template_response(self, request, response):
+        # Called before a DRF response is rendered
+        if hasattr(request, '_metrics'):
+            request._metrics_render_start = time.time()
+            response.add_post_render_callback(lambda r: self.rendered(request))
+        return response
+
+    def rendered(self, request):
+        request._metrics['render_time'] = time.time() - request._metrics_render_start
+
+    def process_response(self, request, response):
+        measurements = getattr(request, '_metrics', None)
+        if measurements is None:
+            return response
+        queries = query_delta(request._metrics_queries)
+        other_threads = _other_threads.totals
+        _other_threads.totals = None
+        if queries is not None:
+            measurements.update({
+                'queries': queries[0] + other_threads[0],
+                'db_time': queries[1] + other_threads[1],
+            })
+        measurements.update({
+            'duration': time.time() - request._metrics_start,
+            'serializer_time': measurements.get('serializer_time', 0),
+            'render_time': measurements.get('render_time', 0),
+            'response_bytes': 0 if response.streaming else len(response.content),
+        })
+        registry.record(measurements['view'], measurements, response.status_code)
+        return response
+
+
+def metrics_view(request):
+    """
+    Return the metrics of this worker process in Prometheus text format.
+    """
+    return HttpResponse(registry.exposition(), content_type='text/plain; version=0.0.4')
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.5 on 2026-10-18 11:02
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_datasetversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OainProductionRevenue',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('county', models.CharField(blank=True, max_length=64, null=True)),
+                ('commodity', models.CharField(blank=True, max_length=128, null=True)),
+                ('year', models.IntegerField(blank=True, null=True)),
+                ('produced_value', models.FloatField(blank=True, null=True)),
+                ('revenue', models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'oain_production_revenue',
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='oainproductionrevenue',
+            index_together=set([('county', 'commodity', 'year')]),
+        ),
+    ]
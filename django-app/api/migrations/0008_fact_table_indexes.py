@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.5 on 2026-10-18 12:05
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# (index name, table, columns, partial index condition)
+INDEXES = [
+    ('nass_commodity_area_year_fips_commodity', 'nass_commodity_area',
+     'year, fips, commodity', 'acres IS NOT NULL'),
+    ('nass_commodity_area_fips_year', 'nass_commodity_area',
+     'fips, year', 'acres IS NOT NULL'),
+    ('nass_commodity_farms_year_fips_commodity', 'nass_commodity_farms',
+     'year, fips, commodity', 'farms IS NOT NULL'),
+    ('subsidy_dollars_year_fips_commodity', 'subsidy_dollars',
+     'year, fips, commodity', None),
+    ('subsidy_dollars_fips_year', 'subsidy_dollars',
+     'fips, year', None),
+    ('subsidy_dollars_commodity_year', 'subsidy_dollars',
+     'commodity, year', None),
+    ('subsidy_recipients_year_fips_commodity', 'subsidy_recipients',
+     'year, fips, commodity', None),
+    ('oain_harvest_acres_year_fips_commodity', 'oain_harvest_acres',
+     'year, fips, commodity', 'harvested_acres IS NOT NULL'),
+    ('nass_animals_sales_year_fips_commodity', 'nass_animals_sales',
+     'year, fips, commodity', 'animals IS NOT NULL'),
+    ('exports_historical_cleaned_year_commodity', 'exports_historical_cleaned',
+     'time_year, commodity', None),
+    ('exports_historical_cleaned_commodity_year', 'exports_historical_cleaned',
+     'commodity, time_year', None),
+]
+
+
+def create_indexes(apps, schema_editor):
+    # The fact tables are unmanaged: they are loaded from SQL dumps and don't
+    # exist in a fresh (e.g. test) database, so they are skipped if missing.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    indexed = set()
+    with schema_editor.connection.cursor() as cursor:
+        for name, table, columns, condition in INDEXES:
+            cursor.execute('SELECT to_regclass(%s)', [table])
+            if cursor.fetchone()[0] is None:
+                continue
+            sql = 'CREATE INDEX IF NOT EXISTS {} ON {} ({})'.format(name, table, columns)
+            if condition:
+                sql += ' WHERE ' + condition
+            cursor.execute(sql)
+            indexed.add(table)
+        for table in indexed:
+            cursor.execute('ANALYZE {}'.format(table))
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for name, table, columns, condition in INDEXES:
+            cursor.execute('DROP INDEX IF EXISTS {}'.format(name))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_datasetversion_checksum'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.5 on 2026-10-18 13:20
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_fact_table_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportsRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.CharField(max_length=16)),
+                ('time_year', models.IntegerField()),
+                ('time_month', models.IntegerField(blank=True, null=True)),
+                ('parent', models.CharField(blank=True, max_length=120, null=True)),
+                ('category', models.CharField(blank=True, max_length=120, null=True)),
+                ('value', models.FloatField(blank=True, null=True)),
+                ('rows', models.IntegerField()),
+            ],
+            options={
+                'db_table': 'exports_rollup',
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='exportsrollup',
+            index_together=set([('level', 'time_year'), ('level', 'category', 'time_year')]),
+        ),
+    ]
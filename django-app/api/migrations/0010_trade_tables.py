@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.5 on 2026-10-18 14:10
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_exportsrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TradeByCountry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=64)),
+                ('flow', models.CharField(max_length=8)),
+                ('country', models.CharField(blank=True, max_length=64, null=True)),
+                ('country_key', models.CharField(blank=True, max_length=64, null=True)),
+                ('commodity', models.CharField(blank=True, max_length=64, null=True)),
+                ('commodity_key', models.CharField(blank=True, max_length=64, null=True)),
+                ('year', models.IntegerField(blank=True, null=True)),
+                ('month', models.IntegerField(blank=True, null=True)),
+                ('value', models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'trade_by_country',
+            },
+        ),
+        migrations.CreateModel(
+            name='TradeTotals',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=64)),
+                ('flow', models.CharField(max_length=8)),
+                ('commodity', models.CharField(blank=True, max_length=64, null=True)),
+                ('commodity_key', models.CharField(blank=True, max_length=64, null=True)),
+                ('year', models.IntegerField(blank=True, null=True)),
+                ('month', models.IntegerField(blank=True, null=True)),
+                ('value', models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'trade_totals',
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='tradebycountry',
+            index_together=set([('flow', 'country_key', 'commodity_key', 'year'), ('flow', 'commodity_key', 'year'), ('flow', 'year'), ('source',)]),
+        ),
+        migrations.AlterIndexTogether(
+            name='tradetotals',
+            index_together=set([('source', 'commodity_key', 'year', 'month'), ('source', 'year')]),
+        ),
+    ]
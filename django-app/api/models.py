@@ -237,3 +237,102 @@ class SubsidyRecipients(models.Model):
     class Meta:
         managed = False
         db_table = 'subsidy_recipients'
+
+
+class DatasetVersion(models.Model):
+    """
+    Version of the data in a table. The version is bumped every time the
+    table is (re)loaded, see api.versions.
+    """
+    table_name = models.CharField(max_length=64, unique=True)
+    version = models.IntegerField(default=0)
+    updated = models.DateTimeField()
+    # Checksum of the file the table was last loaded from by load_dataset
+    checksum = models.CharField(max_length=64, blank=True, default='')
+
+    class Meta:
+        db_table = 'dataset_version'
+
+
+class OainProductionRevenue(models.Model):
+    """
+    Produced value and revenue in dollars, parsed from raw_oain_data by
+    api.derived.rebuild_production_revenue().
+    """
+    county = models.CharField(max_length=64, blank=True, null=True)
+    commodity = models.CharField(max_length=128, blank=True, null=True)
+    year = models.IntegerField(blank=True, null=True)
+    produced_value = models.FloatField(blank=True, null=True)
+    revenue = models.FloatField(blank=True, null=True)
+
+    class Meta:
+        db_table = 'oain_production_revenue'
+        index_together = [['county', 'commodity', 'year']]
+
+
+class ExportsRollup(models.Model):
+    """
+    Export values of exports_historical_cleaned summed per year and level:
+    the whole year, or per month, first or second level HS category or
+    commodity (see api.derived.rebuild_exports_rollup()). parent is the
+    category one level up, the hs_cat_lvl_1 of an hs_cat_lvl_2 and the
+    hs_cat_lvl_2 of a commodity.
+    """
+    level = models.CharField(max_length=16)
+    time_year = models.IntegerField()
+    time_month = models.IntegerField(blank=True, null=True)
+    parent = models.CharField(max_length=120, blank=True, null=True)
+    category = models.CharField(max_length=120, blank=True, null=True)
+    value = models.FloatField(blank=True, null=True)
+    # Number of exports_historical_cleaned rows summed
+    rows = models.IntegerField()
+
+    class Meta:
+        db_table = 'exports_rollup'
+        index_together = [['level', 'time_year'], ['level', 'category', 'time_year']]
+
+
+class TradeByCountry(models.Model):
+    """
+    Typed rows of exports_by_country_raw and imports_by_country_raw (see
+    api.derived.convert_trade_table()): the time parsed into a year and
+    month, the value into a number, and the country and commodity names
+    normalized, with lower case keys for lookups.
+    """
+    source = models.CharField(max_length=64)
+    flow = models.CharField(max_length=8)
+    country = models.CharField(max_length=64, blank=True, null=True)
+    country_key = models.CharField(max_length=64, blank=True, null=True)
+    commodity = models.CharField(max_length=64, blank=True, null=True)
+    commodity_key = models.CharField(max_length=64, blank=True, null=True)
+    year = models.IntegerField(blank=True, null=True)
+    month = models.IntegerField(blank=True, null=True)
+    value = models.FloatField(blank=True, null=True)
+
+    class Meta:
+        db_table = 'trade_by_country'
+        index_together = [
+            ['flow', 'country_key', 'commodity_key', 'year'],
+            ['flow', 'commodity_key', 'year'],
+            ['flow', 'year'],
+            ['source'],
+        ]
+
+
+class TradeTotals(models.Model):
+    """
+    Typed rows of the import and export total tables (annual and monthly
+    totals, and imports_historical_raw), like TradeByCountry without a
+    country.
+    """
+    source = models.CharField(max_length=64)
+    flow = models.CharField(max_length=8)
+    commodity = models.CharField(max_length=64, blank=True, null=True)
+    commodity_key = models.CharField(max_length=64, blank=True, null=True)
+    year = models.IntegerField(blank=True, null=True)
+    month = models.IntegerField(blank=True, null=True)
+    value = models.FloatField(blank=True, null=True)
+
+    class Meta:
+        db_table = 'trade_totals'
+        index_together = [['source', 'commodity_key', 'year', 'month'], ['source', 'year']]
@@ -0,0 +1,132 @@
+"""
+Keyset (cursor) pagination and row counting for the list views.
+
+Pages are ordered by (year, fips, commodity, id), as far as the model has
+those fields. A page is selected with a WHERE clause on the key of the last
+row of the previous page rather than with an OFFSET, so every page costs the
+same as the first one. The key is handed to the client as an opaque cursor
+token.
+
+Nulls sort last, as they do in PostgreSQL.
+"""
+
+import base64
+import json
+from functools import reduce
+from operator import or_
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+from .plans import explain
+
+KEYSET_FIELDS = ('year', 'fips', 'commodity', 'id')
+MAX_PAGE_SIZE = 10000
+COUNT_MODES = ('exact', 'estimate', 'none')
+
+
+class InvalidCursor(ValueError):
+    """
+    Raised for a cursor token that can't be decoded.
+    """
+    pass
+
+
+def default_page_size():
+    return settings.REST_FRAMEWORK.get('PAGE_SIZE') or 10
+
+
+def keyset_fields(model):
+    """
+    Return the KEYSET_FIELDS that the model has.
+    """
+    names = set(f.name for f in model._meta.fields)
+    return [field for field in KEYSET_FIELDS if field in names]
+
+
+def encode_cursor(values):
+    """
+    Return the cursor token for a list of key values.
+    """
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(token, fields):
+    """
+    Return the list of key values of a cursor token, which must hold a value
+    of each of the model fields, converted to their type.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+    except (TypeError, ValueError, UnicodeError):
+        raise InvalidCursor(token)
+    if not isinstance(values, list) or len(values) != len(fields):
+        raise InvalidCursor(token)
+    try:
+        return [field.to_python(value) for field, value in zip(fields, values)]
+    except ValidationError:
+        raise InvalidCursor(token)
+
+
+def after_key(fields, values):
+    """
+    Return a Q object selecting the rows that sort after the key values when
+    ordered by fields. Raise InvalidCursor if no row can, i.e. if the values
+    are all null.
+    """
+    clauses = []
+    same = Q()
+    for field, value in zip(fields, values):
+        if value is not None:
+            # Nulls sort after every value
+            after = Q(**{field + '__gt': value}) | Q(**{field + '__isnull': True})
+            clauses.append(same & after)
+            same &= Q(**{field: value})
+        else:
+            # Nothing sorts after a null, except in the following fields
+            same &= Q(**{field + '__isnull': True})
+    if not clauses:
+        raise InvalidCursor(values)
+    return reduce(or_, clauses)
+
+
+def keyset_page(queryset, page_size, cursor=None):
+    """
+    Return the (<rows>, <next cursor>) tuple for the page of queryset that
+    follows cursor, or the first page without a cursor. The next cursor is
+    None on the last page.
+    """
+    fields = keyset_fields(queryset.model)
+    if cursor is not None:
+        values = decode_cursor(cursor, [queryset.model._meta.get_field(field) for field in fields])
+        queryset = queryset.filter(after_key(fields, values))
+    # Fetch one extra row to find out whether there is a next page
+    rows = list(queryset.order_by(*fields)[:page_size + 1])
+    if len(rows) <= page_size:
+        return (rows, None)
+    rows = rows[:page_size]
+    last = rows[-1]
+    return (rows, encode_cursor([getattr(last, field) for field in fields]))
+
+
+def estimate_count(queryset):
+    """
+    Return the number of rows of queryset estimated by the query planner,
+    without running the query. Other databases than PostgreSQL count the
+    rows.
+    """
+    if connections[queryset.db].vendor != 'postgresql':
+        return queryset.count()
+    return int(explain(queryset.order_by().values('pk'))['Plan Rows'])
+
+
+def count_rows(queryset, mode):
+    """
+    Return the number of rows of queryset: counted, estimated, or None,
+    depending on mode, one of COUNT_MODES.
+    """
+    if mode == 'exact':
+        return queryset.count()
+    if mode == 'estimate':
+        return estimate_count(queryset)
+    return None
@@ -0,0 +1,54 @@
+"""
+Query plan inspection with PostgreSQL EXPLAIN.
+"""
+
+import json
+from django.db import connections
+
+
+def explain(queryset):
+    """
+    Return the plan of queryset as the query planner's JSON document, without
+    running the query.
+    """
+    connection = connections[queryset.db]
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    # psycopg2 only decodes the json type when it knows it
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']
+
+
+def plan_nodes(plan):
+    """
+    Yield the nodes of a plan, depth first.
+    """
+    yield plan
+    for child in plan.get('Plans', []):
+        for node in plan_nodes(child):
+            yield node
+
+
+def seq_scans(plan):
+    """
+    Return the names of the relations scanned sequentially in a plan.
+    """
+    return [
+        node['Relation Name'] for node in plan_nodes(plan)
+        if node['Node Type'] == 'Seq Scan'
+    ]
+
+
+def table_rows(tables, using='default'):
+    """
+    Return a {table: <estimated rows>} dictionary from the planner
+    statistics of tables.
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            'SELECT relname, reltuples FROM pg_class '
+            "WHERE relkind = 'r' AND relname = ANY(%s)", [list(tables)])
+        return dict((name, int(rows)) for name, rows in cursor.fetchall())
@@ -0,0 +1,85 @@
+"""
+Startup and memory figures of the processes serving the API, exported at
+/metrics/ and reported by manage.py process_memory.
+
+The memory of a process is read from /proc/<pid>/smaps_rollup (or smaps on
+older Linux kernels): its private memory is what every additional worker
+costs, its shared memory the pages it still shares copy-on-write with the
+uWSGI master and the other workers (see cropcompass.prefork). Elsewhere the
+figures are not available.
+"""
+
+import os
+
+# Fields of the smaps files summed by memory_usage(), in kB
+SMAPS_FIELDS = {
+    'Rss': 'rss',
+    'Pss': 'pss',
+    'Shared_Clean': 'shared',
+    'Shared_Dirty': 'shared',
+    'Private_Clean': 'private',
+    'Private_Dirty': 'private',
+}
+
+# Application load of the process that loaded the application before
+# forking, if any: {"seconds", "frozen_objects", "pid"}
+startup = {}
+
+
+def record_startup(seconds, frozen_objects):
+    startup.update({
+        'seconds': seconds,
+        'frozen_objects': frozen_objects,
+        'pid': os.getpid(),
+    })
+
+
+def parse_smaps(lines):
+    """
+    Return the {"rss", "pss", "shared", "private"} dictionary of the sizes
+    in bytes summed over the lines of a smaps or smaps_rollup file.
+    """
+    usage = dict((key, 0) for key in set(SMAPS_FIELDS.values()))
+    for line in lines:
+        name, _, value = line.partition(':')
+        key = SMAPS_FIELDS.get(name)
+        if key is not None:
+            usage[key] += int(value.split()[0]) * 1024
+    return usage
+
+
+def memory_usage(pid='self'):
+    """
+    Return the parse_smaps() memory usage of a process, or None if it can't
+    be read.
+    """
+    for name in ('smaps_rollup', 'smaps'):
+        try:
+            with open('/proc/{}/{}'.format(pid, name)) as f:
+                return parse_smaps(f)
+        except (IOError, OSError):
+            continue
+    return None
+
+
+def find_processes(pattern):
+    """
+    Return the sorted list of the pids of the processes whose command line
+    contains pattern.
+    """
+    pids = []
+    try:
+        entries = os.listdir('/proc')
+    except OSError:
+        return pids
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open('/proc/{}/cmdline'.format(entry), 'rb') as f:
+                cmdline = f.read().replace(b'\0', b' ').decode('utf-8', 'replace')
+        except (IOError, OSError):
+            continue
+        if pattern in cmdline:
+            pids.append(int(entry))
+    return sorted(pids)
@@ -0,0 +1,150 @@
+"""
+Reference data registry.
+
+The metadata, region lookup and crop diversity tables are small and only
+change when the SQL dumps are reloaded, so the views read them from an
+in-memory snapshot instead of the database. A snapshot is loaded in bulk,
+with one query per table, and is immutable once built. Reloading builds a
+complete new snapshot and then swaps it in with a single assignment, so a
+thread never sees a half-built lookup.
+
+A snapshot records the versions of the tables it was loaded from (see
+api.versions). The views pass the versions of their request to
+reference_data(), which reloads the snapshot when the tables have been
+bumped since, so a response is never computed from, or cached under an ETag
+that doesn't match, a stale snapshot.
+
+The snapshot is loaded on first use, or before uWSGI forks its workers (see
+cropcompass/prefork.py) to have the workers share it without paying for it
+on their first request.
+"""
+
+import threading
+from collections import OrderedDict
+from types import MappingProxyType
+from django.db import connections
+from .models import CropDiversity, Metadata, RegionLookup
+from .versions import REFERENCE_TABLES, dataset_versions
+
+# Fips of the Oregon (statewide) rows
+OREGON_FIPS = 41000
+
+METADATA_FIELDS = (
+    'name',
+    'description',
+    'table_name',
+    'unit',
+    'field',
+    'source_name',
+    'source_link'
+)
+
+_snapshot = None
+_load_lock = threading.Lock()
+
+
+def frozen(mapping):
+    """
+    Return a read-only view of a dictionary of dictionaries.
+    """
+    return MappingProxyType(OrderedDict(
+        (key, MappingProxyType(value)) for key, value in mapping.items()
+    ))
+
+
+class ReferenceData(object):
+    """
+    Immutable snapshot of the reference tables.
+
+    metadata: {table_name: {<METADATA_FIELDS>}}
+    region_to_fips: {region: {'fips': ..., 'crop diversity score': ...}}
+    fips_to_region: {fips: {'region': ..., 'crop diversity score': ...}}
+
+    versions: (<version of table> for table in REFERENCE_TABLES)
+
+    Oregon (statewide) has no crop diversity score.
+    """
+    __slots__ = ('metadata', 'region_to_fips', 'fips_to_region', 'versions')
+
+    def __init__(self, metadata, region_to_fips, fips_to_region, versions=()):
+        object.__setattr__(self, 'metadata', frozen(metadata))
+        object.__setattr__(self, 'region_to_fips', frozen(region_to_fips))
+        object.__setattr__(self, 'fips_to_region', frozen(fips_to_region))
+        object.__setattr__(self, 'versions', tuple(versions))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('ReferenceData is immutable')
+
+    @classmethod
+    def load(cls):
+        """
+        Return a new snapshot, loaded from the database. The versions are
+        read first, so a snapshot is at worst newer than its versions.
+        """
+        versions = reference_versions(dataset_versions(REFERENCE_TABLES))
+        metadata = OrderedDict()
+        for row in Metadata.objects.values(*METADATA_FIELDS):
+            metadata[row['table_name']] = OrderedDict(
+                (field, row[field]) for field in METADATA_FIELDS
+            )
+        scores = dict(CropDiversity.objects.values_list('county_name', 'diversity_score'))
+        region_to_fips = OrderedDict()
+        fips_to_region = OrderedDict()
+        for region, fips in RegionLookup.objects.values_list('region', 'fips'):
+            score = None
+            if fips != OREGON_FIPS:
+                score = scores.get(region.upper())
+                score = float(score) if score is not None else None
+            region_to_fips[region] = {'fips': fips, 'crop diversity score': score}
+            fips_to_region[fips] = {'region': region, 'crop diversity score': score}
+        return cls(metadata, region_to_fips, fips_to_region, versions)
+
+
+def reference_versions(versions):
+    """
+    Return the versions of REFERENCE_TABLES in a dataset_versions()
+    dictionary, as a tuple.
+    """
+    return tuple(versions[table][0] for table in REFERENCE_TABLES)
+
+
+def reference_data(versions=None):
+    """
+    Return the current reference data snapshot, loading it if necessary.
+
+    If versions, a dataset_versions() dictionary that includes
+    REFERENCE_TABLES, is given, the snapshot is reloaded if it was loaded at
+    other versions of the tables.
+    """
+    wanted = reference_versions(versions) if versions is not None else None
+    snapshot = _snapshot
+    if snapshot is not None and (wanted is None or snapshot.versions == wanted):
+        return snapshot
+    with _load_lock:
+        snapshot = _snapshot
+        if snapshot is None or (wanted is not None and snapshot.versions != wanted):
+            snapshot = reload_reference_data()
+    return snapshot
+
+
+def reload_reference_data():
+    """
+    Load a new reference data snapshot from the database and swap it in.
+    Return the new snapshot.
+    """
+    global _snapshot
+    snapshot = ReferenceData.load()
+    _snapshot = snapshot
+    return snapshot
+
+
+def close_connections():
+    """
+    Close the database connections of this process, including those a
+    pooling backend keeps open in its pool.
+    """
+    for connection in connections.all():
+        connection.close()
+        close_pool = getattr(connection, 'close_pool', None)
+        if close_pool is not None:
+            close_pool()
@@ -0,0 +1,142 @@
+"""
+Streaming output for the list views.
+
+Rows are read from the database in chunks through a server-side (named)
+cursor and written out as they arrive, so the memory used by a response
+does not depend on the number of rows. Three formats are supported:
+
+json    the usual {"error": ..., "rows": ..., "data": [...]} envelope
+ndjson  one JSON object per line, one line per row
+csv     a header line with the field names, then one line per row
+"""
+
+import csv
+from decimal import Decimal
+from uuid import uuid4
+from django.db import connections, transaction
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+# Number of rows fetched from the server-side cursor at a time
+STREAM_CHUNK_SIZE = 2000
+
+STREAM_CONTENT_TYPES = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def iter_row_chunks(queryset, fields, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Yield lists of (up to chunk_size) value tuples of fields for the rows of
+    queryset.
+
+    On PostgreSQL the rows are read through a server-side cursor, inside a
+    transaction as named cursors require.
+    """
+    qs = queryset.values_list(*fields)
+    connection = connections[qs.db]
+    if connection.vendor != 'postgresql':
+        chunk = []
+        for row in qs.iterator():
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+        return
+    sql, params = qs.query.sql_with_params()
+    with transaction.atomic(using=qs.db):
+        cursor = connection.connection.cursor(name='stream_' + uuid4().hex)
+        cursor.itersize = chunk_size
+        try:
+            cursor.execute(sql, params)
+            while True:
+                chunk = cursor.fetchmany(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            cursor.close()
+
+
+def plain_value(value):
+    """
+    Convert a database value the way the list serializers do: decimals are
+    rendered as strings.
+    """
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def json_chunks(chunks, fields, rows):
+    """
+    Yield the {"error", "rows", "data"} JSON envelope piece by piece.
+    """
+    encoder = JSONEncoder()
+    yield '{{"error": null, "rows": {}, "data": ['.format(encoder.encode(rows))
+    separator = ''
+    for chunk in chunks:
+        # An empty chunk would leave a dangling separator
+        if not chunk:
+            continue
+        yield separator + ', '.join(
+            encoder.encode(dict(zip(fields, map(plain_value, row))))
+            for row in chunk
+        )
+        separator = ', '
+    yield ']}'
+
+
+def ndjson_chunks(chunks, fields):
+    """
+    Yield one JSON object per row, each on its own line.
+    """
+    encoder = JSONEncoder()
+    for chunk in chunks:
+        yield ''.join(
+            encoder.encode(dict(zip(fields, map(plain_value, row)))) + '\n'
+            for row in chunk
+        )
+
+
+class LineBuffer(object):
+    """
+    File-like object for csv.writer that hands back what is written to it.
+    """
+    def write(self, value):
+        return value
+
+
+def csv_chunks(chunks, fields):
+    """
+    Yield a CSV header line, then the rows.
+    """
+    writer = csv.writer(LineBuffer())
+    yield writer.writerow(fields)
+    for chunk in chunks:
+        yield ''.join(writer.writerow(row) for row in chunk)
+
+
+def stream_response(queryset, fields, stream_format, filename, rows=None):
+    """
+    Return a StreamingHttpResponse with the fields of queryset rows in
+    stream_format, one of the STREAM_CONTENT_TYPES keys.
+
+    rows is the row count reported in the JSON envelope.
+    """
+    chunks = iter_row_chunks(queryset, fields)
+    if stream_format == 'json':
+        content = json_chunks(chunks, fields, rows)
+    elif stream_format == 'ndjson':
+        content = ndjson_chunks(chunks, fields)
+    else:
+        content = csv_chunks(chunks, fields)
+    response = StreamingHttpResponse(
+        content, content_type=STREAM_CONTENT_TYPES[stream_format])
+    if stream_format == 'csv':
+        response['Content-Disposition'] = 'attachment; filename="{}.csv"'.format(filename)
+    return response
@@ -1,18 +1,69 @@
-from django.test import RequestFactory, TestCase
+from decimal import Decimal
+import io
+import json
+import os
+import tempfile
+import threading
+from importlib import import_module
+from unittest import mock, skipIf
+from django.apps import apps
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection, models
+from django.db.backends.sqlite3 import base as sqlite3_base
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
 from django.http import QueryDict
+from cropcompass.db_pool.counting import QueryCountingMixin
+from cropcompass.db_pool.pool import ConnectionPool, PoolTimeout, close_pools, get_pool
 from .models import (
+    CropDiversity,
+    ExportsRollup,
+    ImportsHistoricalRaw,
     Metadata,
     NassAnimalsSales,
+    NassCommodityArea,
+    NassCommodityFarms,
     SubsidyDollars,
     RegionLookup,
 )
+from .pagination import (
+    InvalidCursor,
+    after_key,
+    count_rows,
+    decode_cursor,
+    encode_cursor,
+    keyset_page,
+)
+from .loading import CopyBlock, LoadError, index_renames, load_table, sql_copy_source, table_indexes
+from .derived import (
+    canonical_commodity,
+    convert_trade_table,
+    normalize_name,
+    parse_dollars,
+    parse_period,
+    rollup,
+)
+from .plans import explain, plan_nodes
+from .reference import ReferenceData, reload_reference_data
+from .versions import bump_versions, dataset_versions, etag_matches
+from .streaming import csv_chunks, iter_row_chunks, json_chunks, ndjson_chunks
+from .batch import BatchError, dispatch, parse_entries
+from .binary import UNAVAILABLE_FORMATS, msgpack
+from .bench import batches, bench_requests, create_table, unconstrained_decimal
+from .cache import ResultCache, result_cache
+from .columnar import columnar_data
+from .columnstore import ColumnTable, UnsupportedFilter, column_store
+from .commodities import CommodityIndex
+from .datasets import DATASETS
+from .execution import run_concurrently
+from .warm import warm_requests, warmed_endpoints
+from .process import parse_smaps
 from .views import (
-    METADATA_FIELDS,
-    metadata_dict,
-    region_to_fips,
-    fetch_metadata,
+    CountyStatisticsList,
     get_most_recent_year,
-    fetch_region_lookup,
+    mean_stddev,
+    grade,
+    grade_all,
     FilteredAPIView,
     SubsidyDollarsList,
     SubsidyDollarsTable
@@ -52,6 +103,419 @@ class TestFilteredAPIView(TestCase):
         self.assertNotIn('bobcat__in', query)
 
 
+class TestGrading(TestCase):
+
+    def setUp(self):
+        self.items = [1.0, 2.0, 2.0, 3.0, 3.0, 3.0, 4.0, 4.0, 5.0, 40.0, -30.0]
+
+    def test_mean_stddev_population(self):
+        mean, stddev = mean_stddev([2, 4, 4, 4, 5, 5, 7, 9])
+        self.assertAlmostEqual(5.0, mean)
+        self.assertAlmostEqual(2.0, stddev)
+
+    def test_grade_all_matches_grade(self):
+        mean, stddev = mean_stddev(self.items)
+        expected = [grade(mean, stddev, item) for item in self.items]
+        self.assertListEqual(expected, grade_all(mean, stddev, self.items))
+
+    def test_grade_all_zero_stddev(self):
+        self.assertListEqual(['very high', 'very high'], grade_all(3.0, 0.0, [3.0, 3.0]))
+
+
+class TestReferenceData(TestCase):
+
+    def setUp(self):
+        self.ref = ReferenceData(
+            {'subsidy_dollars': {'unit': 'dollars'}},
+            {'Linn': {'fips': 41043, 'crop diversity score': 2.5}},
+            {41043: {'region': 'Linn', 'crop diversity score': 2.5}},
+        )
+
+    def test_lookups(self):
+        self.assertEqual(41043, self.ref.region_to_fips['Linn']['fips'])
+        self.assertEqual('Linn', self.ref.fips_to_region[41043]['region'])
+        self.assertEqual('dollars', self.ref.metadata['subsidy_dollars']['unit'])
+
+    def test_snapshot_is_immutable(self):
+        with self.assertRaises(AttributeError):
+            self.ref.metadata = {}
+        with self.assertRaises(TypeError):
+            self.ref.region_to_fips['Benton'] = {}
+        with self.assertRaises(TypeError):
+            self.ref.fips_to_region[41043]['region'] = 'Benton'
+
+
+class TestResultCache(TestCase):
+
+    def setUp(self):
+        self.cache = ResultCache(max_bytes=250)
+        self.value = {'data': list(range(40))}
+
+    def test_get_returns_copy_of_value(self):
+        self.cache.set('a', self.value)
+        self.assertEqual(self.value, self.cache.get('a'))
+        self.assertIsNot(self.value, self.cache.get('a'))
+
+    def test_evicts_least_recently_used(self):
+        self.cache.set('a', self.value)
+        self.cache.set('b', self.value)
+        self.cache.get('a')
+        self.cache.set('c', self.value)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertIsNotNone(self.cache.get('a'))
+        self.assertEqual(1, self.cache.stats()['evictions'])
+        self.assertLessEqual(self.cache.stats()['bytes'], 250)
+
+    def test_skips_values_larger_than_cache(self):
+        self.cache.set('a', {'data': list(range(1000))})
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(0, self.cache.stats()['entries'])
+
+
+class TestOainParsing(TestCase):
+
+    def test_canonical_commodity(self):
+        self.assertEqual('Apples', canonical_commodity('TREE FRUIT - APPLES'))
+        self.assertEqual('Wheat', canonical_commodity('GRAINS - WHEAT - WINTER'))
+        self.assertEqual('Hops', canonical_commodity('HOPS'))
+
+    def test_parse_dollars(self):
+        self.assertEqual(1234567.5, parse_dollars('$1,234,567.5'))
+        self.assertIsNone(parse_dollars(None))
+        self.assertIsNone(parse_dollars('(D)'))
+
+
+class TestLoading(TestCase):
+
+    def test_sql_copy_source(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.sql', delete=False) as dump:
+            dump.write('COPY public.region_lookup (state, region, fips) FROM stdin;\n'
+                       'OR\tBaker\t41001\n'
+                       '\\.\n'
+                       'COPY public.metadata (name) FROM stdin;\n')
+        self.addCleanup(os.remove, dump.name)
+        columns, source, options = sql_copy_source(dump.name, 'region_lookup')
+        self.assertEqual(['state', 'region', 'fips'], columns)
+        self.assertEqual('OR\tBaker\t41001\n', source.read())
+        source.close()
+        with self.assertRaises(LoadError):
+            sql_copy_source(dump.name, 'crop_diversity')
+
+    def test_index_renames(self):
+        old = {
+            'nass_commodity_area_pkey':
+                'CREATE UNIQUE INDEX nass_commodity_area_pkey ON public.nass_commodity_area '
+                'USING btree (id)',
+            'nass_commodity_area_fips_year':
+                'CREATE INDEX nass_commodity_area_fips_year ON public.nass_commodity_area '
+                'USING btree (fips, year) WHERE (acres IS NOT NULL)',
+        }
+        new = {
+            'nass_commodity_area_staging_pkey':
+                'CREATE UNIQUE INDEX nass_commodity_area_staging_pkey ON '
+                'public.nass_commodity_area_staging USING btree (id)',
+            'nass_commodity_area_staging_fips_year_idx':
+                'CREATE INDEX nass_commodity_area_staging_fips_year_idx ON '
+                'public.nass_commodity_area_staging USING btree (fips, year) '
+                'WHERE (acres IS NOT NULL)',
+        }
+        self.assertEqual([
+            ('nass_commodity_area_staging_fips_year_idx', 'nass_commodity_area_fips_year'),
+            ('nass_commodity_area_staging_pkey', 'nass_commodity_area_pkey'),
+        ], index_renames(old, new))
+
+
+class CountingSQLiteWrapper(QueryCountingMixin, sqlite3_base.DatabaseWrapper):
+    pass
+
+
+class TestQueryCounting(SimpleTestCase):
+
+    def test_cursors_count_queries(self):
+        wrapper = CountingSQLiteWrapper(dict(connection.settings_dict, NAME=':memory:'), 'counting')
+        try:
+            with wrapper.cursor() as cursor:
+                cursor.execute('CREATE TABLE counted (id integer)')
+                cursor.executemany('INSERT INTO counted VALUES (%s)', [(1,), (2,)])
+            wrapper.force_debug_cursor = True
+            with wrapper.cursor() as cursor:
+                cursor.execute('SELECT count(*) FROM counted')
+        finally:
+            wrapper.close()
+        self.assertEqual(3, wrapper.query_count)
+        self.assertGreaterEqual(wrapper.query_seconds, 0)
+        self.assertEqual(1, len(wrapper.queries_log))
+
+
+class TestExportsRollup(TestCase):
+
+    def test_rollup_levels(self):
+        row = {'time_year': 2016, 'time_month': 3, 'hs_cat_lvl_1': 'Food',
+               'hs_cat_lvl_2': 'Grains', 'commodity': 'Wheat',
+               'total': Decimal('12.50'), 'count': 4}
+        month = rollup('month', row)
+        self.assertEqual((2016, 3, None, None, 12.5, 4),
+                         (month.time_year, month.time_month, month.parent,
+                          month.category, month.value, month.rows))
+        commodity = rollup('commodity', dict(row, total=None))
+        self.assertEqual((None, 'Grains', 'Wheat', None),
+                         (commodity.time_month, commodity.parent, commodity.category,
+                          commodity.value))
+
+
+class TestTradeParsing(TestCase):
+
+    def test_parse_period(self):
+        self.assertEqual((2015, None), parse_period('2015'))
+        for text in ('2015-03', '2015M03', '03/2015', 'Mar 2015', 'march 2015', '2015-03-01'):
+            self.assertEqual((2015, 3), parse_period(text))
+        self.assertEqual((None, None), parse_period(None))
+        self.assertEqual((None, None), parse_period('n/a'))
+
+    def test_normalize_name(self):
+        self.assertEqual(('South Korea', 'south korea'), normalize_name('  South   Korea '))
+        self.assertEqual((None, None), normalize_name(''))
+
+
+class TestCommodityIndex(TestCase):
+
+    def setUp(self):
+        self.index = CommodityIndex((), [
+            ('subsidy_dollars', 'Wheat', 2014),
+            ('subsidy_dollars', 'WHEAT ', 2015),
+            ('exports_historical_cleaned', 'Wheat', 2016),
+            ('nass_commodity_area', 'Winter Wheat', 2012),
+            ('nass_commodity_area', 'Wheatgrass Seed', 2012),
+            ('nass_commodity_area', 'Hay', 2012),
+        ])
+
+    def search(self, query, **kwargs):
+        return [(row['commodity'], row['match']) for row in self.index.search(query, **kwargs)]
+
+    def test_ranking(self):
+        self.assertEqual(4, len(self.index))
+        self.assertEqual([('Wheat', 'exact'), ('Wheatgrass Seed', 'prefix'), ('Winter Wheat', 'word')],
+                         self.search(' wheat'))
+        self.assertEqual([('Wheat', 'prefix'), ('Wheatgrass Seed', 'prefix')], self.search('whe', limit=2))
+        self.assertEqual([('Wheat', 'similar')], self.search('wheet', limit=1))
+        self.assertEqual([('Wheatgrass Seed', 'prefix'), ('Winter Wheat', 'word')],
+                         self.search('wheat', tables=['nass_commodity_area']))
+
+    def test_datasets_and_years(self):
+        datasets = self.index.search('wheat', limit=1)[0]['datasets']
+        self.assertEqual([{'dataset': 'subsidy_dollars', 'years': [2014, 2015]},
+                          {'dataset': 'exports_historical_cleaned', 'years': [2016]}],
+                         [dict(dataset) for dataset in datasets])
+
+
+class TestBench(TestCase):
+
+    def test_every_endpoint_is_benchmarked(self):
+        urlpatterns = import_module(settings.ROOT_URLCONF).urlpatterns
+        names = set(getattr(pattern, 'name', None) for pattern in urlpatterns)
+        names.discard(None)
+        self.assertEqual(names, set(name for name, url, body in bench_requests()))
+
+    def test_batches(self):
+        self.assertEqual([5000, 5000, 1], [len(batch) for batch in batches(range(10001))])
+        self.assertEqual([], list(batches([])))
+
+    def test_unconstrained_decimal(self):
+        self.assertTrue(unconstrained_decimal(models.DecimalField(max_digits=65535, decimal_places=65535)))
+        self.assertFalse(unconstrained_decimal(NassCommodityArea._meta.get_field('acres')))
+
+
+class TestWarm(TestCase):
+
+    def test_every_cached_endpoint_is_warmed(self):
+        # The fact tables are unmanaged: no test database has them
+        requests = warm_requests(counties=['Linn'], oain_counties=['MARION'],
+                                 dataset_years=dict((name, ['2014']) for name in DATASETS))
+        self.assertEqual(set(warmed_endpoints()), set(endpoint for endpoint, params in requests))
+        for endpoint in ('subsidy_dollars_table', 'timeline', 'top', 'production_and_revenue'):
+            self.assertIn(endpoint, warmed_endpoints())
+        for endpoint in ('subsidy_dollars_data', 'metadata', 'commodity_search', 'batch', 'metrics'):
+            self.assertNotIn(endpoint, warmed_endpoints())
+        self.assertIn(('subsidy_dollars_table', {'county': 'Linn'}), requests)
+        self.assertIn(('county_stats', {'year': '2014'}), requests)
+        self.assertIn(('production_and_revenue', {'county': 'MARION'}), requests)
+        self.assertNotIn(('production_and_revenue', {'county': 'Linn'}), requests)
+
+
+class TestColumnar(TestCase):
+
+    def test_columnar_data(self):
+        data = columnar_data({'error': None, 'data': [
+            {'commodity': 'Hops', 'acres': Decimal('1.50')},
+            {'commodity': 'Wheat', 'acres': None},
+        ]})
+        self.assertEqual(['commodity', 'acres'], data['columns'])
+        self.assertEqual({'commodity': ['Hops', 'Wheat'], 'acres': [Decimal('1.50'), None]},
+                         data['data'])
+        self.assertIsNone(data['error'])
+
+    def test_columnar_data_without_rows(self):
+        self.assertEqual({'columns': [], 'data': {}}, columnar_data({'data': []}))
+        self.assertEqual({'data': {'a': 1}}, columnar_data({'data': {'a': 1}}))
+
+
+class TestColumnTable(TestCase):
+
+    def setUp(self):
+        self.columns = ColumnTable(
+            DATASETS['subsidy_dollars'], 1,
+            year=[2012, 2013, 2013, 2013],
+            fips=[41001, 41001, 41003, 41003],
+            commodity=['Wheat', 'Wheat', 'Hay', 'Oats'],
+            values=[10, 20, 5, None])
+
+    def test_aggregate_by(self):
+        mask = self.columns.select(year=2013)
+        self.assertEqual([{'fips': 41001, 'subsidy_dollars': 20},
+                          {'fips': 41003, 'subsidy_dollars': 5}],
+                         self.columns.aggregate_by(mask, 'fips'))
+        self.assertEqual([{'commodity': 'Hay', 'subsidy_dollars': 5},
+                          {'commodity': 'Oats', 'subsidy_dollars': None},
+                          {'commodity': 'Wheat', 'subsidy_dollars': 20}],
+                         self.columns.aggregate_by(mask, 'commodity'))
+        self.assertEqual([{'commodity': 'Wheat', 'subsidy_dollars': 30}],
+                         self.columns.aggregate_by(self.columns.select(), 'commodity',
+                                                   order_by='-subsidy_dollars', limit=1))
+
+    def test_select(self):
+        mask = self.columns.select(valid_only=True, exclude={'fips': 41001},
+                                   commodity__in=['Hay', 'Oats', 'Rye'])
+        self.assertEqual([False, False, True, False], mask.tolist())
+        self.assertEqual(2013, self.columns.most_recent_year())
+        with self.assertRaises(UnsupportedFilter):
+            self.columns.select(subsidy_dollars__in=[5])
+
+
+class TestBatchEntries(TestCase):
+
+    def test_parse_entries(self):
+        entries = parse_entries([
+            {'id': 'stats', 'endpoint': 'county_stats'},
+            {'endpoint': 'subsidy_dollars_table', 'params': {'county': 'Linn'}},
+        ])
+        self.assertEqual([
+            ('stats', 'county_stats', {}),
+            ('1', 'subsidy_dollars_table', {'county': 'Linn'}),
+        ], entries)
+
+    def test_invalid_entries(self):
+        for entries in ([], {'endpoint': 'metadata'}, [{'params': {}}],
+                        [{'endpoint': 'metadata', 'params': 'year=2012'}],
+                        [{'id': 'a', 'endpoint': 'metadata'}, {'id': 'a', 'endpoint': 'metadata'}]):
+            with self.assertRaises(BatchError):
+                parse_entries(entries)
+
+    def test_view_exception_is_the_entry_status(self):
+        def view(request):
+            raise KeyError('Nowhere')
+        sub = RequestFactory().get('/table/subsidy_dollars/', {'county': 'Nowhere'})
+        with self.assertLogs('api.batch', 'ERROR'):
+            result = dispatch(view, sub)
+        self.assertEqual(500, result['status'])
+        self.assertEqual('Internal error: KeyError', result['data']['error'])
+
+
+class TestRunConcurrently(SimpleTestCase):
+    """
+    Not a TestCase: inside its transaction the functions would run serially.
+    """
+
+    @override_settings(QUERY_MAX_WORKERS=2)
+    def test_results_in_order(self):
+        self.assertEqual([1, 2, 3], run_concurrently([lambda: 1, lambda: 2, lambda: 3]))
+
+    @override_settings(QUERY_MAX_WORKERS=2)
+    def test_functions_run_in_pool_threads(self):
+        threads = run_concurrently([threading.current_thread, threading.current_thread])
+        self.assertNotIn(threading.current_thread(), threads)
+
+    @override_settings(QUERY_MAX_WORKERS=2)
+    def test_exception_is_raised(self):
+        def fail():
+            raise KeyError('fips')
+        with self.assertRaises(KeyError):
+            run_concurrently([lambda: 1, fail])
+
+
+class TestProcessMemory(TestCase):
+
+    def test_parse_smaps(self):
+        usage = parse_smaps([
+            'Rss:                 100 kB',
+            'Pss:                  60 kB',
+            'Shared_Clean:         50 kB',
+            'Shared_Dirty:         10 kB',
+            'Private_Clean:         5 kB',
+            'Private_Dirty:        35 kB',
+            'Swap:                  0 kB',
+        ])
+        self.assertEqual({'rss': 102400, 'pss': 61440, 'shared': 61440, 'private': 40960}, usage)
+
+
+class FakeConnection(object):
+
+    def __init__(self):
+        self.healthy = True
+        self.closed = False
+
+
+def check_fake(connection):
+    if not connection.healthy:
+        raise ValueError('unhealthy')
+
+
+class TestConnectionPool(TestCase):
+
+    def setUp(self):
+        self.pool = ConnectionPool(check_fake, lambda c: setattr(c, 'closed', True),
+                                   min_size=0, max_size=2, timeout=0.01)
+
+    def test_reuse(self):
+        connection = self.pool.checkout(FakeConnection)
+        self.pool.checkin(connection)
+        self.assertIs(connection, self.pool.checkout(FakeConnection))
+        stats = self.pool.stats()
+        self.assertEqual((2, 1, 1), (stats['checkouts'], stats['opened'], stats['in_use']))
+
+    def test_timeout(self):
+        self.pool.checkout(FakeConnection)
+        self.pool.checkout(FakeConnection)
+        with self.assertRaises(PoolTimeout):
+            self.pool.checkout(FakeConnection)
+        stats = self.pool.stats()
+        self.assertEqual((1, 1), (stats['waits'], stats['timeouts']))
+
+    def test_unhealthy_and_expired_connections_are_replaced(self):
+        connection = self.pool.checkout(FakeConnection)
+        connection.healthy = False
+        self.pool.checkin(connection)
+        replacement = self.pool.checkout(FakeConnection)
+        self.assertTrue(connection.closed)
+        self.pool.max_age = 0
+        replacement.pool_created -= 1
+        self.pool.checkin(replacement)
+        self.assertTrue(replacement.closed)
+        stats = self.pool.stats()
+        self.assertEqual((0, 2, 1), (stats['size'], stats['closed'], stats['failures']))
+
+    def test_pools_are_keyed_on_connection_parameters(self):
+        create = lambda: ConnectionPool(check_fake, lambda c: setattr(c, 'closed', True))
+        main = get_pool(('fake', 'vagrant'), create)
+        self.assertIs(main, get_pool(('fake', 'vagrant'), create))
+        test = get_pool(('fake', 'test_vagrant'), create)
+        self.assertIsNot(main, test)
+        connection = test.checkout(FakeConnection)
+        test.checkin(connection)
+        close_pools('fake')
+        self.assertTrue(connection.closed)
+        self.assertEqual(0, test.stats()['idle'])
+
+
 class BaseViewTestCase(TestCase):
 
     def setUp(self):
@@ -63,3 +527,673 @@ class TestSubsidyDollarsList(BaseViewTestCase):
     def setUp(self):
         # Call BaseViewTestCase.setUp()
         super(TestFilteredAPIView, self).setUp()
+
+
+class FactTablesTestCase(TestCase):
+    """
+    TestCase with the unmanaged tables created in the test database, which
+    migrate leaves out, and reference data for three counties. The result
+    cache and the reference data snapshot are reset for every test.
+    """
+
+    @classmethod
+    def unmanaged_models(cls):
+        return [model for model in apps.get_app_config('api').get_models()
+                if not model._meta.managed]
+
+    @classmethod
+    def setUpClass(cls):
+        # Created before the class transaction, which setUpTestData runs in
+        with connection.schema_editor() as editor:
+            for model in cls.unmanaged_models():
+                create_table(editor, model)
+        super(FactTablesTestCase, cls).setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super(FactTablesTestCase, cls).tearDownClass()
+        with connection.schema_editor() as editor:
+            for model in cls.unmanaged_models():
+                editor.delete_model(model)
+
+    @classmethod
+    def setUpTestData(cls):
+        Metadata.objects.create(name='Subsidy dollars', table_name='subsidy_dollars', unit='dollars')
+        Metadata.objects.create(name='Commodity area', table_name='nass_commodity_area', unit='acres')
+        for region, fips in (('Oregon', 41000), ('Baker', 41001), ('Benton', 41003), ('Linn', 41043)):
+            RegionLookup.objects.create(state='OR', region=region, fips=fips)
+        for county_name, score in (('BAKER', '1.5'), ('BENTON', '2.5'), ('LINN', '3.5')):
+            CropDiversity.objects.create(county_name=county_name, diversity_score=score)
+
+    def setUp(self):
+        result_cache.clear()
+        reload_reference_data()
+
+    def get_json(self, path, **params):
+        response = self.client.get(path, dict(params, format='json'))
+        self.assertEqual(200, response.status_code, response.content)
+        return response.json()
+
+
+class TestTableViews(FactTablesTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super(TestTableViews, cls).setUpTestData()
+        for year, fips, commodity, dollars in (
+                (2013, 41000, 'Wheat', 300), (2013, 41000, 'Hay', 100),
+                (2013, 41043, 'Wheat', 200), (2013, 41003, 'Wheat', 100),
+                (2013, 41003, 'Hay', None), (2013, 41001, 'Oats', 50),
+                (2012, 41043, 'Wheat', 900)):
+            SubsidyDollars.objects.create(year=year, fips=fips, commodity=commodity,
+                                          subsidy_dollars=dollars)
+        for year, fips, commodity, acres in (
+                (2012, 41043, 'Wheat', '10.50'), (2012, 41003, 'Wheat', '4.00'),
+                (2012, 41043, 'Hay', '2.25'), (2012, 41043, 'Oats', None),
+                (2012, 41043, 'Total Acres', '12.75'), (2007, 41043, 'Wheat', '99.00')):
+            NassCommodityArea.objects.create(year=year, fips=fips, commodity=commodity,
+                                             acres=acres)
+
+    def test_commodity_area_table(self):
+        data = self.get_json('/table/commodity_area/')
+        self.assertEqual((2012, 'Oregon (Statewide)'), (data['year'], data['region']))
+        self.assertEqual([{'commodity': 'Hay', 'acres': 2.25},
+                          {'commodity': 'Wheat', 'acres': 14.5}], data['data'])
+        self.assertEqual(16.75, data['total_acres'])
+        data = self.get_json('/table/commodity_area/', county='Benton')
+        self.assertEqual([{'commodity': 'Wheat', 'acres': 4.0}], data['data'])
+        self.assertEqual(4.0, data['total_acres'])
+
+    def test_subsidy_dollars_table(self):
+        data = self.get_json('/table/subsidy_dollars/')
+        # The keys of the response before the GROUP BY rewrite
+        self.assertEqual({'error', 'unit', 'year', 'description', 'data', 'rows', 'region'},
+                         set(data))
+        self.assertEqual([{'commodity': 'Hay', 'subsidy_dollars': 100},
+                          {'commodity': 'Wheat', 'subsidy_dollars': 300}], data['data'])
+        self.assertEqual((2013, 2, 'dollars'), (data['year'], data['rows'], data['unit']))
+        data = self.get_json('/table/subsidy_dollars/', county='benton')
+        self.assertEqual([{'commodity': 'Hay', 'subsidy_dollars': None},
+                          {'commodity': 'Wheat', 'subsidy_dollars': 100}], data['data'])
+        self.assertEqual('benton', data['region'])
+
+    def test_top_five_views(self):
+        data = self.get_json('/table/subsidy_dollars_top5fips/')
+        self.assertEqual([{'Oregon': 400, 'Linn': 200, 'Benton': 100, 'Baker': 50}],
+                         data['data'])
+        data = self.get_json('/table/subsidy_dollars_top5crops/')
+        self.assertEqual([{'Wheat': 600, 'Hay': 100, 'Oats': 50}], data['data'])
+
+    def test_query_count_does_not_grow_with_commodities(self):
+        with self.assertNumQueries(3):
+            self.client.get('/table/subsidy_dollars/', {'format': 'json'})
+        for number in range(20):
+            SubsidyDollars.objects.create(year=2013, fips=41000, commodity='Crop {}'.format(number),
+                                          subsidy_dollars=number)
+        result_cache.clear()
+        with self.assertNumQueries(3):
+            self.client.get('/table/subsidy_dollars/', {'format': 'json'})
+
+
+class TestTimelineView(FactTablesTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super(TestTimelineView, cls).setUpTestData()
+        for year, fips, commodity, dollars in (
+                (2010, 41043, 'Wheat', 10), (2010, 41043, 'Hay', 5),
+                (2012, 41043, 'Wheat', 20), (2012, 41003, 'Wheat', 7),
+                (2013, 41003, 'Hay', 3), (2013, 41043, 'Hay', None)):
+            SubsidyDollars.objects.create(year=year, fips=fips, commodity=commodity,
+                                          subsidy_dollars=dollars)
+
+    def test_single_series_skips_missing_years(self):
+        data = self.get_json('/table/timeline/', dataset='subsidy_dollars')
+        self.assertIsNone(data['series'])
+        self.assertEqual([{'name': 'All', 'rows': 3, 'data': [
+            {'year': 2010, 'subsidy_dollars': 15},
+            {'year': 2012, 'subsidy_dollars': 27},
+            {'year': 2013, 'subsidy_dollars': 3},
+        ]}], data['data'])
+
+    def test_series_per_county(self):
+        response = self.client.get('/table/timeline/?dataset=subsidy_dollars&format=json'
+                                   '&county=Linn&county=Benton&commodity=Wheat')
+        data = response.json()
+        self.assertEqual(('county', 2), (data['series'], data['rows']))
+        self.assertEqual({
+            'Benton': [{'year': 2012, 'subsidy_dollars': 7}],
+            'Linn': [{'year': 2010, 'subsidy_dollars': 10}, {'year': 2012, 'subsidy_dollars': 20}],
+        }, dict((series['name'], series['data']) for series in data['data']))
+
+    def test_series_per_commodity(self):
+        response = self.client.get('/table/timeline/?dataset=subsidy_dollars&format=json'
+                                   '&commodity=Hay&commodity=Wheat')
+        data = response.json()
+        self.assertEqual('commodity', data['series'])
+        self.assertEqual(['Hay', 'Wheat'], [series['name'] for series in data['data']])
+        self.assertEqual([{'year': 2010, 'subsidy_dollars': 5}, {'year': 2013, 'subsidy_dollars': 3}],
+                         data['data'][0]['data'])
+
+    def test_invalid_parameters(self):
+        for params in ({}, {'dataset': 'nowhere'}, {'dataset': 'subsidy_dollars', 'county': 'Nowhere'}):
+            response = self.client.get('/table/timeline/', dict(params, format='json'))
+            self.assertEqual(400, response.status_code)
+            self.assertEqual([], response.json()['data'])
+        self.assertIn('Nowhere', response.json()['error'])
+
+    def test_bumped_reference_tables_are_reloaded(self):
+        self.get_json('/table/timeline/', dataset='subsidy_dollars', county='Linn')
+        RegionLookup.objects.filter(region='Linn').update(region='Linn County')
+        bump_versions(['region_lookup'])
+        data = self.get_json('/table/timeline/', dataset='subsidy_dollars', county='Linn County')
+        self.assertEqual(['Linn County'], [series['name'] for series in data['data']])
+        response = self.client.get('/table/timeline/', {'dataset': 'subsidy_dollars',
+                                                        'county': 'Linn', 'format': 'json'})
+        self.assertEqual(400, response.status_code)
+
+    def test_parameters_the_dataset_lacks_are_ignored(self):
+        data = self.get_json('/table/timeline/', dataset='exports_historical_cleaned', county='Linn')
+        self.assertEqual((None, [{'name': 'All', 'rows': 0, 'data': []}]),
+                         (data['series'], data['data']))
+
+
+class TestTopView(FactTablesTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super(TestTopView, cls).setUpTestData()
+        for year, fips, commodity, dollars in (
+                (2013, 41000, 'Wheat', 500), (2013, 41043, 'Wheat', 30),
+                (2013, 41043, 'Oats', 20), (2013, 41003, 'Hay', 20),
+                (2013, 41003, 'Barley', 20), (2013, 41001, 'Rye', None),
+                (2012, 41001, 'Rye', 90)):
+            SubsidyDollars.objects.create(year=year, fips=fips, commodity=commodity,
+                                          subsidy_dollars=dollars)
+
+    def test_ties_are_ordered_by_group(self):
+        data = self.get_json('/table/top/', dataset='subsidy_dollars', n='3')
+        self.assertEqual([2013], data['years'])
+        self.assertEqual([{'commodity': 'Wheat', 'subsidy_dollars': 530},
+                          {'commodity': 'Barley', 'subsidy_dollars': 20},
+                          {'commodity': 'Hay', 'subsidy_dollars': 20}], data['data'])
+
+    def test_counties_leave_out_oregon_and_nulls(self):
+        data = self.get_json('/table/top/', dataset='subsidy_dollars', dimension='county')
+        self.assertEqual([{'county': 'Linn', 'subsidy_dollars': 50},
+                          {'county': 'Benton', 'subsidy_dollars': 40}], data['data'])
+        data = self.get_json('/table/top/', dataset='subsidy_dollars', dimension='county',
+                             start_year='2012')
+        self.assertEqual('Baker', data['data'][0]['county'])
+
+    def test_n_bounds(self):
+        self.assertEqual(1, len(self.get_json('/table/top/', dataset='subsidy_dollars', n='1')['data']))
+        self.assertEqual(4, len(self.get_json('/table/top/', dataset='subsidy_dollars', n='100')['data']))
+        for n in ('0', '101', '-1', 'five', '2.5'):
+            response = self.client.get('/table/top/', {'dataset': 'subsidy_dollars', 'n': n,
+                                                       'format': 'json'})
+            self.assertEqual(400, response.status_code, n)
+
+    def test_invalid_parameters(self):
+        for params in ({}, {'dataset': 'nowhere'},
+                       {'dataset': 'subsidy_dollars', 'dimension': 'hs_cat_lvl_1'},
+                       {'dataset': 'subsidy_dollars', 'county': 'Nowhere'},
+                       {'dataset': 'subsidy_dollars', 'year': 'last'}):
+            response = self.client.get('/table/top/', dict(params, format='json'))
+            self.assertEqual(400, response.status_code, params)
+            self.assertEqual([], response.json()['data'])
+
+
+class TestStreaming(FactTablesTestCase):
+
+    fields = ('commodity', 'year', 'acres')
+    rows = [('Hay', 2012, Decimal('2.25')), ('Wheat', 2012, Decimal('10.50')),
+            ('Oats', 2007, None)]
+
+    def test_json_chunks(self):
+        for rows in ([], self.rows[:1], self.rows):
+            chunks = [rows[:2], rows[2:]] if rows else []
+            data = json.loads(''.join(json_chunks(iter(chunks), self.fields, len(rows))))
+            self.assertEqual((None, len(rows)), (data['error'], data['rows']))
+            self.assertEqual([dict(zip(self.fields, row)) for row in rows],
+                             [dict(row, acres=Decimal(row['acres']) if row['acres'] else None)
+                              for row in data['data']])
+        data = json.loads(''.join(json_chunks(iter([self.rows[:1]]), self.fields, None)))
+        self.assertEqual({'commodity': 'Hay', 'year': 2012, 'acres': '2.25'}, data['data'][0])
+        self.assertIsNone(data['rows'])
+
+    def test_ndjson_chunks(self):
+        lines = ''.join(ndjson_chunks(iter([self.rows[:2], self.rows[2:]]), self.fields))
+        self.assertEqual([{'commodity': 'Hay', 'year': 2012, 'acres': '2.25'},
+                          {'commodity': 'Wheat', 'year': 2012, 'acres': '10.50'},
+                          {'commodity': 'Oats', 'year': 2007, 'acres': None}],
+                         [json.loads(line) for line in lines.splitlines()])
+        self.assertEqual('', ''.join(ndjson_chunks(iter([]), self.fields)))
+
+    def test_csv_chunks(self):
+        text = ''.join(csv_chunks(iter([self.rows[:2], self.rows[2:]]), self.fields))
+        self.assertEqual('commodity,year,acres\r\nHay,2012,2.25\r\nWheat,2012,10.50\r\n'
+                         'Oats,2007,\r\n', text)
+        self.assertEqual('commodity,year,acres\r\n', ''.join(csv_chunks(iter([]), self.fields)))
+
+    def create_rows(self):
+        for commodity, year, acres in self.rows:
+            NassCommodityArea.objects.create(commodity=commodity, year=year, fips=41043, acres=acres)
+        return NassCommodityArea.objects.order_by('id')
+
+    def test_iter_row_chunks_server_side_cursor(self):
+        chunks = list(iter_row_chunks(self.create_rows(), self.fields, chunk_size=2))
+        self.assertEqual([self.rows[:2], self.rows[2:]], [list(chunk) for chunk in chunks])
+
+    def test_iter_row_chunks_other_databases(self):
+        qs = self.create_rows()
+        with mock.patch.object(connection, 'vendor', 'sqlite'):
+            chunks = list(iter_row_chunks(qs, self.fields, chunk_size=2))
+        self.assertEqual([self.rows[:2], self.rows[2:]], chunks)
+        with mock.patch.object(connection, 'vendor', 'sqlite'):
+            self.assertEqual([], list(iter_row_chunks(qs.none(), self.fields)))
+
+    def test_stream_response(self):
+        self.create_rows()
+        response = self.client.get('/data/commodity_area/', {'stream': 'csv', 'year': '2012'})
+        self.assertEqual('text/csv', response['Content-Type'])
+        self.assertEqual(b'commodity,year,fips,acres\r\n', b''.join(response.streaming_content)[:27])
+        response = self.client.get('/data/commodity_area/', {'stream': 'xml'})
+        self.assertEqual(400, response.status_code)
+
+
+class TestBinaryFormats(FactTablesTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super(TestBinaryFormats, cls).setUpTestData()
+        NassCommodityArea.objects.create(year=2012, fips=41043, commodity='Hay', acres='10.25')
+
+    @skipIf(msgpack is None, 'msgpack is not installed')
+    def test_msgpack_decimals_are_strings(self):
+        response = self.client.get('/data/commodity_area/', {'format': 'msgpack'})
+        self.assertEqual(200, response.status_code)
+        data = msgpack.unpackb(response.content, encoding='utf-8')
+        self.assertEqual(['10.25'], data['data']['acres'])
+
+    def test_unavailable_formats_are_not_acceptable(self):
+        for format, package in UNAVAILABLE_FORMATS.items():
+            response = self.client.get('/data/commodity_area/', {'format': format})
+            self.assertEqual(406, response.status_code)
+            self.assertIn(package, response.json()['detail'])
+
+
+class TestKeysetPagination(FactTablesTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super(TestKeysetPagination, cls).setUpTestData()
+        for year in (2012, None, 2007):
+            for fips in (41043, None, 41003):
+                for commodity in ('Wheat', None, 'Hay', 'Hay'):
+                    SubsidyDollars.objects.create(year=year, fips=fips, commodity=commodity,
+                                                  subsidy_dollars=1)
+
+    def walk(self, qs, page_size):
+        ids = []
+        cursor = None
+        while True:
+            rows, cursor = keyset_page(qs, page_size, cursor)
+            self.assertLessEqual(len(rows), page_size)
+            ids.extend(row.id for row in rows)
+            if cursor is None:
+                return ids
+
+    def test_every_row_once_in_order(self):
+        qs = SubsidyDollars.objects.all()
+        # Nulls sort last, as in PostgreSQL's ORDER BY
+        expected = list(qs.order_by('year', 'fips', 'commodity', 'id').values_list('id', flat=True))
+        self.assertEqual(36, len(expected))
+        for page_size in (1, 2, 5, 35, 36, 100):
+            self.assertEqual(expected, self.walk(qs, page_size), page_size)
+        filtered = qs.filter(commodity__in=['Hay'])
+        self.assertEqual(list(filtered.order_by('year', 'fips', 'id').values_list('id', flat=True)),
+                         self.walk(filtered, 4))
+
+    def test_after_key(self):
+        qs = SubsidyDollars.objects.all()
+        last = qs.filter(year__isnull=True, fips__isnull=True, commodity__isnull=True).order_by('id')[0]
+        after = qs.filter(after_key(['year', 'fips', 'commodity', 'id'],
+                                    [None, None, None, last.id]))
+        self.assertEqual([], list(after.exclude(id__gt=last.id)))
+        self.assertEqual(0, qs.filter(after_key(['year', 'id'], [2012, 0]), year__lt=2012).count())
+
+    def test_decode_cursor(self):
+        fields = [SubsidyDollars._meta.get_field(field) for field in ('year', 'fips', 'commodity', 'id')]
+        self.assertEqual([2012, None, 'Hay', 7],
+                         decode_cursor(encode_cursor([2012, None, 'Hay', 7]), fields))
+        for token in ('not base64!', encode_cursor([2012, 7]), encode_cursor({'year': 2012}),
+                      'bm90IGpzb24=', encode_cursor(['last', None, 'Hay', 7]),
+                      encode_cursor([2012, None, 'Hay', [7]])):
+            with self.assertRaises(InvalidCursor):
+                decode_cursor(token, fields)
+
+    def test_cursor_without_a_following_row(self):
+        with self.assertRaises(InvalidCursor):
+            after_key(['year', 'id'], [None, None])
+        for values in ([None, None, None, None], [2012, 'x', None, 1]):
+            response = self.client.get('/data/subsidy_dollars/', {
+                'cursor': encode_cursor(values), 'format': 'json'})
+            self.assertEqual(400, response.status_code)
+
+    def test_count_rows(self):
+        qs = SubsidyDollars.objects.filter(year=2012)
+        self.assertEqual(12, count_rows(qs, 'exact'))
+        self.assertIsInstance(count_rows(qs, 'estimate'), int)
+        self.assertIsNone(count_rows(qs, 'none'))
+
+    def test_pages_after_the_first_are_not_counted(self):
+        data = self.get_json('/data/subsidy_dollars/', page_size='30')
+        self.assertEqual((36, 30), (data['rows'], len(data['data'])))
+        response = self.client.get(data['next'])
+        self.assertEqual(200, response.status_code)
+        page = response.json()
+        self.assertEqual((None, 6, None), (page['rows'], len(page['data']), page['next']))
+        response = self.client.get(data['next'] + '&count=exact')
+        self.assertEqual(36, response.json()['rows'])
+        response = self.client.get('/data/subsidy_dollars/', {'cursor': 'bad', 'format': 'json'})
+        self.assertEqual(400, response.status_code)
+
+
+class TestConditionalGet(FactTablesTestCase):
+
+    path = '/table/subsidy_dollars/?format=json'
+
+    @classmethod
+    def setUpTestData(cls):
+        super(TestConditionalGet, cls).setUpTestData()
+        SubsidyDollars.objects.create(year=2013, fips=41000, commodity='Wheat', subsidy_dollars=1)
+
+    def test_etag_matches(self):
+        self.assertTrue(etag_matches('abc', '"abc"'))
+        self.assertTrue(etag_matches('abc', 'W/"abc"'))
+        self.assertTrue(etag_matches('abc', '"xyz", W/"abc"'))
+        self.assertTrue(etag_matches('abc', '*'))
+        self.assertFalse(etag_matches('abc', '"xyz", "abcd"'))
+        self.assertFalse(etag_matches('abc', ''))
+
+    def test_matching_etag_is_not_modified(self):
+        response = self.client.get(self.path)
+        etag = response['ETag']
+        # Only the versions are looked up
+        with self.assertNumQueries(1):
+            response = self.client.get(self.path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(etag, response['ETag'])
+        for header in ('"other", ' + etag, 'W/' + etag, '*'):
+            self.assertEqual(304, self.client.get(self.path, HTTP_IF_NONE_MATCH=header).status_code)
+        self.assertEqual(200, self.client.get(self.path, HTTP_IF_NONE_MATCH='"other"').status_code)
+        # The ETag depends on the query parameters
+        response = self.client.get(self.path + '&county=Linn', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+
+    def test_bumped_version_is_modified(self):
+        etag = self.client.get(self.path)['ETag']
+        bump_versions(['subsidy_dollars'])
+        response = self.client.get(self.path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response['ETag'])
+        last_modified = response['Last-Modified']
+        response = self.client.get(self.path, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(304, response.status_code)
+        # If-None-Match takes precedence over If-Modified-Since
+        response = self.client.get(self.path, HTTP_IF_MODIFIED_SINCE=last_modified,
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+
+    def test_tables_never_bumped(self):
+        response = self.client.get(self.path)
+        self.assertNotIn('Last-Modified', response)
+        response = self.client.get(self.path, HTTP_IF_MODIFIED_SINCE='Sat, 01 Jan 2000 00:00:00 GMT')
+        self.assertEqual(200, response.status_code)
+
+
+class TestImportsHistorical(FactTablesTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super(TestImportsHistorical, cls).setUpTestData()
+        for commodity, time, value in (
+                ('Wheat', '2014-01', '$1,000'), (' Wheat ', '2014-02', '500'),
+                ('Wheat', '2015-01', '250'), ('Hay', '2015-03', '$40'), ('Hay', 'n/a', '7')):
+            ImportsHistoricalRaw.objects.create(commodity=commodity, time=time, value=value)
+        convert_trade_table('imports_historical_raw')
+
+    def test_by_commodity_and_year(self):
+        data = self.get_json('/table/imports_historical/')
+        self.assertEqual(('import', ['commodity', 'year']), (data['flow'], data['group']))
+        self.assertEqual([
+            {'commodity': 'Hay', 'year': None, 'value': 7.0},
+            {'commodity': 'Hay', 'year': 2015, 'value': 40.0},
+            {'commodity': 'Wheat', 'year': 2014, 'value': 1500.0},
+            {'commodity': 'Wheat', 'year': 2015, 'value': 250.0},
+        ], sorted(data['data'], key=lambda row: (row['commodity'], row['year'] or 0)))
+
+    def test_filters(self):
+        data = self.get_json('/table/imports_historical/', commodity='WHEAT', year=2014,
+                             group='month')
+        self.assertEqual([{'month': 1, 'value': 1000.0}, {'month': 2, 'value': 500.0}],
+                         data['data'])
+        response = self.client.get('/table/imports_historical/', {'group': 'country'})
+        self.assertEqual(400, response.status_code)
+
+
+class TestCopyBlock(TestCase):
+
+    def test_reads_up_to_terminator(self):
+        block = CopyBlock(io.StringIO('OR\tBaker\t41001\r\nOR\tLinn\t41043\n\\.\nCOPY next\n'))
+        self.assertEqual('OR\tBaker\t41001\r\n', block.readline())
+        self.assertEqual('OR\tLinn\t41043\n', block.read())
+        self.assertEqual('', block.readline())
+        self.assertEqual('', block.read())
+
+    def test_read_size(self):
+        block = CopyBlock(io.StringIO('a\nb\nc\n\\.\n'))
+        # Whole lines, at least size characters unless the block ends
+        self.assertEqual('a\n', block.read(1))
+        self.assertEqual('b\nc\n', block.read(3))
+        self.assertEqual('', block.read(10))
+
+    def test_unterminated_block(self):
+        block = CopyBlock(io.StringIO('a\nb'))
+        self.assertEqual('a\nb', block.read())
+        block.close()
+        self.assertTrue(block.source.closed)
+
+
+class TestLoadTable(FactTablesTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super(TestLoadTable, cls).setUpTestData()
+        for fips, dollars in ((41043, 10), (41003, 20)):
+            SubsidyDollars.objects.create(year=2012, fips=fips, commodity='Wheat',
+                                          subsidy_dollars=dollars)
+
+    def csv_file(self, text):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as source:
+            source.write(text)
+        self.addCleanup(os.remove, source.name)
+        return source.name
+
+    def rows(self):
+        return list(SubsidyDollars.objects.order_by('year', 'fips')
+                    .values_list('year', 'fips', 'subsidy_dollars'))
+
+    def test_full_load_swaps_table(self):
+        indexes = table_indexes(connection.cursor(), 'subsidy_dollars')
+        path = self.csv_file('year,fips,commodity,subsidy_dollars\n'
+                             '2013,41043,Wheat,30\n2013,41001,Hay,\n')
+        self.assertEqual(2, load_table('subsidy_dollars', path))
+        self.assertEqual([(2013, 41001, None), (2013, 41043, 30)], self.rows())
+        self.assertEqual(sorted(indexes), sorted(table_indexes(connection.cursor(), 'subsidy_dollars')))
+        self.assertEqual(1, dataset_versions(['subsidy_dollars'])['subsidy_dollars'][0])
+        # The id sequence carries on
+        created = SubsidyDollars.objects.create(year=2014, fips=41043, subsidy_dollars=1)
+        self.assertGreater(created.id, max(SubsidyDollars.objects.exclude(id=created.id)
+                                           .values_list('id', flat=True)))
+        # Loading the same file again is a no-op
+        self.assertIsNone(load_table('subsidy_dollars', path))
+        self.assertEqual(2, load_table('subsidy_dollars', path, force=True))
+
+    def test_incremental_load_ignores_file_ids(self):
+        first_id = SubsidyDollars.objects.order_by('id')[0].id
+        path = self.csv_file('id,year,fips,commodity,subsidy_dollars\n'
+                             '{0},2012,41043,Wheat,99\n{0},2013,41043,Wheat,30\n'
+                             '{1},2013,41003,Wheat,40\n'.format(first_id, first_id + 1))
+        self.assertEqual(2, load_table('subsidy_dollars', path, incremental=True))
+        self.assertEqual([(2012, 41003, 20), (2012, 41043, 10), (2013, 41003, 40), (2013, 41043, 30)],
+                         self.rows())
+        self.assertEqual(4, len(set(SubsidyDollars.objects.values_list('id', flat=True))))
+
+    def test_invalid_loads(self):
+        with self.assertRaises(LoadError):
+            load_table('nowhere', self.csv_file('year\n2013\n'))
+        with self.assertRaises(LoadError):
+            load_table('subsidy_dollars', self.csv_file('year,acres\n2013,1\n'))
+        with self.assertRaises(LoadError):
+            load_table('subsidy_dollars', self.csv_file('fips,subsidy_dollars\n41043,1\n'),
+                       incremental=True)
+        with self.assertRaises(LoadError):
+            load_table('metadata', self.csv_file('name\nx\n'), incremental=True)
+
+
+class TestCountyStatistics(FactTablesTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super(TestCountyStatistics, cls).setUpTestData()
+        for fips, acres in ((41043, '10.00'), (41043, None), (41003, '4.00'),
+                            (41001, None), (41000, '500.00')):
+            NassCommodityArea.objects.create(year=2012, fips=fips, commodity='Wheat', acres=acres)
+        NassCommodityArea.objects.create(year=2007, fips=41001, commodity='Wheat', acres='99.00')
+
+    def test_null_values_are_left_out(self):
+        grades, mean, stddev = CountyStatisticsList.find_stats(
+            [41001, 41003, 41043], 2012, NassCommodityArea, 'acres')
+        # Baker only has a null value in 2012, so it counts as zero
+        expected_mean, expected_stddev = mean_stddev([0.0, 4.0, 10.0])
+        self.assertAlmostEqual(expected_mean, mean)
+        self.assertAlmostEqual(expected_stddev, stddev)
+        self.assertEqual(dict(zip([41001, 41003, 41043], grade_all(mean, stddev, [0.0, 4.0, 10.0]))),
+                         grades)
+
+    def test_partial_indexes_are_used(self):
+        migration = import_module('api.migrations.0008_fact_table_indexes')
+        with connection.schema_editor() as editor:
+            migration.create_indexes(apps, editor)
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        qs = NassCommodityArea.objects.filter(year=2012, fips__in=[41001, 41003, 41043])
+        indexes = lambda qs: set(node.get('Index Name') for node in plan_nodes(explain(qs)))
+        # Without the condition of the partial indexes they can't be used
+        self.assertNotIn('nass_commodity_area_year_fips_commodity', indexes(qs))
+        self.assertIn('nass_commodity_area_year_fips_commodity',
+                      indexes(qs.filter(acres__isnull=False)))
+        self.assertIn('nass_commodity_farms_year_fips_commodity',
+                      indexes(NassCommodityFarms.objects.filter(year=2012, farms__isnull=False)))
+
+
+class TestColumnStoreMatchesDatabase(FactTablesTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super(TestColumnStoreMatchesDatabase, cls).setUpTestData()
+        for year, fips, commodity, acres in (
+                (2012, 41043, 'apples', '10.25'), (2012, 41043, 'Bananas', '1.10'),
+                (2012, 41003, 'apples', '0.05'), (2012, 41003, 'Zucchini', None),
+                (2012, 41000, 'Bananas', '11.35'), (2012, 41043, 'Total Acres', '11.35'),
+                (2007, 41043, 'apples', '3.00'), (2007, None, 'apples', '9.00'),
+                (None, 41043, 'apples', '1.00'), (2012, 41003, None, '2.00')):
+            NassCommodityArea.objects.create(year=year, fips=fips, commodity=commodity, acres=acres)
+        for year, fips, commodity, dollars in (
+                (2013, 41000, 'oats', 5), (2013, 41000, 'Hay', 7), (2013, 41043, 'oats', 5),
+                (2012, 41043, 'Hay', None)):
+            SubsidyDollars.objects.create(year=year, fips=fips, commodity=commodity,
+                                          subsidy_dollars=dollars)
+
+    def setUp(self):
+        super(TestColumnStoreMatchesDatabase, self).setUp()
+        column_store.clear()
+        self.addCleanup(column_store.clear)
+
+    def responses(self, path, params):
+        data = []
+        for enabled in (False, True):
+            result_cache.clear()
+            with override_settings(COLUMN_STORE=enabled):
+                response = self.client.get(path, dict(params, format='json'))
+            self.assertEqual(200, response.status_code)
+            data.append(response.data)
+        self.assertEqual(1, len(column_store.tables))
+        return data
+
+    def test_same_responses(self):
+        for path, params in (
+                ('/table/commodity_area/', {}),
+                ('/table/commodity_area/', {'county': 'Linn'}),
+                ('/table/subsidy_dollars/', {}),
+                ('/table/subsidy_dollars_top5crops/', {}),
+                ('/table/timeline/', {'dataset': 'nass_commodity_area'}),
+                ('/table/timeline/', {'dataset': 'nass_commodity_area',
+                                      'commodity': ['apples', 'Bananas', 'Zucchini']}),
+                ('/table/timeline/', {'dataset': 'subsidy_dollars', 'county': ['Linn', 'Oregon']}),
+                ('/table/top/', {'dataset': 'nass_commodity_area', 'n': '10'}),
+                ('/table/top/', {'dataset': 'nass_commodity_area', 'dimension': 'county'})):
+            column_store.clear()
+            database, columns = self.responses(path, params)
+            self.assertEqual(database, columns, (path, params))
+
+    def test_same_responses_without_years(self):
+        NassCommodityArea.objects.exclude(year=None).delete()
+        SubsidyDollars.objects.all().delete()
+        for path, params in (
+                ('/table/commodity_area/', {}),
+                ('/table/subsidy_dollars/', {}),
+                ('/table/subsidy_dollars_top5fips/', {}),
+                ('/table/top/', {'dataset': 'nass_commodity_area'}),
+                ('/table/top/', {'dataset': 'subsidy_dollars'})):
+            column_store.clear()
+            database, columns = self.responses(path, params)
+            self.assertEqual(database, columns, (path, params))
+
+    def test_invalid_filters(self):
+        for enabled in (False, True):
+            with override_settings(COLUMN_STORE=enabled):
+                for params in ({'year': 'last'}, {'fips': '41043', 'year': '2012.5'}):
+                    result_cache.clear()
+                    response = self.client.get('/table/commodity_area/', dict(params, format='json'))
+                    self.assertEqual(400, response.status_code, (enabled, params))
+                    self.assertEqual([], response.json()['data'])
+
+    def test_types_and_order(self):
+        database, columns = self.responses('/table/commodity_area/', {'county': 'Linn'})
+        self.assertEqual({'apples': Decimal('10.25'), 'Bananas': Decimal('1.10')},
+                         dict((row['commodity'], row['acres']) for row in columns['data']))
+        self.assertEqual(Decimal('11.35'), columns['total_acres'])
+        self.assertEqual(list(NassCommodityArea.objects.filter(commodity__in=['apples', 'Bananas'])
+                              .order_by('commodity').values_list('commodity', flat=True).distinct()),
+                         [row['commodity'] for row in columns['data']])
+
+
+class TestBumpDatasetVersion(FactTablesTestCase):
+
+    def test_rebuild_derived_tables(self):
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO exports_historical_cleaned "
+                           "(commodity, value_num, hs_cat_lvl_1, hs_cat_lvl_2, time_month, time_year) "
+                           "VALUES ('Wheat', 12.5, 'Food', 'Grains', 3, 2016)")
+        call_command('bump_dataset_version', 'exports_historical_cleaned', stdout=io.StringIO())
+        self.assertFalse(ExportsRollup.objects.exists())
+        call_command('bump_dataset_version', 'exports_historical_cleaned', rebuild=True,
+                     stdout=io.StringIO())
+        self.assertEqual([12.5], list(ExportsRollup.objects.filter(level='year')
+                                      .values_list('value', flat=True)))
+        versions = dataset_versions(['exports_historical_cleaned', 'exports_rollup'])
+        self.assertEqual((2, 1), (versions['exports_historical_cleaned'][0],
+                                  versions['exports_rollup'][0]))
@@ -0,0 +1,107 @@
+"""
+Dataset version registry.
+
+Every table has a version number in the dataset_version table, which is
+bumped whenever the table is (re)loaded:
+
+    python3 manage.py bump_dataset_version exports_historical_cleaned
+
+A table that has never been bumped is at version 0. The versions of the
+tables a response was computed from, together with the request parameters,
+identify the response: that is its ETag.
+"""
+
+import hashlib
+import json
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import DatasetVersion
+
+# Tables that every view reads through the reference data registry
+REFERENCE_TABLES = ('metadata', 'region_lookup', 'crop_diversity')
+
+
+def dataset_versions(tables):
+    """
+    Return a {table_name: (<version>, <updated>)} dictionary for tables, in a
+    single query. Tables that were never bumped are at (0, None).
+    """
+    versions = dict((table, (0, None)) for table in tables)
+    rows = DatasetVersion.objects.filter(table_name__in=list(tables)) \
+        .values_list('table_name', 'version', 'updated')
+    for table_name, version, updated in rows:
+        versions[table_name] = (version, updated)
+    return versions
+
+
+def bump_versions(tables, checksum=None):
+    """
+    Increment the version of tables, creating their rows as necessary. The
+    checksum of the file the tables were loaded from is recorded if given.
+    """
+    now = timezone.now()
+    changes = {'version': F('version') + 1, 'updated': now}
+    if checksum is not None:
+        changes['checksum'] = checksum
+    with transaction.atomic():
+        for table in tables:
+            bumped = DatasetVersion.objects.filter(table_name=table).update(**changes)
+            if not bumped:
+                DatasetVersion.objects.create(
+                    table_name=table, version=1, updated=now, checksum=checksum or '')
+
+
+def loaded_checksum(table):
+    """
+    Return the checksum of the file table was last loaded from, or ''.
+    """
+    checksums = DatasetVersion.objects.filter(table_name=table) \
+        .values_list('checksum', flat=True)
+    return checksums[0] if checksums else ''
+
+
+def last_modified(versions):
+    """
+    Return the latest update time in a dataset_versions() dictionary, or
+    None if none of the tables has been bumped.
+    """
+    updates = [updated for version, updated in versions.values() if updated is not None]
+    return max(updates) if updates else None
+
+
+def normalized_params(query_params):
+    """
+    Return the query parameters as a sorted list of (key, sorted values)
+    pairs, so that equivalent queries compare equal.
+    """
+    return sorted((key, sorted(values)) for key, values in query_params.lists())
+
+
+def version_etag(name, versions, query_params, media_type=''):
+    """
+    Return the strong ETag (without quotes) of the response of view name to
+    query_params in media_type, computed from tables at versions.
+    """
+    key = json.dumps([
+        name,
+        sorted((table, version) for table, (version, updated) in versions.items()),
+        normalized_params(query_params),
+        media_type,
+    ])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def etag_matches(etag, if_none_match):
+    """
+    Return whether the If-None-Match header value lists etag.
+    """
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag == '*':
+            return True
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag.strip('"') == etag:
+            return True
+    return False
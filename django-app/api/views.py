@@ -16,26 +16,61 @@ value in every table row. Multiple "key=value" pairs may be provided,
 in any order, including multiple values for the same key.
 """
 
-from django.db.models import Sum
+from calendar import timegm
+from functools import partial
+import numpy as np
+from django.db.models import Max, Sum
 from django.core.exceptions import FieldError
+from django.http import HttpResponseNotModified
+from django.utils.http import http_date, parse_http_date_safe
 from rest_framework.views import APIView
+from rest_framework.exceptions import NotAcceptable
 from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.reverse import reverse as api_reverse
-from collections import OrderedDict, Counter
+from rest_framework.utils.urls import replace_query_param
+from collections import OrderedDict
 from .models import (
-    CropDiversity,
     Metadata,
     NassAnimalsSales,
     SubsidyDollars,
     SubsidyRecipients,
-    RegionLookup,
     NassCommodityArea,
     NassCommodityFarms,
     OainHarvestAcres,
-    ExportsHistoricalCleaned,
-    RawOainData,
+    ExportsRollup,
+    OainProductionRevenue,
+    TradeByCountry,
+    TradeTotals,
 )
+from .datasets import DATASETS, get_dataset, dataset_queryset
+from .derived import normalize_name
+from .pagination import (
+    COUNT_MODES,
+    MAX_PAGE_SIZE,
+    InvalidCursor,
+    count_rows,
+    default_page_size,
+    keyset_page,
+)
+from .versions import (
+    REFERENCE_TABLES,
+    dataset_versions,
+    etag_matches,
+    last_modified,
+    version_etag,
+)
+from .batch import BatchError, run_batch
+from .binary import BINARY_RENDERERS, UNAVAILABLE_FORMATS
+from .cache import cached_result, result_cache
+from .execution import run_concurrently
+from .columnar import columnar_data, columnar_envelope, wants_columnar
+from .columnstore import UnsupportedFilter, column_table
+from .commodities import SEARCH_TABLES, commodity_index
+from .metrics import timed
+from .streaming import STREAM_CONTENT_TYPES, stream_response
+from .reference import OREGON_FIPS, reference_data
 from .serializers import (
     MetadataSerializerWrapped,
     NassAnimalsSalesSerializerWrapped,
@@ -46,34 +81,50 @@ from .serializers import (
     OainHarvestAcresSerializerWrapped,
 )
 
-# Metadata dictionary of database tables keyed on the table_name. It will be
-# populated by fetch_metadata() when the first view that needs it is called.
-metadata_dict = {}
-# Oregon region -> fips lookup dictionary.  It will be
-# populated by fetch_metadata() when the first view that needs it is called.
-region_to_fips = {}
-fips_to_region = {}
-
-METADATA_FIELDS = (
-    'name',
-    'description',
-    'table_name',
-    'unit',
-    'field',
-    'source_name',
-    'source_link'
+GRADES = np.array(["very low", "low", "moderate", "high", "very high"])
+
+# (<title>, <URL name>) of the endpoints listed by the endpoint index
+ENDPOINTS = (
+    ('List metadata for DB tables', 'metadata'),
+    ('County statistics - table view', 'county_stats'),
+    ('List commodities by area - row view', 'nass_commodity_area_list'),
+    ('List commodities by area - table view', 'nass_commodity_area_table'),
+    ('List commodities by number of farms - row view', 'nass_commodity_farms_list'),
+    ('List commodities by harvested acres - row view', 'oain_harvest_acres_list'),
+    ('List animal sales - row view', 'nass_animals_sales'),
+    ('Subsidy Dollars - row view', 'subsidy_dollars_data'),
+    ('Subsidy Dollars - table view', 'subsidy_dollars_table'),
+    ('Subsidy Dollars - timeline view', 'subsidy_dollars_timeline'),
+    ('Subsidy Dollars - top 5 counties', 'subsidy_dollars_top_counties'),
+    ('Subsidy Dollars - top 5 commodities', 'subsidy_dollars_top_commodities'),
+    ('Subsidy Recipients - row view', 'subsidy_recipients_data'),
+    ('Crop Diversity - row view', 'crop_diversity_data'),
+    ('Oregon Exports - timeline view', 'oregon_exports_timeline'),
+    ('Any dataset - timeline view', 'timeline'),
+    ('Any dataset - top N view', 'top'),
+    ('Oregon Export Commodities - list view', 'oregon_export_commodities'),
+    ('Oregon Top 5 Export Commodities - list view', 'oregon_exports_top_commodities'),
+    ('Oregon Exports - monthly seasonality', 'exports_seasonality'),
+    ('Oregon Exports - breakdown by HS category or commodity', 'exports_breakdown'),
+    ('Oregon Exports - by country, commodity and year', 'exports_by_country'),
+    ('Oregon Imports - by country, commodity and year', 'imports_by_country'),
+    ('Oregon Imports - historical, by commodity and year', 'imports_historical'),
+    ('Oregon Imports and Exports - totals timeline', 'trade_totals'),
+    ('Commodity search', 'commodity_search'),
+    ('Production and Revenue - list view', 'production_and_revenue'),
+    ('Batch of requests (POST)', 'batch'),
+    ('Result cache statistics', 'result_cache_stats'),
+    ('Request metrics (Prometheus text format)', 'metrics'),
 )
 
 
 def mean_stddev(items):
-    from math import sqrt
     """
     Calculate the mean and population standard deviation of items list.
     Return the (<mean>, <stddev>) tuple
     """
-    mean = sum(items) / len(items)
-    sum_squared_diffs = sum([(item - mean) ** 2 for item in items])
-    return (mean, sqrt(sum_squared_diffs / len(items)))
+    items = np.asarray(items, dtype=float)
+    return (float(items.mean()), float(items.std()))
 
 
 def grade(mean, stddev, item):
@@ -91,74 +142,212 @@ def grade(mean, stddev, item):
     return "very high"
 
 
-def cache_lookups():
-        if not metadata_dict:
-            fetch_metadata(Metadata)
-        if not region_to_fips:
-            fetch_region_lookup(RegionLookup)
-
-
-def fetch_metadata(metadata_model):
+def grade_all(mean, stddev, items):
     """
-    Fetch the metadata table, and store it in metadata_dict.
+    Vectorized grade(): return the list of grades for all items at once.
     """
-    metadata = OrderedDict()
-    metadata_query = metadata_model.objects.all()
-    for table in metadata_query:
-        for field in METADATA_FIELDS:
-            metadata[field] = table.__dict__[field]
-            # Add the metadata to metadata_dict
-        metadata_dict[table.table_name] = metadata.copy()
+    bounds = [mean - 2 * stddev, mean - stddev, mean + stddev, mean + 2 * stddev]
+    return GRADES[np.digitize(np.asarray(items, dtype=float), bounds)].tolist()
 
 
-def get_most_recent_year(model):
+def get_most_recent_year(model, year_field='year'):
     """
     Return the most recent year for a model from the database.
 
     If the model does not exist or it has no year field, None is returned.
     """
+    max_key = year_field + '__max'
     try:
-        return model.objects.latest('year').year
-    except (model.DoesNotExist, AttributeError):  # model does not exist
+        return model.objects.aggregate(Max(year_field))[max_key]
+    except AttributeError:  # model does not exist
         return None
     except FieldError:  # model does not have a year field
         return None
 
 
-def fetch_region_lookup(region_lookup_model):
+def grouped_query(query, group_field, value_field, order_by=None, limit=None):
     """
-    Fetch region lookup tables. Stores only region and fips fields in
-    lookup dictionaries.
+    Return the GROUP BY queryset summing value_field over the query grouped
+    by group_field, with {group_field: <group>, 'total': <sum>} rows.
+
+    Rows are ordered by group_field unless order_by is given. Use
+    order_by=value_field (or '-' + value_field) to order on the sums, with
+    ties ordered by group_field. When a limit is given rows with a null
+    value_field are left out, so that the top-N rows are never null.
     """
-    crop_div_qs = CropDiversity.objects.all()
-    for region_entry in region_lookup_model.objects.values(
-        'region',
-        'fips'
-    ):
-        county_name = region_entry['region']
-        fips = region_entry['fips']
-        if fips == 41000:
-            region_to_fips[county_name] = {
-                'fips': fips,
-                'crop diversity score': None
-            }
-            fips_to_region[fips] = {
-                'region': county_name,
-                'crop diversity score': None
-            }
-        else:
-            cd = crop_div_qs.get(county_name=county_name.upper())
-            region_to_fips[county_name] = {
-                'fips': fips,
-                'crop diversity score': float(cd.diversity_score)
-            }
-            fips_to_region[fips] = {
-                'region': county_name,
-                'crop diversity score': float(cd.diversity_score)
-            }
+    if order_by is None:
+        order_by = group_field
+    ordering = [order_by]
+    # The sum is annotated as 'total' since it can't share the field's name
+    if order_by.lstrip('-') == value_field:
+        ordering = [order_by.replace(value_field, 'total'), group_field]
+    if limit is not None:
+        query = query.filter(**{value_field + '__isnull': False})
+    rows = query.order_by().values(group_field) \
+        .annotate(total=Sum(value_field)) \
+        .order_by(*ordering)
+    if limit is not None:
+        rows = rows[:limit]
+    return rows
+
+
+def aggregate_by(query, group_field, value_field, order_by=None, limit=None):
+    """
+    Sum value_field over the query grouped by group_field, in a single
+    GROUP BY query (see grouped_query()).
+
+    Return a list of {group_field: <group>, value_field: <sum>} dicts.
+    """
+    rows = grouped_query(query, group_field, value_field, order_by, limit)
+    return [
+        {group_field: row[group_field], value_field: row['total']}
+        for row in rows
+    ]
+
+
+def aggregate_table(query, group_field, value_field):
+    """
+    Return the (<rows>, <total>) tuple for a (group_field -> value_field)
+    table, where rows is the aggregate_by() list and total is the grand total
+    of value_field over the whole query.
+
+    The total is summed from the grouped rows, so the whole table costs one
+    query. Like aggregate(Sum()), the total is None when there are no values.
+    """
+    rows = aggregate_by(query, group_field, value_field)
+    sums = [row[value_field] for row in rows if row[value_field] is not None]
+    total = sum(sums) if sums else None
+    return (rows, total)
+
+
+def aggregate_series(query, series_field, group_field, value_field):
+    """
+    Sum value_field over the query grouped by (series_field, group_field), in
+    a single GROUP BY query.
+
+    Return an OrderedDict of {<series>: [{group_field: <group>, value_field:
+    <sum>}, ...]} with the series and the rows of each series sorted.
+    """
+    rows = query.order_by().values(series_field, group_field) \
+        .annotate(total=Sum(value_field)) \
+        .order_by(series_field, group_field)
+    series = OrderedDict()
+    for row in rows:
+        series.setdefault(row[series_field], []).append(
+            {group_field: row[group_field], value_field: row['total']}
+        )
+    return series
+
+
+def timeline(query, year_field, value_field, value_key=None):
+    """
+    Return the [{'year': <year>, value_key: <sum>}, ...] timeline of
+    value_field summed over the query in each year, sorted by year.
+
+    value_key defaults to value_field.
+    """
+    value_key = value_key or value_field
+    return [
+        {'year': row[year_field], value_key: row[value_field]}
+        for row in aggregate_by(query, year_field, value_field)
+    ]
+
 
+def timeline_series(query, series_field, year_field, value_field, value_key=None):
+    """
+    Return an OrderedDict of {<series>: <timeline>}, one timeline() per
+    distinct value of series_field, from a single grouped query.
+    """
+    value_key = value_key or value_field
+    return OrderedDict(
+        (series, [{'year': row[year_field], value_key: row[value_field]} for row in rows])
+        for series, rows in aggregate_series(
+            query, series_field, year_field, value_field).items()
+    )
+
+
+def error_response(message, status=400):
+    """
+    Return a response carrying only an error message in the usual envelope.
+    """
+    return Response({'error': message, 'data': []}, status=status)
 
-class FilteredAPIView(APIView):
+
+class NotModified(Exception):
+    """
+    Raised to answer a conditional GET request with 304 Not Modified.
+    """
+    pass
+
+
+class VersionedAPIView(APIView):
+    """
+    APIView answering conditional GET requests.
+
+    The response gets a strong ETag computed from the versions of the tables
+    the view reads (the "tables" attribute, plus the reference tables) and
+    the query parameters, and a Last-Modified time from the table versions.
+    A request with a matching If-None-Match, or with an If-Modified-Since not
+    older than the tables, gets 304 Not Modified before any query is run.
+    The reference data snapshot is reloaded first if the reference tables
+    were bumped since it was loaded (see api.reference).
+    """
+    tables = ()
+
+    def get_tables(self, request):
+        """
+        Return the names of the tables the response is computed from.
+        """
+        return self.tables
+
+    def initial(self, request, *args, **kwargs):
+        super(VersionedAPIView, self).initial(request, *args, **kwargs)
+        self.etag = None
+        self.last_modified = None
+        if request.method not in ('GET', 'HEAD'):
+            return
+        tables = set(self.get_tables(request)) | set(REFERENCE_TABLES)
+        self.dataset_versions = dataset_versions(tables)
+        reference_data(self.dataset_versions)
+        self.etag = version_etag(type(self).__name__, self.dataset_versions,
+                                 request.query_params, request.accepted_media_type)
+        self.last_modified = last_modified(self.dataset_versions)
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if_modified_since = parse_http_date_safe(
+            request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        if if_none_match is not None:
+            if etag_matches(self.etag, if_none_match):
+                raise NotModified()
+        elif if_modified_since is not None and self.last_modified is not None:
+            if timegm(self.last_modified.utctimetuple()) <= if_modified_since:
+                raise NotModified()
+
+    def column_table(self, name):
+        """
+        Return the ColumnTable of table name at the version of this request
+        (see api.columnstore), or None to query the database.
+        """
+        return column_table(name, getattr(self, 'dataset_versions', {}))
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return HttpResponseNotModified()
+        return super(VersionedAPIView, self).handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super(VersionedAPIView, self).finalize_response(
+            request, response, *args, **kwargs)
+        if isinstance(response, Response) and response.status_code < 400 and wants_columnar(request):
+            response.data = columnar_data(response.data)
+        if getattr(self, 'etag', None) and response.status_code in (200, 304):
+            response['ETag'] = '"{}"'.format(self.etag)
+            if self.last_modified is not None:
+                response['Last-Modified'] = http_date(
+                    timegm(self.last_modified.utctimetuple()))
+        return response
+
+
+class FilteredAPIView(VersionedAPIView):
     """
     APIView extended with filtered query dictionary generator method
     """
@@ -171,6 +360,7 @@ class FilteredAPIView(APIView):
                 vals = query_params.getlist(param)
                 # Convert 'county' to 'fips'
                 if param == 'county':
+                    region_to_fips = reference_data().region_to_fips
                     vals = [region_to_fips[v]['fips'] for v in vals]
                     param = 'fips'
                 filter_params[param] = vals
@@ -179,7 +369,7 @@ class FilteredAPIView(APIView):
         return query
 
 
-class EndpointIndexView(APIView):
+class EndpointIndexView(VersionedAPIView):
     """
 Cropcompass API endpoints can be accessed at the URLs below. Add "format=json"
 query parameter to get JSON response.
@@ -193,28 +383,8 @@ query parameter to get JSON response.
         """
         Return a list of API endpoints with their documentation.
         """
-        endpoints = [
-            ('List metadata for DB tables', 'metadata'),
-            ('County statistics - table view', 'county_stats'),
-            ('List commodities by area - row view', 'nass_commodity_area_list'),
-            ('List commodities by area - table view', 'nass_commodity_area_table'),
-            ('List commodities by number of farms - row view', 'nass_commodity_farms_list'),
-            ('List commodities by harvested acres - row view', 'oain_harvest_acres_list'),
-            ('List animal sales - row view', 'nass_animals_sales'),
-            ('Subsidy Dollars - row view', 'subsidy_dollars_data'),
-            ('Subsidy Dollars - table view', 'subsidy_dollars_table'),
-            ('Subsidy Dollars - timeline view', 'subsidy_dollars_timeline'),
-            ('Subsidy Dollars - top 5 counties', 'subsidy_dollars_top_counties'),
-            ('Subsidy Dollars - top 5 commodities', 'subsidy_dollars_top_commodities'),
-            ('Subsidy Recipients - row view', 'subsidy_recipients_data'),
-            ('Crop Diversity - row view', 'crop_diversity_data'),
-            ('Oregon Exports - timeline view', 'oregon_exports_timeline'),
-            ('Oregon Export Commodities - list view', 'oregon_export_commodities'),
-            ('Oregon Top 5 Export Commodities - list view', 'oregon_exports_top_commodities'),
-            ('Production and Revenue - list view', 'production_and_revenue'),
-        ]
         endpoint_dict = OrderedDict()
-        for endpoint_name, path in endpoints:
+        for endpoint_name, path in ENDPOINTS:
             endpoint_dict[endpoint_name] = api_reverse(path, request=request)
         return Response(endpoint_dict)
 
@@ -222,15 +392,58 @@ query parameter to get JSON response.
 class FilteredListView(FilteredAPIView):
     """
     Endpoint class allowing filtering by arbitrary params.
+
+    Add query parameter "stream" with value "json", "ndjson" or "csv" to get
+    the rows streamed from the database in chunks instead, which keeps memory
+    use flat for large tables.
+
+    Add "page_size" to get the rows a page at a time, ordered by year, fips,
+    commodity. The response then has a "next" URL for the following page, or
+    null on the last page. "count" may be "exact", "estimate" for the query
+    planner's estimate, which is cheap for large tables, or "none" to skip
+    counting, which gives a null "rows". It defaults to "exact", except for
+    the pages after the first (those with a "cursor"), which default to
+    "none" so that they cost no more than the first page.
+
+    Add "format=columnar" to get one list of values per field instead of one
+    object per row (see api.columnar), or "format=arrow", "parquet" or
+    "msgpack" to get the columns in a binary format (see api.binary).
     """
     filter_fields = ['commodity', 'year', 'fips', 'county']
     model = None
     serializer = None
+    renderer_classes = tuple(api_settings.DEFAULT_RENDERER_CLASSES) + BINARY_RENDERERS
 
     def __init__(self, **kwargs):
         self.queryset = self.queryset if hasattr(self, 'queryset') else self.model.objects.all()
         super(FilteredAPIView, self).__init__(**kwargs)
 
+    def get_tables(self, request):
+        return (self.model._meta.db_table,)
+
+    def perform_content_negotiation(self, request, force=False):
+        format = self.format_kwarg or request.query_params.get('format')
+        if not force and format in UNAVAILABLE_FORMATS:
+            raise NotAcceptable('Format "{}" needs the {} package, which is not installed'.format(
+                format, UNAVAILABLE_FORMATS[format]))
+        return super(FilteredListView, self).perform_content_negotiation(request, force)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super(FilteredListView, self).finalize_response(
+            request, response, *args, **kwargs)
+        # Errors are reported in JSON, whatever format was asked for
+        if isinstance(response, Response) and response.status_code >= 400 \
+                and getattr(response.accepted_renderer, 'render_style', 'text') == 'binary':
+            response.accepted_renderer = JSONRenderer()
+            response.accepted_media_type = JSONRenderer.media_type
+        return response
+
+    def row_fields(self):
+        """
+        Return the field names of a row, as listed in the row serializer.
+        """
+        return self.serializer._declared_fields['data'].child.Meta.fields
+
     def get(self, request, format=None):
         if request.query_params:
             # Generate query filter dict
@@ -240,12 +453,79 @@ class FilteredListView(FilteredAPIView):
         else:
             qs = self.queryset.all()
 
+        # The first page has counted the rows already
+        default_count = 'none' if 'cursor' in request.query_params else 'exact'
+        count_mode = request.query_params.get('count', default_count)
+        if count_mode not in COUNT_MODES:
+            return error_response('Query parameter "count" must be one of: {}'.format(
+                ', '.join(COUNT_MODES)))
+
+        stream_format = request.query_params.get('stream')
+        if stream_format is not None:
+            if stream_format not in STREAM_CONTENT_TYPES:
+                return error_response('Query parameter "stream" must be one of: {}'.format(
+                    ', '.join(sorted(STREAM_CONTENT_TYPES))))
+            return stream_response(qs, self.row_fields(), stream_format,
+                                   self.model._meta.db_table,
+                                   rows=count_rows(qs, count_mode))
+
+        if 'page_size' in request.query_params or 'cursor' in request.query_params:
+            return self.get_page(request, qs, count_mode)
+
+        if wants_columnar(request):
+            fields = self.row_fields()
+            with timed(request, 'serializer_time'):
+                data = columnar_envelope({'error': None, 'rows': count_rows(qs, count_mode)},
+                                         fields, list(qs.values_list(*fields)))
+            return Response(data)
+
         serializer = self.serializer({
             'error': None,
-            'rows': qs.count(),
+            'rows': count_rows(qs, count_mode),
             'data': qs
         })
-        return Response(serializer.data)
+        with timed(request, 'serializer_time'):
+            data = serializer.data
+        return Response(data)
+
+    def get_page(self, request, qs, count_mode):
+        """
+        Return the page of qs that follows the "cursor" query parameter.
+        """
+        try:
+            page_size = int(request.query_params.get('page_size', default_page_size()))
+        except ValueError:
+            page_size = 0
+        if not 1 <= page_size <= MAX_PAGE_SIZE:
+            return error_response('Query parameter "page_size" must be from 1 to {}'.format(
+                MAX_PAGE_SIZE))
+        # The page and the count are independent queries
+        try:
+            (rows, next_cursor), count = run_concurrently([
+                partial(keyset_page, qs, page_size, request.query_params.get('cursor')),
+                partial(count_rows, qs, count_mode),
+            ])
+        except InvalidCursor:
+            return error_response('Invalid cursor')
+        if wants_columnar(request):
+            fields = self.row_fields()
+            with timed(request, 'serializer_time'):
+                data = columnar_envelope(
+                    {'error': None, 'rows': count}, fields,
+                    [tuple(getattr(row, field) for field in fields) for row in rows])
+        else:
+            serializer = self.serializer({
+                'error': None,
+                'rows': count,
+                'data': rows
+            })
+            with timed(request, 'serializer_time'):
+                data = OrderedDict(serializer.data)
+        data['next'] = None
+        if next_cursor is not None:
+            data['next'] = replace_query_param(
+                request.build_absolute_uri(), 'cursor', next_cursor)
+        return Response(data)
 
 
 class MetadataView(FilteredListView):
@@ -288,31 +568,19 @@ class CommodityAreaTable(FilteredAPIView):
     """
     Table of (commodity -> area) for Oregon or selected county and only from the most recent year in the DB (Section B).
     """
-    @staticmethod
-    def fill_in_data(query):
-        """Populate data array from the query"""
-
-        data_array = query.values('commodity', 'acres')
-        commodity_list = query.distinct('commodity').values_list('commodity', flat=True)
-
-        tempdata = []
-
-        for commodity in commodity_list:
-            acres = data_array.filter(commodity=commodity).aggregate(Sum('acres'))['acres__sum']
-            tempdata.append({
-                'commodity': commodity,
-                'acres': acres
-            })
-
-        return tempdata
+    tables = ('nass_commodity_area',)
 
+    @cached_result
     def get(self, request, format=None):
         """Return table of county or Oregon state (commodity -> farm area) for the most recent year for which data is available.
         """
-        # Fetch metadata and region lookup tables from database if necessary
-        cache_lookups()
+        ref = reference_data()
+        columns = self.column_table('nass_commodity_area')
         # Get the most recent year for commodity area
-        latest_year = get_most_recent_year(NassCommodityArea)
+        if columns is not None:
+            latest_year = columns.most_recent_year()
+        else:
+            latest_year = get_most_recent_year(NassCommodityArea)
         data = {
             'error': None,
             'unit': "acres",
@@ -321,16 +589,14 @@ class CommodityAreaTable(FilteredAPIView):
             'data': [],
             'total_acres': 0
         }
-        qs = NassCommodityArea.objects.filter(
-            acres__isnull=False,
-            year=latest_year
-        ).exclude(commodity='Total Acres')
+        lookups = {'year': latest_year}
+        exclude = {'commodity': 'Total Acres'}
 
         query_params = request.query_params.copy()  # create mutable copy
         if 'county' in query_params:
             # remove county from query_params because of region_to_fips mapping
             county = query_params.pop('county')[0]
-            qs = qs.filter(fips=region_to_fips[county]['fips'])
+            lookups['fips'] = ref.region_to_fips[county]['fips']
             data.update({
                 'description': data['description'].format(county) + ' County',
                 'region': county,
@@ -345,10 +611,20 @@ class CommodityAreaTable(FilteredAPIView):
         all_fields = [f.name for f in NassCommodityArea._meta.fields]
         filters = self.query_dict(query_params, all_fields)
         # data['filters'] = filters
-        qs = qs.filter(**filters)
-
-        data['data'] = self.fill_in_data(qs)
-        data['total_acres'] = qs.aggregate(Sum('acres'))['acres__sum']
+        try:
+            if columns is not None:
+                try:
+                    mask = columns.select(valid_only=True, exclude=exclude, **dict(lookups, **filters))
+                    data['data'], data['total_acres'] = columns.aggregate_table(mask, 'commodity')
+                    return Response(data)
+                except UnsupportedFilter:
+                    pass
+            qs = NassCommodityArea.objects.filter(acres__isnull=False, **lookups) \
+                .exclude(**exclude).filter(**filters)
+        except ValueError as error:
+            return error_response('Invalid filter value: {}'.format(error))
+
+        data['data'], data['total_acres'] = aggregate_table(qs, 'commodity', 'acres')
         return Response(data)
 
 
@@ -388,12 +664,11 @@ class SubsidyDollarsList(FilteredListView):
 
     Example filtering: "?year=2012&year=2003&commodity=Tree&county=Baker" to get Tree data from Baker county for both 2012 and 2003.
     """
-    cache_lookups()
     model = SubsidyDollars
     serializer = SubsidyDollarsSerializerWrapped
 
 
-class SubsidyDollarsTable(APIView):
+class SubsidyDollarsTable(VersionedAPIView):
     """
     Table of county or Oregon state (commodity -> subsidy
     dollars) for the most recent year for which data is available in the DB.
@@ -404,24 +679,20 @@ class SubsidyDollarsTable(APIView):
     Example:
     /table/subsidy_dollars/?county=Linn
     """
-    @staticmethod
-    def fill_in_data(query, fields=(), **kwargs):
-        """Populate data array from the query"""
-        data = query.values(*fields)
-
-        if kwargs.get('unique', False):
-            pass
-
-        return data
+    tables = ('subsidy_dollars',)
 
+    @cached_result
     def get(self, request, format=None):
-        # Fetch metadata and region lookup tables from database if necessary
-        cache_lookups()
+        ref = reference_data()
+        columns = self.column_table('subsidy_dollars')
         # Get the most recent year for subsidy dollars
-        latest_year = get_most_recent_year(SubsidyDollars)
+        if columns is not None:
+            latest_year = columns.most_recent_year()
+        else:
+            latest_year = get_most_recent_year(SubsidyDollars)
         data = {
             'error': None,
-            'unit': metadata_dict['subsidy_dollars']['unit'],
+            'unit': ref.metadata['subsidy_dollars']['unit'],
             'year': latest_year,
             'description': 'Subsidy dollars for each commodity in {}',
             'data': []
@@ -429,32 +700,26 @@ class SubsidyDollarsTable(APIView):
         # If a county has been selected in the query parameters
         if 'county' in request.query_params:
             county = request.query_params['county']
-            subsidy_dollars = SubsidyDollars.objects.filter(
-                year=latest_year,
-                fips=region_to_fips[county.capitalize()]['fips'])
+            fips = ref.region_to_fips[county.capitalize()]['fips']
             data['description'] = data['description'].format(county) + ' County'
-            data.update({
-                'rows': subsidy_dollars.count(),
-                'region': county,
-            })
-            data['data'] = self.fill_in_data(subsidy_dollars,
-                                             fields=('commodity', 'subsidy_dollars'))
+            data['region'] = county
         # If no county is specified, return Oregon total subsidies
         else:
-            subsidy_dollars = SubsidyDollars.objects.filter(
-                year=latest_year,
-                fips=41000)
+            fips = OREGON_FIPS
             data['description'] = data['description'].format('Oregon')
-            data.update({
-                'rows': subsidy_dollars.count(),
-                'region': 'Oregon (Statewide)',
-            })
-            data['data'] = self.fill_in_data(subsidy_dollars,
-                                             fields=('commodity', 'subsidy_dollars'))
+            data['region'] = 'Oregon (Statewide)'
+        # One row per commodity, like the table has for a county and year
+        if columns is not None:
+            data['data'] = columns.aggregate_by(
+                columns.select(year=latest_year, fips=fips), 'commodity')
+        else:
+            subsidy_dollars = SubsidyDollars.objects.filter(year=latest_year, fips=fips)
+            data['data'] = aggregate_by(subsidy_dollars, 'commodity', 'subsidy_dollars')
+        data['rows'] = len(data['data'])
         return Response(data)
 
 
-class SubsidyDollarsTimeline(APIView):
+class SubsidyDollarsTimeline(VersionedAPIView):
     """
     Table of county or Oregon state (year -> subsidy dollars) totaled over all commodities.
 
@@ -464,124 +729,125 @@ class SubsidyDollarsTimeline(APIView):
     Example:
     /table/subsidy_dollars_timeline/?county=Linn
     """
-    @staticmethod
-    def fill_in_data(query, fields=(), **kwargs):
-        """Populate data array from the query"""
-        data = query.values(*fields)
-
-        if kwargs.get('unique', False):
-            pass
-
-        return data
+    tables = ('subsidy_dollars',)
 
+    @cached_result
     def get(self, request, format=None):
-        # Fetch metadata and region lookup tables from database if necessary
-        cache_lookups()
+        ref = reference_data()
         data = {
             'error': None,
-            'unit': metadata_dict['subsidy_dollars']['unit'],
+            'unit': ref.metadata['subsidy_dollars']['unit'],
             'description': 'Subsidy dollar totals in each year in {}',
             'data': []
         }
-        qs = SubsidyDollars.objects.all()
+        lookups = {}
         county = request.query_params.get('county', None)
         if county:
-            top_qs = qs.filter(fips=region_to_fips[county.capitalize()]['fips'])
-            # Build a list of unique sorted years
-            years_set = set(top_qs.values_list('year', flat=True))
-            years = sorted(list(years_set))
-            for year in years:
-                qs = top_qs.filter(year=year)
-                total_subsidy = qs.aggregate(Sum('subsidy_dollars'))['subsidy_dollars__sum']
-                data['data'].append(
-                    {"year": year, "subsidy_dollars": total_subsidy}
-                )
+            lookups['fips'] = ref.region_to_fips[county.capitalize()]['fips']
             data['description'] = data['description'].format(county) + ' County'
-            data.update({
-                'rows': len(years),
-                'region': county,
-            })
+            data['region'] = county
         # If no county is specified, return Oregon total subsidies
         else:
-            years_set = set(qs.values_list('year', flat=True))
-            years = sorted(list(years_set))
-            for year in years:
-                new_qs = qs.filter(year=year)
-                total_subsidy = new_qs.aggregate(Sum('subsidy_dollars'))['subsidy_dollars__sum']
-                data['data'].append(
-                    {"year": year, "subsidy_dollars": total_subsidy}
-                )
             data['description'] = data['description'].format('Oregon')
-            data.update({
-                'rows': len(years),
-                'region': 'Oregon (Statewide)',
-            })
+            data['region'] = 'Oregon (Statewide)'
+        columns = self.column_table('subsidy_dollars')
+        if columns is not None:
+            data['data'] = columns.timeline(columns.select(**lookups))
+        else:
+            qs = SubsidyDollars.objects.filter(**lookups)
+            data['data'] = timeline(qs, 'year', 'subsidy_dollars')
+        data['rows'] = len(data['data'])
         return Response(data)
 
 
-class SubsidyDollarsTopFiveCounties(APIView):
+class SubsidyDollarsTopFiveCounties(VersionedAPIView):
     """
     Top five counties plus Oregon (statewide) subsidy summed over all
     commodities.
     """
+    tables = ('subsidy_dollars',)
+
+    @cached_result
     def get(self, request, format=None):
-        cache_lookups()
+        ref = reference_data()
+        columns = self.column_table('subsidy_dollars')
         # Get the most recent year for subsidy dollars
-        latest_year = get_most_recent_year(SubsidyDollars)
+        if columns is not None:
+            latest_year = columns.most_recent_year()
+        else:
+            latest_year = get_most_recent_year(SubsidyDollars)
         data = {
             'error': None,
-            'unit': metadata_dict['subsidy_dollars']['unit'],
+            'unit': ref.metadata['subsidy_dollars']['unit'],
             'year': latest_year,
             'description': 'Subsidy dollars for top five counties',
             'data': []
         }
-        qs = SubsidyDollars.objects. \
-            filter(year=latest_year)
-        subs_c = Counter()
-        for subs in qs:
-            region = fips_to_region[subs.fips]['region']
-            subs_c[region] = subs_c.get(region, 0) + subs.subsidy_dollars
-        top_six_comm = dict(subs_c.most_common(6))
+        # Oregon (statewide) is one of the rows, so fetch the top six
+        if columns is not None:
+            rows = columns.aggregate_by(columns.select(year=latest_year), 'fips',
+                                        order_by='-subsidy_dollars', limit=6)
+        else:
+            qs = SubsidyDollars.objects.filter(year=latest_year)
+            rows = aggregate_by(qs, 'fips', 'subsidy_dollars',
+                                order_by='-subsidy_dollars', limit=6)
+        top_six_comm = {
+            ref.fips_to_region[row['fips']]['region']: row['subsidy_dollars']
+            for row in rows
+        }
         data['data'].append(top_six_comm)
         return Response(data)
 
 
-class SubsidyDollarsTopFiveCommodities(APIView):
+class SubsidyDollarsTopFiveCommodities(VersionedAPIView):
     """
     Top five commodities subsidy summed over all counties.
     """
+    tables = ('subsidy_dollars',)
+
+    @cached_result
     def get(self, request, format=None):
-        cache_lookups()
+        ref = reference_data()
+        columns = self.column_table('subsidy_dollars')
         # Get the most recent year for subsidy dollars
-        latest_year = get_most_recent_year(SubsidyDollars)
+        if columns is not None:
+            latest_year = columns.most_recent_year()
+        else:
+            latest_year = get_most_recent_year(SubsidyDollars)
         data = {
             'error': None,
-            'unit': metadata_dict['subsidy_dollars']['unit'],
+            'unit': ref.metadata['subsidy_dollars']['unit'],
             'year': latest_year,
             'description': 'Subsidy dollars for top five commodities',
             'data': []
         }
-        qs = SubsidyDollars.objects.filter(
-            year=latest_year
-        )
-        subs_c = Counter()
-        for subs in qs:
-            subs_c[subs.commodity] = subs_c.get(subs.commodity, 0) + subs.subsidy_dollars
-        top_five_comm = dict(subs_c.most_common(5))
+        if columns is not None:
+            rows = columns.aggregate_by(columns.select(year=latest_year), 'commodity',
+                                        order_by='-subsidy_dollars', limit=5)
+        else:
+            qs = SubsidyDollars.objects.filter(
+                year=latest_year
+            )
+            rows = aggregate_by(qs, 'commodity', 'subsidy_dollars',
+                                order_by='-subsidy_dollars', limit=5)
+        top_five_comm = {
+            row['commodity']: row['subsidy_dollars'] for row in rows
+        }
         data['data'].append(top_five_comm)
         return Response(data)
 
 
-class CropDiversityList(APIView):
+class CropDiversityList(VersionedAPIView):
     """
     List crop diversity scores for Oregon counties, and average score over all counties.
     """
+    @cached_result
     def get(self, request, format=None):
-        cache_lookups()
+        ref = reference_data()
         # Get the most recent year for subsidy dollars
         data = {
             'error': None,
-            'unit': metadata_dict['crop_diversity']['unit'],
+            'unit': ref.metadata['crop_diversity']['unit'],
             'description': 'Crop diversity scores for Oregon counties',
             'average_diversity_score': None,
             'data': []
@@ -589,8 +855,8 @@ class CropDiversityList(APIView):
         total_div_score = 0
         total_counties = 0
         diversity_dict = {}
-        for fips, value in fips_to_region.items():
-            if fips != 41000:
+        for fips, value in ref.fips_to_region.items():
+            if fips != OREGON_FIPS:
                 total_div_score += value['crop diversity score']
                 total_counties += 1
                 diversity_dict[value['region']] = value['crop diversity score']
@@ -611,39 +877,48 @@ class SubsidyRecipientsList(FilteredListView):
     serializer = SubsidyRecipientsSerializerWrapped
 
 
-class CountyStatisticsList(APIView):
+class CountyStatisticsList(VersionedAPIView):
     """
     List bucketed statistics, county name, fips for all Oregon counties. Table
     values are summed over all commodities in the selected year, which is the
     most recent year available, unless year is specified as a query parameter.
     """
+    tables = (
+        'subsidy_dollars',
+        'subsidy_recipients',
+        'nass_commodity_farms',
+        'nass_commodity_area',
+    )
 
     @staticmethod
-    def find_stats(fips_no_or, year, model, value_field):
+    def find_stats(fips_no_or, year, model, value_field, columns=None):
         """
         Return a {fips: grade} dictionary, mean, stddev for a dataset (model)
         in a given year.
+
+        The dataset is summed per county in a single grouped query, or from
+        its ColumnTable (columns) when given. Rows without a value are left
+        out, which doesn't change the sums and lets the query use the partial
+        (<value> IS NOT NULL) indexes of the fact tables.
         """
-        qs = model.objects.filter(year=year)
-        items = []
-        value_field_sum_key = value_field + "__sum"
-        for f in fips_no_or:
-            item = qs.filter(fips=f).aggregate(Sum(value_field))[value_field_sum_key]
-            # If the Sum() returned None, change it to zero.
-            if item is None:
-                item = 0
-            else:
-                # This type conversion is needed for DecimalField type data
-                item = float(item)
-            items.append(item)
+        if columns is not None:
+            rows = columns.aggregate_by(
+                columns.select(valid_only=True, year=year, fips__in=fips_no_or), 'fips')
+        else:
+            qs = model.objects.filter(year=year, fips__in=fips_no_or,
+                                      **{value_field + '__isnull': False})
+            rows = aggregate_by(qs, 'fips', value_field)
+        sums = {row['fips']: row[value_field] for row in rows}
+        # Counties without data, or with a None Sum(), count as zero. The
+        # float conversion is needed for DecimalField type data.
+        items = np.array([float(sums.get(f) or 0) for f in fips_no_or])
         mean, stddev = mean_stddev(items)
-        grades = {}
-        for idx, f in enumerate(fips_no_or):
-            grades[f] = grade(mean, stddev, items[idx])
+        grades = dict(zip(fips_no_or, grade_all(mean, stddev, items)))
         return (grades, mean, stddev)
 
+    @cached_result
     def get(self, request, format=None):
-        cache_lookups()
+        ref = reference_data()
         # Check for requested year
         year_qp = request.query_params.get('year', None)
         data = {
@@ -654,38 +929,40 @@ class CountyStatisticsList(APIView):
         }
         if year_qp is None:
             # The most recent year for SubsidyDollars will be used for all stats
-            year = get_most_recent_year(SubsidyDollars)
+            columns = self.column_table('subsidy_dollars')
+            if columns is not None:
+                year = columns.most_recent_year()
+            else:
+                year = get_most_recent_year(SubsidyDollars)
         else:
             year = year_qp
         data['year'] = year
 
         results = {}
         # List of fips (integer) for all counties; excludes Oregon (statewide)
-        fips_no_or = [f for f in fips_to_region.keys() if f > 41000]
+        fips_no_or = [f for f in ref.fips_to_region.keys() if f > OREGON_FIPS]
         # Crop Diversity stats
-        items = [fips_to_region[f]['crop diversity score'] for f in fips_no_or]
+        items = [ref.fips_to_region[f]['crop diversity score'] for f in fips_no_or]
         mean, stddev = mean_stddev(items)
         data['stats']['cropDiversity'] = {'mean': mean, 'stddev': stddev}
-        grades = {}
-        for idx, f in enumerate(fips_no_or):
-            grades[f] = grade(mean, stddev, items[idx])
-        results['cropDiversity'] = grades
-        # Subsidy Dollars stats
-        stats, mean, stddev = self.find_stats(fips_no_or, year, SubsidyDollars, 'subsidy_dollars')
-        results['subsidyLevel'] = stats
-        data['stats']['subsidyLevel'] = {'mean': mean, 'stddev': stddev}
-        # Subsidy Recipients stats
-        stats, mean, stddev = self.find_stats(fips_no_or, year, SubsidyRecipients, 'subsidy_recipients')
-        results['subsidyRecipients'] = stats
-        data['stats']['subsidyRecipients'] = {'mean': mean, 'stddev': stddev}
-        # NASS Commodity Farms stats
-        stats, mean, stddev = self.find_stats(fips_no_or, year, NassCommodityFarms, 'farms')
-        results['numberOfFarms'] = stats
-        data['stats']['numberOfFarms'] = {'mean': mean, 'stddev': stddev}
-        # NASS Commodity Area (Production) stats
-        stats, mean, stddev = self.find_stats(fips_no_or, year, NassCommodityArea, 'acres')
-        results['cropProduction'] = stats
-        data['stats']['cropProduction'] = {'mean': mean, 'stddev': stddev}
+        results['cropDiversity'] = dict(zip(fips_no_or, grade_all(mean, stddev, items)))
+        # Subsidy dollars, subsidy recipients, NASS commodity farms and NASS
+        # commodity area (production) stats, from the column store or queried
+        # concurrently
+        datasets = (
+            ('subsidyLevel', SubsidyDollars, 'subsidy_dollars'),
+            ('subsidyRecipients', SubsidyRecipients, 'subsidy_recipients'),
+            ('numberOfFarms', NassCommodityFarms, 'farms'),
+            ('cropProduction', NassCommodityArea, 'acres'),
+        )
+        all_stats = run_concurrently(
+            partial(self.find_stats, fips_no_or, year, model, value_field,
+                    self.column_table(model._meta.db_table))
+            for key, model, value_field in datasets
+        )
+        for (key, model, value_field), (stats, mean, stddev) in zip(datasets, all_stats):
+            results[key] = stats
+            data['stats'][key] = {'mean': mean, 'stddev': stddev}
         for fips in fips_no_or:
             stats_dict = {}
             stats_dict['subsidyLevel'] = results['subsidyLevel'][fips]
@@ -694,13 +971,13 @@ class CountyStatisticsList(APIView):
             stats_dict['cropProduction'] = results['cropProduction'][fips]
             stats_dict['cropDiversity'] = results['cropDiversity'][fips]
             stats_dict['fips'] = fips
-            stats_dict['county'] = fips_to_region[fips]['region']
+            stats_dict['county'] = ref.fips_to_region[fips]['region']
             data['data'].append(stats_dict)
         data['rows'] = len(data['data'])
         return Response(data)
 
 
-class OregonExportsTimeline(APIView):
+class OregonExportsTimeline(VersionedAPIView):
     """
     Table of Oregon state (year -> export) for a selected commodity.
 
@@ -710,51 +987,109 @@ class OregonExportsTimeline(APIView):
     Example:
     /table/oregon_exports_timeline/?commodity=Quinoa
     """
+    tables = ('exports_rollup',)
 
+    @cached_result
     def get(self, request, format=None):
-        # Fetch metadata and region lookup tables from database if necessary
-        cache_lookups()
         data = {
             'error': None,
             'data': []
         }
-        qs = ExportsHistoricalCleaned.objects.all()
+        qs = ExportsRollup.objects.filter(level='year')
         commodity = request.query_params.get('commodity', None)
         if commodity:
-            top_qs = qs.filter(commodity=commodity)
-            # Build a list of unique sorted years
-            years_set = set(top_qs.values_list('time_year', flat=True))
-            years = sorted(list(years_set))
-            for year in years:
-                qs = top_qs.filter(time_year=year)
-                export = qs.aggregate(Sum('value_num'))['value_num__sum']
-                data['data'].append(
-                    {"year": year, "export": export}
-                )
+            qs = ExportsRollup.objects.filter(level='commodity', category=commodity)
             data.update({
-                'rows': len(years),
                 'commodity': commodity,
                 'description': 'Oregon exports of {} in each year'.format(commodity),
             })
         # If no commodity is specified, return Oregon total export
         else:
-            years_set = set(qs.values_list('time_year', flat=True))
-            years = sorted(list(years_set))
-            for year in years:
-                new_qs = qs.filter(time_year=year)
-                export = new_qs.aggregate(Sum('value_num'))['value_num__sum']
-                data['data'].append(
-                    {"year": year, "export": export}
-                )
             data.update({
-                'rows': len(years),
                 'commodity': 'All',
                 'description': 'Oregon total exports in each year',
             })
+        data['data'] = timeline(qs, 'time_year', 'value', 'export')
+        data['rows'] = len(data['data'])
         return Response(data)
 
 
-class OregonExportCommodities(APIView):
+class TimelineView(FilteredAPIView):
+    """
+    Table of (year -> value) for any dataset, summed over all rows selected by
+    the query parameters. Parameter "dataset" (required) is one of the table
+    names listed in the metadata, e.g. "subsidy_dollars" or
+    "exports_historical_cleaned".
+
+    Repeat "county" or "commodity" to get one timeline (series) per value in a
+    single request. When both are given, the series are per county and the
+    commodities filter the rows. Without either, a single series is summed
+    over all rows of the dataset. Years without rows are left out of a
+    series rather than given as zero.
+
+    Example:
+    /table/timeline/?dataset=subsidy_dollars&county=Linn&county=Benton&commodity=Wheat
+    """
+    series_params = ('county', 'commodity')
+
+    def get_tables(self, request):
+        dataset = get_dataset(request.query_params.get('dataset'))
+        return (dataset.name,) if dataset is not None else ()
+
+    @cached_result
+    def get(self, request, format=None):
+        ref = reference_data()
+        dataset = get_dataset(request.query_params.get('dataset'))
+        if dataset is None:
+            return error_response('Query parameter "dataset" must be one of: {}'.format(
+                ', '.join(DATASETS)))
+        filter_fields = [p for p in self.series_params
+                         if p == 'county' and 'fips' in dataset.dimensions
+                         or p in dataset.dimensions]
+        try:
+            filters = self.query_dict(request.query_params, filter_fields)
+        except KeyError as error:
+            return error_response('Unknown county: {}'.format(error.args[0]))
+        columns = self.column_table(dataset.name)
+        if columns is not None:
+            mask = columns.select(valid_only=True, **filters)
+        else:
+            qs = dataset_queryset(dataset).filter(**filters)
+        data = {
+            'error': None,
+            'dataset': dataset.name,
+            'unit': ref.metadata.get(dataset.name, {}).get('unit'),
+            'description': 'Totals of {} in each year'.format(dataset.value_field),
+            'series': None,
+            'data': []
+        }
+        series_param = next(
+            (p for p in filter_fields if p in request.query_params), None)
+        if series_param is None:
+            if columns is not None:
+                rows = columns.timeline(mask)
+            else:
+                rows = timeline(qs, dataset.year_field, dataset.value_field)
+            data['data'].append({'name': 'All', 'data': rows})
+        else:
+            series_field = 'fips' if series_param == 'county' else series_param
+            data['series'] = series_param
+            if columns is not None:
+                series = columns.timeline_series(mask, series_field)
+            else:
+                series = timeline_series(
+                    qs, series_field, dataset.year_field, dataset.value_field)
+            for name, rows in series.items():
+                if series_param == 'county':
+                    name = ref.fips_to_region[name]['region']
+                data['data'].append({'name': name, 'data': rows})
+        for series in data['data']:
+            series['rows'] = len(series['data'])
+        data['rows'] = len(data['data'])
+        return Response(data)
+
+
+class OregonExportCommodities(VersionedAPIView):
     """
     List of Oregon export commodities. Choose from this list to filter the
     exports timeline.
@@ -762,29 +1097,31 @@ class OregonExportCommodities(APIView):
     Example:
     /table/oregon_export_commodities/
     """
+    tables = ('exports_rollup',)
 
+    @cached_result
     def get(self, request, format=None):
-        # Fetch metadata and region lookup tables from database if necessary
-        cache_lookups()
         data = {
             'error': None,
             'description': 'List of Oregon export commodities',
             'data': []
         }
-        qs = ExportsHistoricalCleaned.objects.values_list('commodity', flat=True)
+        qs = ExportsRollup.objects.filter(level='commodity').values_list('category', flat=True)
         commodities = sorted(list(set(qs)))
         data['data'].extend(commodities)
         data['rows'] = len(commodities)
         return Response(data)
 
 
-class ExportsTopFiveCommodities(APIView):
+class ExportsTopFiveCommodities(VersionedAPIView):
     """
     Top five exported commodities from Oregon in a year (default 2016).
     A year may be specified in query parameters.
     """
+    tables = ('exports_rollup',)
+
+    @cached_result
     def get(self, request, format=None):
-        cache_lookups()
         # Pick the year for the export data set
         year = request.query_params.get('year', '2016')
         data = {
@@ -793,76 +1130,505 @@ class ExportsTopFiveCommodities(APIView):
             'description': 'Top five exported commodities from Oregon in {}'.format(year),
             'data': []
         }
-        comms_qs = ExportsHistoricalCleaned.objects.values_list('commodity', flat=True)
-        commodities = sorted(list(set(comms_qs)))
-        qs = ExportsHistoricalCleaned.objects.filter(time_year=year)
-        exports = []
-        for c in commodities:
-            qs_count = qs.filter(commodity=c).count()
-            if qs_count == 0:
-                continue
-            export = float(qs.filter(commodity=c).aggregate(Sum('value_num'))['value_num__sum'])
-            exports.append((export, c))
-        data['data'].extend(sorted(exports, reverse=True)[:5])
+        qs = ExportsRollup.objects.filter(level='commodity', time_year=year)
+        rows = aggregate_by(qs, 'category', 'value', order_by='-value', limit=5)
+        exports = [(row['value'], row['category']) for row in rows]
+        data['data'].extend(exports)
         return Response(data)
 
 
-class ProductionAndRevenue(APIView):
+class ExportsSeasonality(VersionedAPIView):
     """
-    Produced value and revenue by county, crop and year in Oregon.
+    Table of Oregon state (month -> export) in each year, with the share of
+    every month in the exports of its year. Repeat "year" to select years;
+    by default all years are returned.
+
+    Example:
+    /table/exports_seasonality/?year=2015&year=2016
     """
-    @staticmethod
-    def fix_fields(row):
-        commodity = row['commodity'].split('-')[1].strip().capitalize()
-        value_prod = float(row['value_produced'].strip('$').replace(',', ''))
-        value_sales = float(row['value_sales'].strip('$').replace(',', ''))
-        # Convert cents to $ using this multiplier
-        if row['price_unit_of_measure'] is None:
-            price_unit_mult = 0
-        elif row['price_unit_of_measure'].find('CTS/'):
-            price_unit_mult = 0.01
+    tables = ('exports_rollup',)
+
+    @cached_result
+    def get(self, request, format=None):
+        try:
+            years = [int(year) for year in request.query_params.getlist('year')]
+        except ValueError:
+            return error_response('Parameter "year" must be an integer')
+        data = {
+            'error': None,
+            'description': 'Oregon exports in each month of each year',
+            'data': []
+        }
+        qs = ExportsRollup.objects.filter(level__in=('year', 'month'))
+        if years:
+            qs = qs.filter(time_year__in=years)
+        rows = qs.order_by('time_year', 'level', 'time_month') \
+            .values_list('time_year', 'time_month', 'value')
+        totals = {}
+        series = OrderedDict()
+        for year, month, value in rows:
+            if month is None:
+                totals[year] = value
+            else:
+                series.setdefault(year, []).append((month, value))
+        for year, months in series.items():
+            total = totals.get(year)
+            data['data'].append({
+                'year': year,
+                'total': total,
+                'data': [
+                    {'month': month, 'export': value,
+                     'share': value / total if value is not None and total else None}
+                    for month, value in months
+                ],
+                'rows': len(months),
+            })
+        data['rows'] = len(data['data'])
+        return Response(data)
+
+
+class ExportsBreakdown(VersionedAPIView):
+    """
+    Table of Oregon state (category -> export) in a year, largest first, with
+    the share of every category in the total. Parameter "level" is
+    "hs_cat_lvl_1" (default), "hs_cat_lvl_2" or "commodity"; "year" defaults
+    to the most recent year. Give "parent" to drill down into a category of
+    the level above, e.g. the hs_cat_lvl_2 categories of an hs_cat_lvl_1
+    category, and "n" to get only the top n categories.
+
+    Example:
+    /table/exports_breakdown/?level=hs_cat_lvl_2&parent=Agriculture&year=2016
+    """
+    tables = ('exports_rollup',)
+    levels = ('hs_cat_lvl_1', 'hs_cat_lvl_2', 'commodity')
+
+    @cached_result
+    def get(self, request, format=None):
+        params = request.query_params
+        level = params.get('level', 'hs_cat_lvl_1')
+        if level not in self.levels:
+            return error_response('Parameter "level" must be one of: {}'.format(
+                ', '.join(self.levels)))
+        try:
+            year = int(params['year']) if 'year' in params else None
+            n = int(params['n']) if 'n' in params else None
+        except ValueError:
+            return error_response('Parameters "year" and "n" must be integers')
+        if n is not None and n < 1:
+            return error_response('Parameter "n" must be at least 1')
+        if year is None:
+            year = get_most_recent_year(ExportsRollup, 'time_year')
+        parent = params.get('parent')
+        qs = ExportsRollup.objects.filter(level=level, time_year=year, value__isnull=False)
+        if parent is not None:
+            if level == 'hs_cat_lvl_1':
+                return error_response('Level hs_cat_lvl_1 has no parent')
+            qs = qs.filter(parent=parent)
+        total = qs.aggregate(Sum('value'))['value__sum']
+        rows = aggregate_by(qs, 'category', 'value', order_by='-value', limit=n)
+        data = {
+            'error': None,
+            'level': level,
+            'year': year,
+            'parent': parent,
+            'total': total,
+            'description': 'Oregon exports by {} in {}'.format(level, year),
+            'data': [
+                {'category': row['category'], 'export': row['value'],
+                 'share': row['value'] / total if total else None}
+                for row in rows
+            ],
+        }
+        data['rows'] = len(data['data'])
+        return Response(data)
+
+
+class TradeByCountryView(VersionedAPIView):
+    """
+    Base class of the (country, commodity, year) tables of imports and
+    exports, summed in a single grouped query over the typed
+    trade_by_country rows of a flow, or the typed rows of another model and
+    source.
+    """
+    tables = ('trade_by_country',)
+    model = TradeByCountry
+    flow = None
+    # Source table of the rows, or None for all the rows of the flow
+    source = None
+    # {<group or filter parameter>: <field>}
+    fields = OrderedDict((
+        ('country', 'country_key'),
+        ('commodity', 'commodity_key'),
+        ('year', 'year'),
+        ('month', 'month'),
+    ))
+    default_group = ('country', 'commodity', 'year')
+
+    @cached_result
+    def get(self, request, format=None):
+        params = request.query_params
+        group = params.getlist('group') or list(self.default_group)
+        unknown = [name for name in group if name not in self.fields]
+        if unknown or len(set(group)) != len(group):
+            return error_response('Parameter "group" must be distinct values of: {}'.format(
+                ', '.join(self.fields)))
+        qs = self.model.objects.filter(flow=self.flow, value__isnull=False)
+        if self.source is not None:
+            qs = qs.filter(source=self.source)
+        try:
+            for name in ('year', 'month'):
+                if name in params:
+                    qs = qs.filter(**{name + '__in': [int(value) for value in params.getlist(name)]})
+        except ValueError:
+            return error_response('Parameters "year" and "month" must be integers')
+        for name in ('country', 'commodity'):
+            if name in params:
+                keys = [normalize_name(value)[1] for value in params.getlist(name)]
+                qs = qs.filter(**{self.fields[name] + '__in': keys})
+        group_fields = [self.fields[name] for name in group]
+        # The names of a key may differ in case, any of them is shown
+        names = dict(('name_' + name, Max(name)) for name in group
+                     if name in ('country', 'commodity'))
+        rows = qs.order_by().values(*group_fields) \
+            .annotate(total=Sum('value'), **names) \
+            .order_by(*group_fields)
+        data = {
+            'error': None,
+            'flow': self.flow,
+            'group': group,
+            'description': 'Oregon {}s by {}'.format(self.flow, ', '.join(group)),
+            'data': [
+                OrderedDict(
+                    [(name, row['name_' + name] if 'name_' + name in names else row[self.fields[name]])
+                     for name in group] +
+                    [('value', row['total'])])
+                for row in rows
+            ],
+        }
+        data['rows'] = len(data['data'])
+        return Response(data)
+
+
+class ExportsByCountry(TradeByCountryView):
+    """
+    Table of Oregon exports summed by country, commodity and year. Repeat
+    "country", "commodity", "year" or "month" to filter the rows; country and
+    commodity names are matched ignoring case and extra white space. Repeat
+    "group" to choose the fields to sum by, among "country", "commodity",
+    "year" and "month" (default country, commodity and year).
+
+    Example:
+    /table/exports_by_country/?country=Japan&group=commodity&group=year
+    """
+    flow = 'export'
+
+
+class ImportsByCountry(TradeByCountryView):
+    """
+    Table of Oregon imports summed by country, commodity and year. Repeat
+    "country", "commodity", "year" or "month" to filter the rows; country and
+    commodity names are matched ignoring case and extra white space. Repeat
+    "group" to choose the fields to sum by, among "country", "commodity",
+    "year" and "month" (default country, commodity and year).
+
+    Example:
+    /table/imports_by_country/?commodity=Wheat&group=country
+    """
+    flow = 'import'
+
+
+class ImportsHistorical(TradeByCountryView):
+    """
+    Table of Oregon imports from imports_historical_raw summed by commodity
+    and year. Repeat "commodity", "year" or "month" to filter the rows;
+    commodity names are matched ignoring case and extra white space. Repeat
+    "group" to choose the fields to sum by, among "commodity", "year" and
+    "month" (default commodity and year).
+
+    Example:
+    /table/imports_historical/?commodity=Wheat&group=year&group=month
+    """
+    tables = ('trade_totals',)
+    model = TradeTotals
+    flow = 'import'
+    source = 'imports_historical_raw'
+    fields = OrderedDict((
+        ('commodity', 'commodity_key'),
+        ('year', 'year'),
+        ('month', 'month'),
+    ))
+    default_group = ('commodity', 'year')
+
+
+class TradeTotalsTimeline(VersionedAPIView):
+    """
+    Table of Oregon (year -> value) or, with "period=monthly", (year, month
+    -> value) import or export totals, from the typed rows of the annual and
+    monthly totals tables. Parameter "flow" is "export" (default) or
+    "import". Repeat "commodity" to sum over those commodities only.
+
+    Example:
+    /table/trade_totals/?flow=import&period=monthly&commodity=Wheat
+    """
+    tables = ('trade_totals',)
+    sources = {
+        ('export', 'annual'): 'exports_historical_cleaned_annual_totals',
+        ('export', 'monthly'): 'exports_historical_cleaned_monthly_totals',
+        ('import', 'annual'): 'imports_historical_cleaned_annual_totals',
+        ('import', 'monthly'): 'imports_historical_cleaned_monthly_totals',
+    }
+
+    @cached_result
+    def get(self, request, format=None):
+        params = request.query_params
+        flow = params.get('flow', 'export')
+        period = params.get('period', 'annual')
+        source = self.sources.get((flow, period))
+        if source is None:
+            return error_response('Parameter "flow" must be export or import, '
+                                  '"period" annual or monthly')
+        qs = TradeTotals.objects.filter(source=source, year__isnull=False)
+        commodities = params.getlist('commodity')
+        if commodities:
+            qs = qs.filter(commodity_key__in=[normalize_name(c)[1] for c in commodities])
+        group_fields = ['year', 'month'] if period == 'monthly' else ['year']
+        rows = qs.order_by().values(*group_fields) \
+            .annotate(total=Sum('value')) \
+            .order_by(*group_fields)
+        data = {
+            'error': None,
+            'flow': flow,
+            'period': period,
+            'commodity': commodities or 'All',
+            'description': 'Oregon {} totals in each {}'.format(
+                flow, 'month' if period == 'monthly' else 'year'),
+            'data': [
+                OrderedDict([(field, row[field]) for field in group_fields] +
+                            [('value', row['total'])])
+                for row in rows
+            ],
+        }
+        data['rows'] = len(data['data'])
+        return Response(data)
+
+
+class TopView(FilteredAPIView):
+    """
+    Top "n" rows of a dataset, summed over all other fields and grouped by a
+    "dimension": "commodity", "county", "hs_cat_lvl_1" or "hs_cat_lvl_2",
+    as far as the dataset has that field. Parameter "dataset" (required) is
+    one of the table names listed in the metadata, e.g. "subsidy_dollars".
+
+    By default the top 5 in the most recent year of the dataset are returned.
+    Repeat "year" to sum over several years, or give "start_year" and/or
+    "end_year" for a range of years. "county" and "commodity" may be given to
+    filter the rows. The Oregon (statewide) rows are left out when ranking
+    counties.
+
+    Example:
+    /table/top/?dataset=subsidy_dollars&dimension=county&n=10&start_year=2010
+    """
+    dimension_fields = OrderedDict((
+        ('commodity', 'commodity'),
+        ('county', 'fips'),
+        ('hs_cat_lvl_1', 'hs_cat_lvl_1'),
+        ('hs_cat_lvl_2', 'hs_cat_lvl_2'),
+    ))
+    filter_params = ('county', 'commodity')
+    max_n = 100
+
+    def get_tables(self, request):
+        dataset = get_dataset(request.query_params.get('dataset'))
+        return (dataset.name,) if dataset is not None else ()
+
+    @cached_result
+    def get(self, request, format=None):
+        ref = reference_data()
+        params = request.query_params
+        dataset = get_dataset(params.get('dataset'))
+        if dataset is None:
+            return error_response('Query parameter "dataset" must be one of: {}'.format(
+                ', '.join(DATASETS)))
+        dimension = params.get('dimension', 'commodity')
+        group_field = self.dimension_fields.get(dimension)
+        if group_field not in dataset.dimensions:
+            return error_response('Dataset {} can not be ranked by {}'.format(
+                dataset.name, dimension))
+        try:
+            n = int(params.get('n', 5))
+            start_year = params.get('start_year')
+            end_year = params.get('end_year')
+            years = [int(year) for year in params.getlist('year')]
+            start_year = int(start_year) if start_year else None
+            end_year = int(end_year) if end_year else None
+        except ValueError:
+            return error_response('Parameters "n" and years must be integers')
+        if not 1 <= n <= self.max_n:
+            return error_response('Parameter "n" must be from 1 to {}'.format(self.max_n))
+
+        year_field = dataset.year_field
+        columns = self.column_table(dataset.name)
+        lookups = {}
+        if start_year is not None or end_year is not None:
+            if start_year is not None:
+                lookups[year_field + '__gte'] = start_year
+            if end_year is not None:
+                lookups[year_field + '__lte'] = end_year
         else:
-            price_unit_mult = 1
-        return (commodity, value_prod, value_sales, price_unit_mult)
+            if not years:
+                if columns is not None:
+                    years = [columns.most_recent_year()]
+                else:
+                    years = [get_most_recent_year(dataset.model, year_field)]
+            lookups[year_field + '__in'] = years
+        filter_fields = [p for p in self.filter_params
+                         if self.dimension_fields[p] in dataset.dimensions]
+        try:
+            lookups.update(self.query_dict(params, filter_fields))
+        except KeyError as error:
+            return error_response('Unknown county: {}'.format(error.args[0]))
+        exclude = {'fips': OREGON_FIPS} if group_field == 'fips' else {}
+
+        order_by = '-' + dataset.value_field
+        if columns is not None:
+            mask = columns.select(valid_only=True, exclude=exclude, **lookups)
+            rows = columns.aggregate_by(mask, group_field, order_by=order_by, limit=n)
+        else:
+            qs = dataset_queryset(dataset).filter(**lookups).exclude(**exclude)
+            rows = aggregate_by(qs, group_field, dataset.value_field,
+                                order_by=order_by, limit=n)
+        if group_field == 'fips':
+            rows = [
+                {'county': ref.fips_to_region[row['fips']]['region'],
+                 dataset.value_field: row[dataset.value_field]}
+                for row in rows
+            ]
+        data = {
+            'error': None,
+            'dataset': dataset.name,
+            'unit': ref.metadata.get(dataset.name, {}).get('unit'),
+            'dimension': dimension,
+            'n': n,
+            'years': years,
+            'start_year': start_year,
+            'end_year': end_year,
+            'description': 'Top {} {} by {}'.format(n, dimension, dataset.value_field),
+            'rows': len(rows),
+            'data': rows
+        }
+        return Response(data)
+
 
+class ProductionAndRevenue(VersionedAPIView):
+    """
+    Produced value and revenue by county, crop and year in Oregon.
+
+    Results may be filtered by county, commodity and year, e.g.
+    "?county=Marion&commodity=Hops&year=2014&year=2015".
+    """
+    tables = ('oain_production_revenue',)
+    filter_fields = ['county', 'commodity', 'year']
+
+    @cached_result
     def get(self, request, format=None):
-        cache_lookups()
-        # Pick the year for the export data set
-        # year = request.query_params.get('year', '2016')
         data = {
             'error': None,
             'description': 'Produced value and revenue by county, crop and year in Oregon',
             'data': []
         }
-        fields = [
-            'commodity',
-            'county',
-            'year',
-            'production_unit',
-            'value_produced',
-            'value_sales',
-            'price_unit_of_measure'
-        ]
-        oain = RawOainData.objects.exclude(production_unit=0, price_unit_of_measure__isnull=True).values(*fields)
+        # The county names of the OAIN data are used as they are, so the
+        # filters are not those of FilteredAPIView.query_dict()
+        filters = {
+            param + '__in': request.query_params.getlist(param)
+            for param in self.filter_fields if param in request.query_params
+        }
+        oain = OainProductionRevenue.objects.filter(**filters).order_by('id') \
+            .values_list('county', 'commodity', 'year', 'produced_value', 'revenue')
         # rev_dict holds all data returned by the endpoint
         rev_dict = {}
-        for row in oain:
-            county = row['county']
-            year = row['year']
-            prod_unit = row['production_unit']
-            commodity, value_prod, value_sales, price_unit_mult = self.fix_fields(row)
-            # Calculate the produced value and revenue
-            produced_value = 1000 * value_prod
-            revenue = 1000 * value_sales
-            # Add to rev_dict
-            if county not in rev_dict:
-                rev_dict[county] = {}
-            if commodity not in rev_dict[county]:
-                rev_dict[county][commodity] = {}
-            rev_dict[county][commodity][year] = {
+        for county, commodity, year, produced_value, revenue in oain:
+            rev_dict.setdefault(county, {}).setdefault(commodity, {})[year] = {
                 "Produced value": produced_value,
                 "Revenue": revenue
             }
         data['rows'] = len(rev_dict)
         data['data'].append(rev_dict)
         return Response(data)
+
+
+class CommoditySearch(VersionedAPIView):
+    """
+    Search of the commodities of every dataset, for autocompletion. Returns
+    the commodities matching "q" best: exactly, by prefix, by the prefix of
+    a word or by similarity, with the datasets and years each appears in.
+    "n" is the number of results (default 10, at most 100); repeat "dataset"
+    to search the commodities of those datasets only.
+
+    Searches are answered from an in-memory index (see api.commodities), so
+    the results aren't kept in the result cache.
+
+    Example:
+    /commodities/search/?q=whe
+    """
+    tables = SEARCH_TABLES
+
+    def get(self, request, format=None):
+        params = request.query_params
+        query = params.get('q', '').strip()
+        if not query:
+            return error_response('Parameter "q" is required')
+        try:
+            n = int(params.get('n', 10))
+        except ValueError:
+            return error_response('Parameter "n" must be an integer')
+        if not 1 <= n <= 100:
+            return error_response('Parameter "n" must be between 1 and 100')
+        tables = params.getlist('dataset') or None
+        if tables is not None and not set(tables) <= set(SEARCH_TABLES):
+            return error_response('Parameter "dataset" must be one of: {}'.format(
+                ', '.join(SEARCH_TABLES)))
+        index = commodity_index.get(self.dataset_versions)
+        data = {
+            'error': None,
+            'q': query,
+            'description': 'Commodities matching "{}"'.format(query),
+            'data': index.search(query, n, tables),
+        }
+        data['rows'] = len(data['data'])
+        return Response(data)
+
+
+class ResultCacheStatsView(APIView):
+    """
+    Statistics of the result cache of the worker process serving the request:
+    number of entries, their size in bytes, hits, misses, hit ratio and
+    evictions.
+    """
+    def get(self, request, format=None):
+        return Response(result_cache.stats())
+
+
+class BatchView(APIView):
+    """
+    Run several API requests in one round trip. POST a JSON object like
+
+        {"concurrent": false, "requests": [
+            {"id": "stats", "endpoint": "county_stats", "params": {"county": "Linn"}},
+            {"id": "top", "endpoint": "subsidy_dollars_top_commodities"}
+        ]}
+
+    "endpoint" is one of the endpoint names of the endpoint index (the last
+    part of the "name" of the URL), "params" the query parameters, with a list
+    for repeated parameters. The response has the status and data of every
+    request, keyed by its "id" (by default its position in the list). Set
+    "concurrent" to run the requests in parallel threads.
+    """
+    def post(self, request, format=None):
+        if not isinstance(request.data, dict):
+            return error_response('Request body must be a JSON object')
+        try:
+            results = run_batch(request._request, request.data.get('requests'),
+                                concurrent=bool(request.data.get('concurrent')))
+        except BatchError as e:
+            return error_response(str(e))
+        return Response({'error': None, 'data': results})
@@ -0,0 +1,187 @@
+"""
+Warm-up requests for manage.py warm and the WSGI application load.
+
+Every endpoint of the endpoint index whose view keeps its results in the
+result cache (see api.cache) is requested in-process, once without
+parameters and once per combination of its county and year parameters: each
+county of region_lookup (of the OAIN data for production and revenue) and
+the most recent years of the dataset. The requests bring the rows they read
+into the database buffers, so the first users after a deploy don't pay for
+cold reads. They also fill the result cache of the process that runs them,
+which only helps the workers if that is the uWSGI master before it forks
+them (WARM_ON_LOAD, see cropcompass/prefork.py): manage.py warm runs in a
+process of its own, whose cache is gone when it exits. The list views, whose
+results aren't cached, are left out: reading whole tables would only push
+other rows out of the buffers.
+
+The requests are handed straight to the views, like the sub-requests of a
+batch (see api.batch), by up to "concurrency" threads with a database
+connection each. The independent queries of a view then run one after another
+in its thread (see api.execution).
+"""
+
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import product
+from django.conf import settings
+from django.test import RequestFactory
+from rest_framework.reverse import reverse
+from .cache import caches_results
+from .datasets import DATASETS
+from .execution import run_in_pool_thread
+from .models import OainProductionRevenue
+from .reference import reference_data
+from .views import ENDPOINTS
+
+try:
+    from django.urls import resolve
+except ImportError:
+    from django.core.urlresolvers import resolve
+
+DEFAULT_YEARS = 3
+DEFAULT_CONCURRENCY = 4
+
+# {<endpoint>: [(<params>, <varied params>, <dataset of the years>), ...]}
+# of the endpoints taking parameters; the others are requested without.
+# "oain_county" is a "county" parameter with the county names of the OAIN
+# data, which the production and revenue view takes as they are.
+WARM_PARAMS = {
+    'county_stats': [({}, ('year',), 'subsidy_dollars')],
+    'nass_commodity_area_table': [({}, ('county',), None)],
+    'subsidy_dollars_table': [({}, ('county',), None)],
+    'subsidy_dollars_timeline': [({}, ('county',), None)],
+    'oregon_exports_top_commodities': [({}, ('year',), 'exports_historical_cleaned')],
+    'exports_breakdown': [
+        ({'level': level}, ('year',), 'exports_historical_cleaned')
+        for level in ('hs_cat_lvl_1', 'hs_cat_lvl_2', 'commodity')
+    ],
+    'trade_totals': [
+        ({'flow': flow, 'period': period}, (), None)
+        for flow in ('export', 'import') for period in ('annual', 'monthly')
+    ],
+    'production_and_revenue': [({}, ('oain_county',), None)],
+    'timeline': [
+        ({'dataset': name}, ('county',) if 'fips' in dataset.dimensions else (), None)
+        for name, dataset in DATASETS.items()
+    ],
+    'top': [
+        ({'dataset': name, 'dimension': dimension}, ('year',), name)
+        for name, dataset in DATASETS.items()
+        for dimension in ('commodity', 'county')
+        if dimension == 'commodity' or 'fips' in dataset.dimensions
+    ],
+}
+
+
+def recent_years(dataset, count):
+    """
+    Return the list of the count most recent years of a dataset, as strings.
+    """
+    year_field = dataset.year_field
+    years = dataset.model.objects.filter(**{year_field + '__isnull': False}) \
+        .order_by('-' + year_field).values_list(year_field, flat=True).distinct()
+    return [str(year) for year in years[:count]]
+
+
+def oain_county_names():
+    """
+    Return the sorted list of the county names of the OAIN data.
+    """
+    return list(OainProductionRevenue.objects.filter(county__isnull=False)
+                .order_by('county').values_list('county', flat=True).distinct())
+
+
+def warmed_endpoints():
+    """
+    Return the names of the endpoints of the endpoint index whose views keep
+    their results in the result cache.
+    """
+    return [endpoint for title, endpoint in ENDPOINTS
+            if caches_results(resolve(reverse(endpoint)).func)]
+
+
+def warm_requests(years=DEFAULT_YEARS, counties=None, dataset_years=None,
+                  oain_counties=None):
+    """
+    Return the list of (<endpoint>, <params>) requests warming every
+    warmed_endpoints() endpoint, for the counties (default: all of
+    region_lookup), the OAIN oain_counties (default: all of
+    oain_production_revenue) and the {<dataset>: <years>} dataset_years
+    (default: the years most recent years of each dataset), queried as
+    needed.
+    """
+    if counties is None:
+        counties = sorted(reference_data().region_to_fips)
+    dataset_years = dict(dataset_years or {})
+    requests = []
+    for endpoint in warmed_endpoints():
+        for params, varied, dataset in WARM_PARAMS.get(endpoint, [({}, (), None)]):
+            if dataset is not None and dataset not in dataset_years:
+                dataset_years[dataset] = recent_years(DATASETS[dataset], years)
+            if 'oain_county' in varied and oain_counties is None:
+                oain_counties = oain_county_names()
+            values = {'county': counties, 'oain_county': oain_counties,
+                      'year': dataset_years.get(dataset, [])}
+            names = ['county' if param == 'oain_county' else param for param in varied]
+            requests.append((endpoint, params))
+            if varied:
+                for combination in product(*(values[param] for param in varied)):
+                    requests.append((endpoint, dict(params, **dict(zip(names, combination)))))
+    return requests
+
+
+def request_host():
+    """
+    Return a host name the ALLOWED_HOSTS setting accepts, for the views
+    building absolute URLs.
+    """
+    hosts = [host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*']
+    return hosts[0] if hosts else 'localhost'
+
+
+def warm_one(path, params):
+    """
+    Request path with the query params and return the (<status>, <seconds>)
+    tuple of the response, with status 500 if the view raised an exception.
+    """
+    request = RequestFactory().get(path, params, HTTP_ACCEPT='application/json',
+                                   HTTP_HOST=request_host())
+    match = resolve(path)
+    request.resolver_match = match
+    start = time.time()
+    try:
+        response = match.func(request, *match.args, **match.kwargs)
+        if response.streaming:
+            for chunk in response.streaming_content:
+                pass
+        status = response.status_code
+    except Exception:
+        status = 500
+    return (status, time.time() - start)
+
+
+def warm(years=DEFAULT_YEARS, concurrency=DEFAULT_CONCURRENCY):
+    """
+    Run every warm_requests() request and return the list of their
+    {"endpoint", "params", "status", "ms"} results, in request order.
+    """
+    requests = [(endpoint, reverse(endpoint), params)
+                for endpoint, params in warm_requests(years)]
+    functions = [partial(warm_one, path, params) for endpoint, path, params in requests]
+    if concurrency < 2:
+        outcomes = [function() for function in functions]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = [pool.submit(run_in_pool_thread, function) for function in functions]
+            outcomes = [future.result()[0] for future in futures]
+    return [
+        OrderedDict((
+            ('endpoint', endpoint),
+            ('params', params),
+            ('status', status),
+            ('ms', round(1000 * seconds, 3)),
+        ))
+        for (endpoint, path, params), (status, seconds) in zip(requests, outcomes)
+    ]
@@ -0,0 +1,4 @@
+"""
+PostgreSQL database backend keeping a pool of connections per process, set
+as ENGINE 'cropcompass.db_pool' (see base.py).
+"""
@@ -0,0 +1,173 @@
+"""
+postgresql_psycopg2 backend whose connections come from a per-process
+ConnectionPool (see pool.py) instead of being opened for every request.
+
+Closing a connection, which Django does at the end of every request, checks
+it back in to the pool. Pool settings go in the "POOL" dictionary of the
+database settings:
+
+MIN_SIZE      connections opened on first use and kept open when idle (1)
+MAX_SIZE      most connections open at once (5)
+MAX_AGE       seconds after which a connection is closed and replaced (600)
+IDLE_TIMEOUT  seconds after which idle connections beyond MIN_SIZE are
+              closed (300)
+TIMEOUT       seconds a checkout waits for a connection when MAX_SIZE are in
+              use, before failing with OperationalError (10)
+
+A process needs a connection for the request thread and one per thread of
+api.execution; the database needs MAX_SIZE times the number of processes.
+
+Connections are pooled per set of connection parameters, so a connection is
+never reused for another database. Creating and destroying the test database
+close the idle connections first, as PostgreSQL doesn't drop a database other
+sessions are connected to.
+
+The cursors count the queries of their connection for api.metrics (see
+counting.py).
+"""
+
+from functools import partial
+from django.db.backends.postgresql_psycopg2 import base, creation
+from .counting import QueryCountingMixin
+from .pool import ConnectionPool, PoolTimeout, close_pools, get_pool
+
+Database = base.Database
+
+DEFAULT_POOL = {
+    'MIN_SIZE': 1,
+    'MAX_SIZE': 5,
+    'MAX_AGE': 600,
+    'IDLE_TIMEOUT': 300,
+    'TIMEOUT': 10,
+}
+
+
+class PooledConnection(Database.extensions.connection):
+    """
+    psycopg2 connection that can hold the bookkeeping attributes of the pool.
+    """
+    pass
+
+
+def check_connection(connection):
+    """
+    Raise an exception if connection is closed or can't run a query.
+    """
+    if connection.closed:
+        raise Database.InterfaceError('connection already closed')
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+    if not connection.autocommit:
+        connection.rollback()
+
+
+def reset_connection(connection):
+    """
+    Roll back the transaction left open on a connection being checked in.
+    Return whether the connection can be reused.
+    """
+    if connection.closed:
+        return False
+    try:
+        if connection.get_transaction_status() != Database.extensions.TRANSACTION_STATUS_IDLE:
+            connection.rollback()
+    except Database.Error:
+        return False
+    return True
+
+
+# Settings identifying the database and role of a pool's connections
+POOL_KEY_SETTINGS = ('NAME', 'USER', 'PASSWORD', 'HOST', 'PORT')
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    """
+    Closes the pooled connections before switching to or from the test
+    database.
+    """
+    def create_test_db(self, *args, **kwargs):
+        self.connection.close_pool()
+        try:
+            return super(DatabaseCreation, self).create_test_db(*args, **kwargs)
+        finally:
+            self.connection.close_pool()
+
+    def destroy_test_db(self, *args, **kwargs):
+        self.connection.close()
+        self.connection.close_pool()
+        super(DatabaseCreation, self).destroy_test_db(*args, **kwargs)
+        self.connection.close_pool()
+
+
+class DatabaseWrapper(QueryCountingMixin, base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def __init__(self, *args, **kwargs):
+        super(DatabaseWrapper, self).__init__(*args, **kwargs)
+        # Django 1.9 doesn't look up creation_class
+        self.creation = DatabaseCreation(self)
+
+    def pool_key(self):
+        """
+        Return the key of the pool of the current connection parameters.
+        """
+        settings_dict = self.settings_dict
+        return (self.alias,) + tuple(settings_dict.get(name) for name in POOL_KEY_SETTINGS) + (
+            repr(sorted(settings_dict.get('OPTIONS', {}).items())),)
+
+    def create_pool(self):
+        options = dict(DEFAULT_POOL, **self.settings_dict.get('POOL', {}))
+        return ConnectionPool(
+            check=check_connection,
+            close=lambda connection: connection.close(),
+            min_size=options['MIN_SIZE'],
+            max_size=options['MAX_SIZE'],
+            max_age=options['MAX_AGE'],
+            idle_timeout=options['IDLE_TIMEOUT'],
+            timeout=options['TIMEOUT'],
+        )
+
+    @property
+    def pool(self):
+        return get_pool(self.pool_key(), self.create_pool)
+
+    def get_connection_params(self):
+        conn_params = super(DatabaseWrapper, self).get_connection_params()
+        conn_params['connection_factory'] = PooledConnection
+        return conn_params
+
+    def open_connection(self, conn_params):
+        connection = super(DatabaseWrapper, self).get_new_connection(conn_params)
+        # The isolation level is set on the wrapper when connecting; keep it
+        # for the wrappers reusing the connection
+        connection.pool_isolation_level = self.isolation_level
+        return connection
+
+    def get_new_connection(self, conn_params):
+        connect = partial(self.open_connection, conn_params)
+        try:
+            connection = self.pool.checkout(connect)
+        except PoolTimeout as e:
+            raise Database.OperationalError(str(e))
+        self.isolation_level = connection.pool_isolation_level
+        try:
+            self.pool.fill(connect)
+        except Database.Error:
+            # Counted as a failure; the checked out connection is fine
+            pass
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool.checkin(self.connection, reusable=reset_connection(self.connection))
+
+    def close_pool(self):
+        """
+        Close the idle connections of the pools of this alias in this
+        process, e.g. before forking.
+        """
+        close_pools(self.alias)
+
+    def pool_stats(self):
+        return self.pool.stats()
@@ -0,0 +1,53 @@
+"""
+Query counting for database wrappers, without Django's debug query log.
+
+QueryCountingMixin makes the cursors of a DatabaseWrapper add the number of
+queries they run and the time they take to the wrapper's query_count and
+query_seconds. Connections are per thread, so are the counters; api.metrics
+reads them around every request. No SQL is kept.
+"""
+
+import time
+from django.db.backends.utils import CursorDebugWrapper, CursorWrapper
+
+
+class CountingCursorWrapper(CursorWrapper):
+
+    def execute(self, sql, params=None):
+        start = time.time()
+        try:
+            return super(CountingCursorWrapper, self).execute(sql, params)
+        finally:
+            self.db.count_query(time.time() - start)
+
+    def executemany(self, sql, param_list):
+        start = time.time()
+        try:
+            return super(CountingCursorWrapper, self).executemany(sql, param_list)
+        finally:
+            self.db.count_query(time.time() - start)
+
+
+class CountingCursorDebugWrapper(CursorDebugWrapper, CountingCursorWrapper):
+    """
+    Debug cursor (DEBUG or force_debug_cursor), which also counts.
+    """
+    pass
+
+
+class QueryCountingMixin(object):
+    """
+    DatabaseWrapper mixin counting the queries of its cursors.
+    """
+    query_count = 0
+    query_seconds = 0.0
+
+    def count_query(self, seconds):
+        self.query_count += 1
+        self.query_seconds += seconds
+
+    def make_cursor(self, cursor):
+        return CountingCursorWrapper(cursor, self)
+
+    def make_debug_cursor(self, cursor):
+        return CountingCursorDebugWrapper(cursor, self)
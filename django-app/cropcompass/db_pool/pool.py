@@ -0,0 +1,243 @@
+"""
+Thread-safe pool of database connections, one pool per process and set of
+connection parameters of a database alias.
+
+Connections are opened on demand up to max_size; a checkout beyond that waits
+up to timeout seconds for a connection to be checked in. Checked in
+connections are kept for reuse, except those older than max_age seconds, and
+idle connections beyond min_size are closed after idle_timeout seconds.
+Every reused connection is health checked on checkout.
+
+The pool keeps its bookkeeping in attributes of the connection objects
+(pool_created, pool_last_used), which must allow them.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+
+# Names of the counters of ConnectionPool.stats()
+COUNTERS = (
+    'checkouts',
+    'waits',
+    'wait_seconds',
+    'timeouts',
+    'failures',
+    'opened',
+    'closed',
+)
+
+
+class PoolTimeout(Exception):
+    """
+    Raised when no connection is available within the timeout.
+    """
+    pass
+
+
+class ConnectionPool(object):
+    """
+    Pool of connections. check(connection) raises an exception for an unusable
+    connection; close(connection) closes a connection.
+    """
+    def __init__(self, check, close, min_size=1, max_size=5, max_age=None,
+                 idle_timeout=None, timeout=10):
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError('Pool sizes must satisfy 0 <= min_size <= max_size, 1 <= max_size')
+        self.check = check
+        self.close = close
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_age = max_age
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        # Idle connections, the most recently used last
+        self.idle = deque()
+        # Number of open connections, idle or checked out, including those
+        # being opened
+        self.size = 0
+        self.counters = dict((name, 0) for name in COUNTERS)
+        self.condition = threading.Condition()
+
+    def expired(self, connection, now):
+        return self.max_age is not None and now - connection.pool_created > self.max_age
+
+    def take_idle(self, now):
+        """
+        Return an idle connection, or None, and the list of the idle
+        connections to close: expired ones and those idle for too long beyond
+        min_size. Called with the lock held.
+        """
+        stale = []
+        if self.idle_timeout is not None:
+            while self.idle and self.size - len(stale) > self.min_size \
+                    and now - self.idle[0].pool_last_used > self.idle_timeout:
+                stale.append(self.idle.popleft())
+        while self.idle:
+            connection = self.idle.pop()
+            if not self.expired(connection, now):
+                return (connection, stale)
+            stale.append(connection)
+        return (None, stale)
+
+    def discard(self, connections):
+        """
+        Close connections and free their places in the pool.
+        """
+        for connection in connections:
+            try:
+                self.close(connection)
+            except Exception:
+                pass
+        if connections:
+            with self.condition:
+                self.size -= len(connections)
+                self.counters['closed'] += len(connections)
+                self.condition.notify(len(connections))
+
+    def open(self, connect):
+        """
+        Return a new connection, with its place already taken in the pool.
+        """
+        try:
+            connection = connect()
+        except Exception:
+            with self.condition:
+                self.size -= 1
+                self.counters['failures'] += 1
+                self.condition.notify()
+            raise
+        connection.pool_created = connection.pool_last_used = time.time()
+        with self.condition:
+            self.counters['opened'] += 1
+        return connection
+
+    def checkout(self, connect):
+        """
+        Return a healthy connection, reused or new, from connect(). Raise
+        PoolTimeout if none is available within the timeout.
+        """
+        start = time.time()
+        waited = False
+        with self.condition:
+            self.counters['checkouts'] += 1
+        while True:
+            with self.condition:
+                while True:
+                    now = time.time()
+                    connection, stale = self.take_idle(now)
+                    if connection is not None or stale or self.size < self.max_size:
+                        break
+                    remaining = start + self.timeout - now
+                    if remaining <= 0:
+                        self.counters['timeouts'] += 1
+                        raise PoolTimeout('No database connection available after {} seconds'.format(
+                            self.timeout))
+                    if not waited:
+                        waited = True
+                        self.counters['waits'] += 1
+                    self.condition.wait(remaining)
+                if connection is None and not stale:
+                    self.size += 1
+                if waited:
+                    self.counters['wait_seconds'] += time.time() - start
+                    waited = False
+            self.discard(stale)
+            if connection is None:
+                if stale:
+                    # The places of the stale connections are free again
+                    continue
+                return self.open(connect)
+            try:
+                self.check(connection)
+            except Exception:
+                with self.condition:
+                    self.counters['failures'] += 1
+                self.discard([connection])
+                continue
+            return connection
+
+    def fill(self, connect):
+        """
+        Open idle connections until the pool holds min_size connections.
+        """
+        while True:
+            with self.condition:
+                if self.size >= self.min_size:
+                    return
+                self.size += 1
+            self.checkin(self.open(connect))
+
+    def checkin(self, connection, reusable=True):
+        """
+        Return a checked out connection to the pool, or close it if it isn't
+        reusable or has expired.
+        """
+        now = time.time()
+        if not reusable or self.expired(connection, now):
+            self.discard([connection])
+            return
+        connection.pool_last_used = now
+        with self.condition:
+            self.idle.append(connection)
+            self.condition.notify()
+
+    def close_idle(self):
+        """
+        Close the idle connections.
+        """
+        with self.condition:
+            idle = list(self.idle)
+            self.idle.clear()
+        self.discard(idle)
+
+    def stats(self):
+        """
+        Return a dictionary of the pool sizes and counters.
+        """
+        with self.condition:
+            stats = dict(self.counters)
+            stats.update({
+                'size': self.size,
+                'idle': len(self.idle),
+                'in_use': self.size - len(self.idle),
+                'max_size': self.max_size,
+            })
+        return stats
+
+
+# {<key>: (<pid>, <pool>)}, the key starting with the database alias
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(key, create):
+    """
+    Return the pool of key, a tuple of the database alias and the
+    connection parameters, in this process, created by create() on first
+    use. Connections are only reused for the same parameters: a wrapper
+    whose database NAME changes (e.g. to the test database) gets another
+    pool. A forked process doesn't use the pools of its parent, whose
+    connections it must not share.
+    """
+    pid = os.getpid()
+    with _pools_lock:
+        pool_pid, pool = _pools.get(key, (None, None))
+        if pool_pid != pid:
+            pool = create()
+            _pools[key] = (pid, pool)
+        return pool
+
+
+def close_pools(alias):
+    """
+    Close the idle connections of every pool of the database alias in this
+    process.
+    """
+    pid = os.getpid()
+    with _pools_lock:
+        pools = [pool for key, (pool_pid, pool) in _pools.items()
+                 if key[0] == alias and pool_pid == pid]
+    for pool in pools:
+        pool.close_idle()
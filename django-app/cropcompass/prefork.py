@@ -0,0 +1,101 @@
+"""
+Pre-fork WSGI bootstrap of the cropcompass project.
+
+uWSGI loads the application once in the master and forks the workers from it
+(without lazy-apps, see scripts/cropcompass.ini). This module loads as much
+as possible before that fork, so that the workers share it copy-on-write
+instead of each building their own copy: Django, DRF, the admin and every
+view through the URL configuration, the reference data, the commodity search
+index, the column store (if COLUMN_STORE) and the result cache (if
+WARM_ON_LOAD, see api.warm).
+
+The garbage collector is then frozen: the objects loaded so far move to a
+permanent generation the collections of the workers never visit, so
+collections don't write to, and copy, the pages holding them. gc.freeze()
+only exists from Python 3.7 on; on older Pythons (the 3.4 of the provisioned
+box) the collections of every worker touch, and gradually copy, the loaded
+objects, and only the pages nothing writes to stay shared.
+
+The load time and the number of frozen objects are logged, and exported with
+the memory of every worker at /metrics/ (see api.process).
+"""
+
+import time
+
+STARTED = time.time()
+
+import gc  # noqa: E402
+import sys  # noqa: E402
+
+from .wsgi import application  # noqa: E402,F401
+from django.conf import settings  # noqa: E402
+from django.db import DatabaseError  # noqa: E402
+from api.process import record_startup  # noqa: E402
+
+try:
+    from django.urls import get_resolver
+except ImportError:
+    from django.core.urlresolvers import get_resolver
+
+
+def load_urls():
+    """
+    Import the URL configuration, and with it every view.
+    """
+    get_resolver().url_patterns
+
+
+def load_data():
+    """
+    Load the reference data and the enabled in-memory datasets, then close
+    the database connections so that the workers don't share them. What
+    can't be loaded, e.g. because the database isn't reachable yet or a
+    table is missing, is loaded on first use instead.
+    """
+    if not getattr(settings, 'PRELOAD_REFERENCE_DATA', False):
+        return
+    from api import columnstore
+    from api.commodities import commodity_index
+    from api.reference import close_connections, reload_reference_data
+    loaders = [
+        ('reference data', reload_reference_data),
+        ('commodity index', commodity_index.preload),
+    ]
+    if columnstore.enabled():
+        loaders.append(('column store', columnstore.column_store.preload))
+    if getattr(settings, 'WARM_ON_LOAD', False):
+        from api.warm import warm
+        loaders.append(('result cache', warm))
+    try:
+        for name, loader in loaders:
+            try:
+                loader()
+            except DatabaseError as e:
+                sys.stderr.write('cropcompass: {} not preloaded: {}\n'.format(name, e))
+    finally:
+        close_connections()
+
+
+def freeze():
+    """
+    Collect the garbage and freeze the remaining objects. Return the number
+    of frozen objects, or None where gc.freeze() isn't available.
+    """
+    gc.collect()
+    if not hasattr(gc, 'freeze'):
+        return None
+    gc.freeze()
+    return gc.get_freeze_count()
+
+
+def bootstrap():
+    load_urls()
+    load_data()
+    frozen = freeze()
+    seconds = time.time() - STARTED
+    record_startup(seconds, frozen)
+    sys.stderr.write('cropcompass: application loaded in {:.2f} s, {} objects frozen\n'.format(
+        seconds, frozen if frozen is not None else 'no'))
+
+
+bootstrap()
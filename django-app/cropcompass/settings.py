@@ -31,17 +31,64 @@ ALLOWED_HOSTS = []
 # Database
 # https://docs.djangoproject.com/en/1.9/ref/settings/#databases
 
+# CROPCOMPASS_DB_NAME selects another database, e.g. a scratch database for
+# manage.py bench.
+#
+# The cropcompass.db_pool backend is postgresql_psycopg2 with a pool of
+# connections per process (see cropcompass/db_pool/base.py). MAX_SIZE covers
+# the request thread plus QUERY_MAX_WORKERS; PostgreSQL's max_connections
+# must allow MAX_SIZE times the number of uWSGI processes.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql_psycopg2',
-        'NAME': 'vagrant',
+        'ENGINE': 'cropcompass.db_pool',
+        'NAME': os.environ.get('CROPCOMPASS_DB_NAME', 'vagrant'),
         'USER': 'vagrant',
         'PASSWORD': '',
         'HOST': '',
-        'PORT': ''
+        'PORT': '',
+        'POOL': {
+            'MIN_SIZE': 1,
+            'MAX_SIZE': 5,
+            'MAX_AGE': 600,
+            'IDLE_TIMEOUT': 300,
+            'TIMEOUT': 10,
+        },
     }
 }
 
+# Load the reference data tables (metadata, region lookup, crop diversity)
+# when the WSGI application is loaded, before the workers are forked (see
+# cropcompass/prefork.py). The workers share the loaded data copy-on-write;
+# on Python before 3.7, which can't freeze the garbage collector, only until
+# their collections have copied it.
+PRELOAD_REFERENCE_DATA = True
+
+# Size limit of the in-process result cache of the aggregate views, per
+# worker process (see api/cache.py)
+RESULT_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+# Largest number of requests in a /batch/ request (see api/batch.py)
+BATCH_MAX_REQUESTS = 50
+
+# Number of threads per process running independent queries of a request
+# concurrently, each with its own database connection; below 2 runs them one
+# after another (see api/execution.py)
+QUERY_MAX_WORKERS = 4
+
+# Serve the table views of the county datasets from an in-process NumPy copy
+# of the tables, loaded before the workers are forked and reloaded when a
+# dataset version changes (see api/columnstore.py). Off until its results have
+# been checked against the database queries on the production data.
+COLUMN_STORE = False
+
+# Request every cached endpoint when the WSGI application is loaded, before
+# the workers are forked, so that they start with a filled result cache (see
+# api/warm.py and cropcompass/prefork.py). Off: it delays every start and
+# reload of uWSGI by the time the warm-up takes. The deploy script runs
+# manage.py warm once the workers are up instead, which only warms the
+# database buffers.
+WARM_ON_LOAD = False
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -62,11 +109,13 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 10,
     'DEFAULT_RENDERER_CLASSES': (
         'rest_framework.renderers.JSONRenderer',
+        'api.columnar.ColumnarJSONRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer',
     )
 }
 
 MIDDLEWARE_CLASSES = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -15,6 +15,7 @@ Including another URLconf
 """
 from django.conf.urls import url, include
 from api import views
+from api.metrics import metrics_view
 from django.contrib import admin
 
 # Additionally, we include login URLs for the browsable API.
@@ -37,7 +38,19 @@ urlpatterns = [
     url(r'^table/subsidy_dollars_top5crops/$', views.SubsidyDollarsTopFiveCommodities.as_view(), name='subsidy_dollars_top_commodities'),
     url(r'^data/crop_diversity/$', views.CropDiversityList.as_view(), name='crop_diversity_data'),
     url(r'^table/oregon_exports_timeline/$', views.OregonExportsTimeline.as_view(), name='oregon_exports_timeline'),
+    url(r'^table/timeline/$', views.TimelineView.as_view(), name='timeline'),
     url(r'^table/oregon_export_commodities/$', views.OregonExportCommodities.as_view(), name='oregon_export_commodities'),
     url(r'^table/oregon_exports_top5crops/$', views.ExportsTopFiveCommodities.as_view(), name='oregon_exports_top_commodities'),
+    url(r'^table/exports_seasonality/$', views.ExportsSeasonality.as_view(), name='exports_seasonality'),
+    url(r'^table/exports_breakdown/$', views.ExportsBreakdown.as_view(), name='exports_breakdown'),
+    url(r'^table/exports_by_country/$', views.ExportsByCountry.as_view(), name='exports_by_country'),
+    url(r'^table/imports_by_country/$', views.ImportsByCountry.as_view(), name='imports_by_country'),
+    url(r'^table/imports_historical/$', views.ImportsHistorical.as_view(), name='imports_historical'),
+    url(r'^table/trade_totals/$', views.TradeTotalsTimeline.as_view(), name='trade_totals'),
+    url(r'^table/top/$', views.TopView.as_view(), name='top'),
     url(r'^table/production_and_revenue/$', views.ProductionAndRevenue.as_view(), name='production_and_revenue'),
+    url(r'^commodities/search/$', views.CommoditySearch.as_view(), name='commodity_search'),
+    url(r'^batch/$', views.BatchView.as_view(), name='batch'),
+    url(r'^stats/result_cache/$', views.ResultCacheStatsView.as_view(), name='result_cache_stats'),
+    url(r'^metrics/$', metrics_view, name='metrics'),
 ]
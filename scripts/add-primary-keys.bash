@@ -24,5 +24,11 @@ do
 done
 psql -c '\d+' > ~vagrant/logs/tables-keyed
 
+echo `date` "Bumping the version of all tables, rebuilding the derived tables"
+pushd ~vagrant/cropcompass
+source ~vagrant/Env/cropcompass/bin/activate
+python3 manage.py bump_dataset_version --all --rebuild
+popd
+
 echo `date` "starting app server"
 sudo service uwsgi start
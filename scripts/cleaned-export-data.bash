@@ -17,6 +17,12 @@ curl -Ls \
 echo `date` "Logging table details to ~vagrant/logs/tables-cleaned"
 psql -c '\d+' > ~vagrant/logs/tables-cleaned
 
+echo `date` "Bumping the version of exports_historical_cleaned, rebuilding exports_rollup"
+pushd ~vagrant/cropcompass
+source ~vagrant/Env/cropcompass/bin/activate
+python3 manage.py bump_dataset_version --rebuild exports_historical_cleaned
+popd
+
 echo `date` "starting app server"
 sudo service uwsgi start
 
@@ -13,6 +13,10 @@ cp -rp /vagrant/django-app ~vagrant/cropcompass
 pushd ~/cropcompass
 echo `date` "Running migrations"
 python3 manage.py migrate > ~/logs/migrate 2>&1
+echo `date` "Building derived tables"
+python3 manage.py build_production_revenue > ~/logs/derived 2>&1
+python3 manage.py build_exports_rollup >> ~/logs/derived 2>&1
+python3 manage.py convert_trade_tables >> ~/logs/derived 2>&1
 echo `date` "Collecting static assets"
 python3 manage.py collectstatic --noinput > ~/logs/static 2>&1
 popd
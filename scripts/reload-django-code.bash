@@ -16,5 +16,15 @@ cd ~vagrant/cropcompass
 source ~vagrant/Env/cropcompass/bin/activate
 python3 manage.py migrate
 
+echo `date` "building derived tables"
+python3 manage.py build_production_revenue
+python3 manage.py build_exports_rollup
+python3 manage.py convert_trade_tables
+
 echo `date` "starting app server"
 sudo service uwsgi start
+
+# After the start, so the warm-up doesn't add to the downtime: it fills the
+# database buffers, not the workers' result caches (see WARM_ON_LOAD)
+echo `date` "warming the database buffers"
+python3 manage.py warm --verbosity 0